@@ -5,6 +5,9 @@ from app.utils import normalize_date
 # Regex to detect date formats like "١٩٤٩/٨/١" or Western "1949/08/01"
 DATE_PATTERN = re.compile(r"\d{4}[/\-\.]\d{1,2}[/\-\.]\d{1,2}")
 
+# Categories treated as another category when aggregating
+CATEGORY_REMAP = {"List-item": "Text"}
+
 def is_date_block(block: Dict[str, Any]) -> bool:
     """
     Check if a block is likely a date.
@@ -13,24 +16,34 @@ def is_date_block(block: Dict[str, Any]) -> bool:
     return bool(DATE_PATTERN.search(text))
 
 
-def aggregate_blocks(ocr_output: List[Dict[str, Any]]) -> List[Dict[str, str]]:
+def aggregate_blocks(ocr_output: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
     """
-    Aggregate OCR blocks into {date, text}.
+    Aggregate OCR blocks into {date, text, page, ordinal}.
     Rules:
       - Each date starts a new event.
       - Text collected until next date.
       - No carryover between events.
+      - Categories are remapped with CATEGORY_REMAP first.
+    page is the page of the event's date block and ordinal its position
+    among the events starting on that page: with source_pdf they identify
+    an event across reruns.
     """
     events = []
     current_date = None
+    current_page = None
     buffer: List[str] = []
+    per_page: Dict[Any, int] = {}
 
     def flush():
         nonlocal buffer, current_date
         if current_date and buffer:
+            ordinal = per_page.get(current_page, 0)
+            per_page[current_page] = ordinal + 1
             events.append({
                 "date": normalize_date(current_date),   # <-- normalize here
-                "text": "\n".join(buffer).strip()
+                "text": "\n".join(buffer).strip(),
+                "page": current_page,
+                "ordinal": ordinal,
             })
             buffer = []
 
@@ -38,9 +51,11 @@ def aggregate_blocks(ocr_output: List[Dict[str, Any]]) -> List[Dict[str, str]]:
         if is_date_block(block):
             flush()
             current_date = block["text"].strip()
+            current_page = block.get("page")
         else:
-            if block["category"] == "Text":
+            category = CATEGORY_REMAP.get(block.get("category"), block.get("category"))
+            if category == "Text":
                 buffer.append(block["text"].strip())
 
     flush()
-    return events
\ No newline at end of file
+    return events
@@ -1,20 +1,112 @@
+import asyncio
+import hashlib
+import os
 import sqlite3
+import threading
+import time
+import uuid
+import zlib
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 import json
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Callable, Iterable, Iterator, Optional, Tuple
+
+try:  # zstd is optional: without it raw blocks are stored with zlib
+    import zstandard
+except ImportError:
+    zstandard = None
+
+from app.metrics import DB_WRITE_SECONDS
 
 DB_PATH = Path("data/sqlite.db")
 
+# Queries from the web UI run on this many threads (see run_db)
+DB_THREADS = 4
+# Seconds a connection waits on another process's write lock (ETL workers share the file)
+DB_TIMEOUT = 30.0
+# WAL needs shared memory between processes: use DB_JOURNAL_MODE=DELETE when
+# workers on several hosts share the database file over a network filesystem
+DB_JOURNAL_MODE = os.environ.get("DB_JOURNAL_MODE", "WAL")
+
+_db_executor = ThreadPoolExecutor(max_workers=DB_THREADS, thread_name_prefix="db")
+_readers = threading.local()
+_prepared = set()
+_prepare_lock = threading.Lock()
+
 
 def get_connection():
-    conn = sqlite3.connect(DB_PATH)
+    conn = sqlite3.connect(DB_PATH, timeout=DB_TIMEOUT)
     conn.row_factory = sqlite3.Row
     return conn
 
 
-def insert_raw_result(pdf_path: str, slice_idx: int, result_json: str):
-    conn = get_connection()
-    cur = conn.cursor()
+def prepare_db():
+    """
+    Create the tables and switch the database to WAL (DB_JOURNAL_MODE),
+    once per process, so readers never block on (or block) the ETL's writes.
+    """
+    with _prepare_lock:
+        if str(DB_PATH) in _prepared:
+            return
+        Path(DB_PATH).parent.mkdir(parents=True, exist_ok=True)
+        conn = get_connection()
+        try:
+            conn.execute(f"PRAGMA journal_mode={DB_JOURNAL_MODE}")
+            ensure_tables(conn.cursor())
+            conn.commit()
+        finally:
+            conn.close()
+        _prepared.add(str(DB_PATH))
+
+
+def get_read_connection():
+    """
+    Read-only connection, reused per thread (one per DB_THREADS worker).
+    """
+    prepare_db()
+    conns = getattr(_readers, "conns", None)
+    if conns is None:
+        conns = _readers.conns = {}
+    conn = conns.get(str(DB_PATH))
+    if conn is None:
+        conn = sqlite3.connect(f"{Path(DB_PATH).resolve().as_uri()}?mode=ro", uri=True)
+        conn.row_factory = sqlite3.Row
+        conns[str(DB_PATH)] = conn
+    return conn
+
+
+async def run_db(fn: Callable, *args, **kwargs):
+    """
+    Run a blocking app.db function on the DB thread pool so async
+    handlers do not stall the event loop.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_db_executor, lambda: fn(*args, **kwargs))
+
+
+EVENTS_SCHEMA = """(
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            date TEXT,
+            text TEXT,
+            source_pdf TEXT,
+            slice_idx INTEGER
+        )"""
+
+# Added to events after the first release: an event's identity across reruns
+# is its content_hash on a page, else (source_pdf, page, ordinal); content_hash
+# detects changed OCR text, edited marks manual corrections and deleted is a
+# tombstone.
+EVENT_COLUMNS = {
+    "page": "INTEGER",
+    "ordinal": "INTEGER",
+    "content_hash": "TEXT",
+    "edited": "INTEGER NOT NULL DEFAULT 0",
+    "deleted": "INTEGER NOT NULL DEFAULT 0",
+}
+
+
+def ensure_tables(cur):
     cur.execute("""
         CREATE TABLE IF NOT EXISTS ocr_results (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -23,42 +115,284 @@ def insert_raw_result(pdf_path: str, slice_idx: int, result_json: str):
             result_json TEXT
         )
     """)
+    cur.execute(f"CREATE TABLE IF NOT EXISTS events {EVENTS_SCHEMA}")
+    existing = {row[1] for row in cur.execute("PRAGMA table_info(events)")}
+    for column, decl in EVENT_COLUMNS.items():
+        if column not in existing:
+            cur.execute(f"ALTER TABLE events ADD COLUMN {column} {decl}")
+    cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS events_identity ON events (source_pdf, page, ordinal)")
+    cur.execute("CREATE INDEX IF NOT EXISTS events_date ON events (date, id)")
+    # raw OCR output, one compressed JSON blob per (book, page, half)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS ocr_blocks (
+            pdf_path TEXT NOT NULL,
+            page INTEGER NOT NULL,
+            half INTEGER NOT NULL,
+            codec TEXT NOT NULL,
+            blocks BLOB NOT NULL,
+            PRIMARY KEY (pdf_path, page, half)
+        ) WITHOUT ROWID
+    """)
+    # bumped by every events write, in any process: lets the UI cache results
+    cur.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+    cur.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('events_version', 0)")
+    # (book, page, half) work units leased to distributed ETL workers (app.worker)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS work_units (
+            pdf_path TEXT NOT NULL,
+            page INTEGER NOT NULL,
+            half INTEGER NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            worker TEXT,
+            lease_token TEXT,
+            lease_until REAL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            outcome TEXT,
+            error TEXT,
+            PRIMARY KEY (pdf_path, page, half)
+        ) WITHOUT ROWID
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS work_units_status ON work_units (status, lease_until)")
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS work_books (
+            pdf_path TEXT PRIMARY KEY,
+            status TEXT NOT NULL DEFAULT 'open',
+            options TEXT
+        )
+    """)
+    # perceptual hash per rendered half; source is set on halves whose blocks
+    # were reused from that near-duplicate ("pdf_path:page:half") instead of OCR
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS page_hashes (
+            pdf_path TEXT NOT NULL,
+            page INTEGER NOT NULL,
+            half INTEGER NOT NULL,
+            phash TEXT NOT NULL,
+            width INTEGER NOT NULL,
+            height INTEGER NOT NULL,
+            source TEXT,
+            PRIMARY KEY (pdf_path, page, half)
+        ) WITHOUT ROWID
+    """)
+    # multi-index Hamming lookup: the hash split into bands, each indexed for exact match
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS page_hash_bands (
+            band INTEGER NOT NULL,
+            value INTEGER NOT NULL,
+            pdf_path TEXT NOT NULL,
+            page INTEGER NOT NULL,
+            half INTEGER NOT NULL,
+            PRIMARY KEY (band, value, pdf_path, page, half)
+        ) WITHOUT ROWID
+    """)
+    # live event counts per (book, granularity, bucket), kept in step by the events write paths
+    cur.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='timeline'")
+    if cur.fetchone() is None:
+        cur.execute("""
+            CREATE TABLE timeline (
+                source_pdf TEXT NOT NULL,
+                granularity TEXT NOT NULL,
+                bucket TEXT NOT NULL,
+                count INTEGER NOT NULL,
+                PRIMARY KEY (granularity, bucket, source_pdf)
+            ) WITHOUT ROWID
+        """)
+        rebuild_timeline(cur)
+
+
+def bump_events_version(cur):
+    cur.execute("UPDATE meta SET value = value + 1 WHERE key='events_version'")
+
+
+# -----------------
+# TIMELINE ROLLUPS
+# -----------------
+
+# Bucket = prefix of the normalized YYYY/MM/DD date
+TIMELINE_GRANULARITIES = {"year": 4, "month": 7, "day": 10}
+
+
+def timeline_deltas(deltas: Counter, source_pdf: str, date: Optional[str], delta: int):
+    """
+    Add one live event's contribution (+1 or -1) to every granularity.
+    """
+    if not date:
+        return
+    for granularity, width in TIMELINE_GRANULARITIES.items():
+        deltas[(source_pdf, granularity, date[:width])] += delta
+
+
+def apply_timeline(cur, deltas: Counter):
+    changes = [(book, g, bucket, d) for (book, g, bucket), d in deltas.items() if d]
+    if not changes:
+        return
+    cur.executemany(
+        "INSERT INTO timeline (source_pdf, granularity, bucket, count) VALUES (?, ?, ?, ?) "
+        "ON CONFLICT (granularity, bucket, source_pdf) DO UPDATE SET count = count + excluded.count",
+        changes
+    )
+    cur.execute("DELETE FROM timeline WHERE count <= 0")
+
+
+def rebuild_timeline(cur):
+    """
+    Recompute the rollups from events (once, when the table is created).
+    """
+    cur.execute("DELETE FROM timeline")
+    for granularity, width in TIMELINE_GRANULARITIES.items():
+        cur.execute(
+            "INSERT INTO timeline (source_pdf, granularity, bucket, count) "
+            "SELECT source_pdf, ?, substr(date, 1, ?), COUNT(*) FROM events "
+            "WHERE deleted=0 AND date IS NOT NULL AND source_pdf IS NOT NULL "
+            "GROUP BY source_pdf, substr(date, 1, ?)",
+            (granularity, width, width)
+        )
+
+
+# -----------------
+# RAW BLOCK STORAGE
+# -----------------
+
+RAW_CODEC = "zstd" if zstandard is not None else "zlib"
+ZSTD_LEVEL = 9
+ZLIB_LEVEL = 6
+
+
+def encode_blocks(blocks: List[Dict[str, Any]], codec: str = RAW_CODEC) -> bytes:
+    data = json.dumps(blocks, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    if codec == "zstd":
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    if codec == "zlib":
+        return zlib.compress(data, ZLIB_LEVEL)
+    raise ValueError(f"unknown codec {codec!r}")
+
+
+def decode_blocks(codec: str, blob: bytes) -> List[Dict[str, Any]]:
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("raw blocks were stored with zstd: pip install zstandard")
+        data = zstandard.ZstdDecompressor().decompress(blob)
+    elif codec == "zlib":
+        data = zlib.decompress(blob)
+    else:
+        raise ValueError(f"unknown codec {codec!r}")
+    return json.loads(data)
+
+
+@DB_WRITE_SECONDS.labels(op="insert_half_blocks").time()
+def insert_half_blocks(pdf_path: str, page: int, half: int, blocks: List[Dict[str, Any]]):
+    """
+    Store (or replace, on a rerun) the OCR blocks of one half page.
+    """
+    conn = get_connection()
+    try:
+        cur = conn.cursor()
+        ensure_tables(cur)
+        write_half_blocks(cur, pdf_path, page, half, blocks)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def write_half_blocks(cur, pdf_path: str, page: int, half: int, blocks: List[Dict[str, Any]]):
     cur.execute(
-        "INSERT INTO ocr_results (pdf_path, slice_idx, result_json) VALUES (?, ?, ?)",
-        (pdf_path, slice_idx, result_json)
+        "INSERT OR REPLACE INTO ocr_blocks (pdf_path, page, half, codec, blocks) VALUES (?, ?, ?, ?, ?)",
+        (pdf_path, page, half, RAW_CODEC, encode_blocks(blocks))
     )
-    conn.commit()
-    conn.close()
 
 
-def insert_event(date: str, text: str, source_pdf: str, slice_idx: int):
+def get_page_blocks(pdf_path: str, page: int) -> List[Dict[str, Any]]:
+    """
+    Blocks of one page (right half first), read straight from the primary key.
+    """
+    conn = get_connection()
+    try:
+        cur = conn.cursor()
+        ensure_tables(cur)
+        cur.execute(
+            "SELECT codec, blocks FROM ocr_blocks WHERE pdf_path=? AND page=? ORDER BY half",
+            (pdf_path, page)
+        )
+        blocks = [b for codec, blob in cur.fetchall() for b in decode_blocks(codec, blob)]
+    finally:
+        conn.close()
+    return blocks
+
+
+def get_half_blocks(pdf_path: str, page: int, half: int) -> Optional[List[Dict[str, Any]]]:
+    """
+    Blocks of one half page, or None if it has none stored.
+    """
+    conn = get_connection()
+    try:
+        cur = conn.cursor()
+        ensure_tables(cur)
+        cur.execute("SELECT codec, blocks FROM ocr_blocks WHERE pdf_path=? AND page=? AND half=?", (pdf_path, page, half))
+        row = cur.fetchone()
+    finally:
+        conn.close()
+    return decode_blocks(row[0], row[1]) if row else None
+
+
+def iter_book_blocks(pdf_path: str) -> Iterator[Tuple[int, int, List[Dict[str, Any]]]]:
+    """
+    Yield (page, half, blocks) for a book in page order, one half decoded at a time.
+    """
     conn = get_connection()
     cur = conn.cursor()
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS events (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            date TEXT,
-            text TEXT,
-            source_pdf TEXT,
-            slice_idx INTEGER
+    ensure_tables(cur)
+    try:
+        for page, half, codec, blob in cur.execute(
+            "SELECT page, half, codec, blocks FROM ocr_blocks WHERE pdf_path=? ORDER BY page, half",
+            (pdf_path,)
+        ):
+            yield page, half, decode_blocks(codec, blob)
+    finally:
+        conn.close()
+
+
+@DB_WRITE_SECONDS.labels(op="insert_raw_result").time()
+def insert_raw_result(pdf_path: str, slice_idx: int, result_json: str):
+    conn = get_connection()
+    try:
+        cur = conn.cursor()
+        ensure_tables(cur)
+        cur.execute(
+            "INSERT INTO ocr_results (pdf_path, slice_idx, result_json) VALUES (?, ?, ?)",
+            (pdf_path, slice_idx, result_json)
         )
-    """)
-    cur.execute(
-        "INSERT INTO events (date, text, source_pdf, slice_idx) VALUES (?, ?, ?, ?)",
-        (date, text, source_pdf, slice_idx)
-    )
-    conn.commit()
-    conn.close()
+        conn.commit()
+    finally:
+        conn.close()
+
+
+@DB_WRITE_SECONDS.labels(op="insert_event").time()
+def insert_event(date: str, text: str, source_pdf: str, slice_idx: int):
+    conn = get_connection()
+    try:
+        cur = conn.cursor()
+        ensure_tables(cur)
+        cur.execute(
+            "INSERT INTO events (date, text, source_pdf, slice_idx) VALUES (?, ?, ?, ?)",
+            (date, text, source_pdf, slice_idx)
+        )
+        deltas = Counter()
+        timeline_deltas(deltas, source_pdf, date, 1)
+        apply_timeline(cur, deltas)
+        bump_events_version(cur)
+        conn.commit()
+    finally:
+        conn.close()
 
 # -----------------
 # QUERY FUNCTIONS
 # -----------------
 
 def get_events(from_date: Optional[str] = None, to_date: Optional[str] = None) -> List[Dict[str, Any]]:
-    conn = get_connection()
+    conn = get_read_connection()
     cur = conn.cursor()
 
-    query = "SELECT id, date, text, source_pdf, slice_idx FROM events WHERE 1=1"
+    query = "SELECT id, date, text, source_pdf, slice_idx FROM events WHERE deleted=0"
     params = []
 
     if from_date:
@@ -71,34 +405,647 @@ def get_events(from_date: Optional[str] = None, to_date: Optional[str] = None) -
 
     cur.execute(query, params)
     rows = cur.fetchall()
-    conn.close()
 
     return [dict(row) for row in rows]
 
 
+# Columns /api/events may return
+EVENT_FIELDS = ("id", "date", "text", "source_pdf", "slice_idx", "page")
+
+
+def get_events_page(
+    from_date: Optional[str] = None,
+    to_date: Optional[str] = None,
+    after: Optional[Tuple[str, int]] = None,
+    limit: int = 50,
+    fields: Iterable[str] = EVENT_FIELDS,
+) -> List[Dict[str, Any]]:
+    """
+    One page of events ordered by (date, id), starting after the (date, id)
+    of the previous page's last row (keyset pagination: the cost of a page
+    does not grow with how deep into the results it is).
+    id and date are always returned, they make the next cursor.
+    """
+    columns = ["id", "date"] + [f for f in fields if f in EVENT_FIELDS and f not in ("id", "date")]
+    query = f"SELECT {', '.join(columns)} FROM events WHERE deleted=0"
+    params: List[Any] = []
+
+    if from_date:
+        query += " AND date >= ?"
+        params.append(from_date)
+
+    if to_date:
+        query += " AND date <= ?"
+        params.append(to_date)
+
+    if after:
+        query += " AND (date > ? OR (date = ? AND id > ?))"
+        params.extend([after[0], after[0], after[1]])
+
+    query += " ORDER BY date, id LIMIT ?"
+    params.append(limit)
+
+    conn = get_read_connection()
+    return [dict(row) for row in conn.execute(query, params)]
+
+
+def iter_events(
+    from_date: Optional[str] = None,
+    to_date: Optional[str] = None,
+    fields: Iterable[str] = EVENT_FIELDS,
+    chunk_size: int = 5000,
+) -> Iterator[List[sqlite3.Row]]:
+    """
+    Stream matching events in (date, id) order as chunks of rows from a
+    server-side cursor, so memory stays flat however many rows match.
+    The connection belongs to this generator alone; it may be advanced
+    from different threads (one chunk at a time), hence check_same_thread=False.
+    """
+    columns = [f for f in fields if f in EVENT_FIELDS]
+    query = f"SELECT {', '.join(columns)} FROM events WHERE deleted=0"
+    params: List[Any] = []
+
+    if from_date:
+        query += " AND date >= ?"
+        params.append(from_date)
+
+    if to_date:
+        query += " AND date <= ?"
+        params.append(to_date)
+
+    query += " ORDER BY date, id"
+
+    prepare_db()
+    conn = sqlite3.connect(f"{Path(DB_PATH).resolve().as_uri()}?mode=ro", uri=True, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    try:
+        cur = conn.execute(query, params)
+        while True:
+            rows = cur.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield rows
+    finally:
+        conn.close()
+
+
 def get_event_by_id(event_id: int) -> Optional[Dict[str, Any]]:
-    conn = get_connection()
+    conn = get_read_connection()
     cur = conn.cursor()
     cur.execute("SELECT id, date, text, source_pdf, slice_idx FROM events WHERE id=?", (event_id,))
     row = cur.fetchone()
-    conn.close()
     return dict(row) if row else None
 
 
-def update_event(event_id: int, new_text: str):
+def get_timeline(
+    granularity: str = "year",
+    from_date: Optional[str] = None,
+    to_date: Optional[str] = None,
+    source_pdf: Optional[str] = None,
+    by_book: bool = False,
+) -> List[Dict[str, Any]]:
+    """
+    Event counts per bucket from the rollup table: O(buckets), not O(events).
+    from_date/to_date select the buckets they fall in.
+    """
+    width = TIMELINE_GRANULARITIES[granularity]
+    columns = "bucket, source_pdf, count" if by_book else "bucket, SUM(count) AS count"
+    query = f"SELECT {columns} FROM timeline WHERE granularity=?"
+    params: List[Any] = [granularity]
+
+    if from_date:
+        query += " AND bucket >= ?"
+        params.append(from_date[:width])
+
+    if to_date:
+        query += " AND bucket <= ?"
+        params.append(to_date[:width])
+
+    if source_pdf:
+        query += " AND source_pdf = ?"
+        params.append(source_pdf)
+
+    query += " ORDER BY bucket, source_pdf" if by_book else " GROUP BY bucket ORDER BY bucket"
+
+    conn = get_read_connection()
+    return [dict(row) for row in conn.execute(query, params)]
+
+
+def get_events_version() -> int:
+    """
+    Changes whenever events are written, by this process or another one.
+    """
+    conn = get_read_connection()
+    row = conn.execute("SELECT value FROM meta WHERE key='events_version'").fetchone()
+    return row[0] if row else 0
+
+
+@DB_WRITE_SECONDS.labels(op="update_event").time()
+def update_event(event_id: int, new_text: str) -> bool:
     """
     Allow manual correction of OCR text.
+    Edited events are never overwritten or tombstoned by a reload.
+    Unknown and tombstoned ids are ignored; returns whether an event changed.
     """
     conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("UPDATE events SET text=? WHERE id=?", (new_text, event_id))
-    conn.commit()
-    conn.close()
+    try:
+        cur = conn.cursor()
+        ensure_tables(cur)
+        cur.execute("UPDATE events SET text=?, edited=1 WHERE id=? AND deleted=0", (new_text, event_id))
+        changed = cur.rowcount > 0
+        if changed:  # an unknown or tombstoned id changes nothing readers could have cached
+            bump_events_version(cur)
+        conn.commit()
+    finally:
+        conn.close()
+    return changed
     
+@DB_WRITE_SECONDS.labels(op="clear_previous_results").time()
 def clear_previous_results(pdf_path: str):
+    """
+    Drop a book's raw OCR output before a fresh run.
+    Events are kept: the next load diffs against them (see upsert_events).
+    """
     conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("DELETE FROM ocr_results WHERE pdf_path=?", (pdf_path,))
-    cur.execute("DELETE FROM events WHERE source_pdf=?", (pdf_path,))
-    conn.commit()
-    conn.close()
\ No newline at end of file
+    try:
+        cur = conn.cursor()
+        ensure_tables(cur)
+        cur.execute("DELETE FROM ocr_results WHERE pdf_path=?", (pdf_path,))
+        cur.execute("DELETE FROM ocr_blocks WHERE pdf_path=?", (pdf_path,))
+        cur.execute("DELETE FROM page_hashes WHERE pdf_path=?", (pdf_path,))
+        cur.execute("DELETE FROM page_hash_bands WHERE pdf_path=?", (pdf_path,))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+# -----------------
+# INCREMENTAL LOAD
+# -----------------
+
+def event_hash(date: str, text: str) -> str:
+    return hashlib.sha1(f"{date}\n{text}".encode("utf-8")).hexdigest()[:16]
+
+
+def _upsert_book(cur, source_pdf: str, events: List[Dict[str, Any]], pages: Optional[Iterable[int]] = None) -> Dict[str, int]:
+    counts = dict.fromkeys(("inserted", "updated", "restored", "tombstoned", "unchanged", "edited"), 0)
+    cur.execute(
+        "SELECT id, date, page, ordinal, content_hash, edited, deleted FROM events WHERE source_pdf=?",
+        (source_pdf,)
+    )
+    rows = cur.fetchall()
+    identified = [r for r in rows if r["page"] is not None]
+    # rows loaded before events had an identity cannot be matched: retire them
+    legacy = [r for r in rows if r["page"] is None and not r["deleted"]]
+    at = {(r["page"], r["ordinal"]): r for r in identified}
+    same = defaultdict(list)
+    for r in sorted(identified, key=lambda r: r["ordinal"]):
+        same[(r["page"], r["content_hash"])].append(r)
+    hashes = [event_hash(e["date"], e["text"]) for e in events]
+    matched: Dict[int, Any] = {}
+    used = set()
+
+    # same content on the same page first: an event inserted above shifts the
+    # ordinals below it, and an edited row must keep the text it was made from
+    for i, (e, h) in enumerate(zip(events, hashes)):
+        candidates = [r for r in same.get((e["page"], h), ()) if r["id"] not in used]
+        if candidates:
+            row = next((r for r in candidates if r["ordinal"] == e["ordinal"]), candidates[0])
+            matched[i] = row
+            used.add(row["id"])
+    # then position, for changed text; new text at an edited row's position gets its own row
+    for i, e in enumerate(events):
+        row = at.get((e["page"], e["ordinal"]))
+        if i not in matched and row is not None and row["id"] not in used and not row["edited"]:
+            matched[i] = row
+            used.add(row["id"])
+
+    # free the positions taken by the new events: rows that move, and rows
+    # no event matched, step aside (-id) first, then matched rows take theirs
+    targets = {(e["page"], e["ordinal"]) for e in events}
+    moved = {row["id"]: events[i]["ordinal"] for i, row in matched.items() if row["ordinal"] != events[i]["ordinal"]}
+    aside = [
+        r["id"] for r in identified
+        if r["id"] in moved or (r["id"] not in used and (r["page"], r["ordinal"]) in targets)
+    ]
+    cur.executemany("UPDATE events SET ordinal=-id WHERE id=?", ((i,) for i in aside))
+    cur.executemany("UPDATE events SET ordinal=? WHERE id=?", ((o, i) for i, o in moved.items()))
+
+    deltas = Counter()
+    for i, (e, h) in enumerate(zip(events, hashes)):
+        row = matched.get(i)
+        if row is None:
+            cur.execute(
+                "INSERT INTO events (date, text, source_pdf, slice_idx, page, ordinal, content_hash) "
+                "VALUES (?, ?, ?, -1, ?, ?, ?)",
+                (e["date"], e["text"], source_pdf, e["page"], e["ordinal"], h)
+            )
+            timeline_deltas(deltas, source_pdf, e["date"], 1)
+            counts["inserted"] += 1
+        elif row["edited"]:
+            counts["edited"] += 1
+        elif row["content_hash"] != h:
+            cur.execute(
+                "UPDATE events SET date=?, text=?, content_hash=?, deleted=0 WHERE id=?",
+                (e["date"], e["text"], h, row["id"])
+            )
+            if not row["deleted"]:
+                timeline_deltas(deltas, source_pdf, row["date"], -1)
+            timeline_deltas(deltas, source_pdf, e["date"], 1)
+            counts["updated"] += 1
+        elif row["deleted"]:
+            cur.execute("UPDATE events SET deleted=0 WHERE id=?", (row["id"],))
+            timeline_deltas(deltas, source_pdf, row["date"], 1)
+            counts["restored"] += 1
+        else:
+            counts["unchanged"] += 1
+
+    in_scope = set(pages) if pages is not None else None
+    gone = [
+        r for r in [r for r in identified if r["id"] not in used] + legacy
+        if not r["deleted"] and not r["edited"] and (in_scope is None or r["page"] in in_scope or r["page"] is None)
+    ]
+    cur.executemany("UPDATE events SET deleted=1 WHERE id=?", ((r["id"],) for r in gone))
+    for r in gone:
+        timeline_deltas(deltas, source_pdf, r["date"], -1)
+    apply_timeline(cur, deltas)
+    counts["tombstoned"] = len(gone)
+    if counts["inserted"] or counts["updated"] or counts["restored"] or gone:
+        bump_events_version(cur)
+    return counts
+
+
+@DB_WRITE_SECONDS.labels(op="upsert_events").time()
+def upsert_events(source_pdf: str, events: List[Dict[str, Any]], pages: Optional[Iterable[int]] = None) -> Dict[str, int]:
+    """
+    Load a book's aggregated events ({date, text, page, ordinal}) as a diff.
+    Rows are matched on content hash within the page, then on (page, ordinal):
+    new events are inserted, events whose content hash changed are updated,
+    and rows that are no longer produced are tombstoned (deleted=1). Manually
+    edited rows are left alone; changed text at their position is inserted
+    as a new row.
+    pages limits tombstoning to the pages that were re-aggregated, so a
+    partial rerun does not retire the rest of the book.
+    Returns counts per outcome.
+    """
+    conn = get_connection()
+    try:
+        cur = conn.cursor()
+        ensure_tables(cur)
+        counts = _upsert_book(cur, source_pdf, events, pages)
+        conn.commit()
+    finally:
+        conn.close()
+    return counts
+
+
+@DB_WRITE_SECONDS.labels(op="upsert_books").time()
+def upsert_books(events_by_book: Dict[str, List[Dict[str, Any]]]) -> Dict[str, Dict[str, int]]:
+    """
+    upsert_events for several books in one transaction: readers see either
+    the old or the new events of every book, never a half-loaded one.
+    """
+    conn = get_connection()
+    try:
+        cur = conn.cursor()
+        ensure_tables(cur)
+        counts = {book: _upsert_book(cur, book, events) for book, events in events_by_book.items()}
+        conn.commit()
+    finally:
+        conn.close()
+    return counts
+
+
+# -----------------
+# RE-TRANSFORM
+# -----------------
+
+def list_books() -> List[str]:
+    """
+    Every source PDF with stored OCR output or events.
+    """
+    conn = get_connection()
+    try:
+        cur = conn.cursor()
+        ensure_tables(cur)
+        cur.execute(
+            "SELECT pdf_path FROM ocr_blocks UNION SELECT pdf_path FROM ocr_results "
+            "UNION SELECT source_pdf FROM events"
+        )
+        books = sorted(row[0] for row in cur.fetchall() if row[0])
+    finally:
+        conn.close()
+    return books
+
+
+def get_raw_results(pdf_path: str) -> List[str]:
+    """
+    Legacy result_json rows of a book, oldest first (a resumed run added one row per range).
+    New runs store blocks per half in ocr_blocks.
+    """
+    conn = get_connection()
+    try:
+        cur = conn.cursor()
+        ensure_tables(cur)
+        cur.execute("SELECT result_json FROM ocr_results WHERE pdf_path=? ORDER BY id", (pdf_path,))
+        rows = [row[0] for row in cur.fetchall()]
+    finally:
+        conn.close()
+    return rows
+
+
+# -----------------
+# PAGE HASHES
+# -----------------
+
+@DB_WRITE_SECONDS.labels(op="insert_page_hash").time()
+def insert_page_hash(
+    pdf_path: str,
+    page: int,
+    half: int,
+    phash: str,
+    bands: List[int],
+    size: Tuple[int, int],
+    source: Optional[str] = None,
+):
+    """
+    Store (or replace, on a rerun) the perceptual hash of one half page and its bands.
+    """
+    conn = get_connection()
+    try:
+        cur = conn.cursor()
+        ensure_tables(cur)
+        cur.execute("DELETE FROM page_hash_bands WHERE pdf_path=? AND page=? AND half=?", (pdf_path, page, half))
+        cur.execute(
+            "INSERT OR REPLACE INTO page_hashes (pdf_path, page, half, phash, width, height, source) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (pdf_path, page, half, phash, size[0], size[1], source)
+        )
+        cur.executemany(
+            "INSERT OR IGNORE INTO page_hash_bands (band, value, pdf_path, page, half) VALUES (?, ?, ?, ?, ?)",
+            [(band, value, pdf_path, page, half) for band, value in enumerate(bands)]
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def find_page_hashes(bands: List[int]) -> List[Dict[str, Any]]:
+    """
+    Halves sharing at least one band value with the given hash bands, with
+    stored blocks. The caller checks the full Hamming distance.
+    """
+    conn = get_connection()
+    try:
+        cur = conn.cursor()
+        ensure_tables(cur)
+        match = " OR ".join(["(b.band=? AND b.value=?)"] * len(bands))
+        cur.execute(
+            "SELECT DISTINCT h.pdf_path, h.page, h.half, h.phash, h.width, h.height "
+            "FROM page_hash_bands b JOIN page_hashes h USING (pdf_path, page, half) "
+            "JOIN ocr_blocks o USING (pdf_path, page, half) "
+            f"WHERE {match}",
+            [v for band, value in enumerate(bands) for v in (band, value)]
+        )
+        rows = [dict(row) for row in cur.fetchall()]
+    finally:
+        conn.close()
+    return rows
+
+
+def get_reused_halves(pdf_path: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    Halves whose blocks were reused from a near-duplicate, by book and page.
+    """
+    conn = get_connection()
+    try:
+        cur = conn.cursor()
+        ensure_tables(cur)
+        query = "SELECT pdf_path, page, half, source FROM page_hashes WHERE source IS NOT NULL"
+        params: Tuple[Any, ...] = ()
+        if pdf_path:
+            query += " AND pdf_path=?"
+            params = (pdf_path,)
+        cur.execute(query + " ORDER BY pdf_path, page, half", params)
+        rows = [dict(row) for row in cur.fetchall()]
+    finally:
+        conn.close()
+    return rows
+
+
+# -----------------
+# WORK QUEUE
+# -----------------
+# Units move pending -> leased -> done (or failed after MAX_ATTEMPTS; enqueueing
+# the book again puts its failed units back to pending).
+# A lease is a random token plus an expiry; an expired lease can be claimed
+# again by any worker. Results are written only in the same transaction that
+# moves the unit from leased (with the caller's token) to done, so each
+# unit's blocks are committed exactly once even if two workers OCR it.
+
+MAX_ATTEMPTS = 3
+
+
+@DB_WRITE_SECONDS.labels(op="enqueue_book").time()
+def enqueue_book(pdf_path: str, pages: Iterable[int], options: Optional[Dict[str, Any]] = None) -> int:
+    """
+    Queue both halves of the given pages. Units already queued are left as
+    they are, so enqueueing a book twice is harmless, except failed units,
+    which are retried. Returns units added or retried.
+    """
+    pages = list(pages)
+    conn = get_connection()
+    try:
+        cur = conn.cursor()
+        ensure_tables(cur)
+        before = conn.total_changes
+        cur.executemany(
+            "INSERT OR IGNORE INTO work_units (pdf_path, page, half) VALUES (?, ?, ?)",
+            ((pdf_path, page, half) for page in pages for half in (1, 2))
+        )
+        cur.executemany(
+            "UPDATE work_units SET status='pending', attempts=0, error=NULL, worker=NULL, lease_token=NULL, "
+            "lease_until=NULL WHERE pdf_path=? AND page=? AND status='failed'",
+            ((pdf_path, page) for page in pages)
+        )
+        added = conn.total_changes - before
+        cur.execute(
+            "INSERT INTO work_books (pdf_path, status, options) VALUES (?, 'open', ?) "
+            "ON CONFLICT (pdf_path) DO UPDATE SET status='open', options=excluded.options",
+            (pdf_path, json.dumps(options or {}))
+        )
+        conn.commit()
+    finally:
+        conn.close()
+    return added
+
+
+@DB_WRITE_SECONDS.labels(op="claim_units").time()
+def claim_units(worker: str, limit: int, lease_seconds: float, now: float) -> List[Dict[str, Any]]:
+    """
+    Lease up to limit pending (or expired) units, lowest page first.
+    Returns them with their lease_token and the book's options.
+    """
+    conn = get_connection()
+    try:
+        cur = conn.cursor()
+        ensure_tables(cur)
+        conn.commit()
+        cur.execute("BEGIN IMMEDIATE")  # take the write lock before choosing, so two workers never pick the same unit
+        cur.execute(
+            "SELECT u.pdf_path, u.page, u.half, u.attempts, b.options FROM work_units u "
+            "JOIN work_books b ON b.pdf_path = u.pdf_path "
+            "WHERE u.status='pending' OR (u.status='leased' AND u.lease_until < ?) "
+            "ORDER BY u.pdf_path, u.page, u.half LIMIT ?",
+            (now, limit)
+        )
+        claimed = []
+        for row in cur.fetchall():
+            token = uuid.uuid4().hex
+            cur.execute(
+                "UPDATE work_units SET status='leased', worker=?, lease_token=?, lease_until=?, attempts=attempts+1 "
+                "WHERE pdf_path=? AND page=? AND half=?",
+                (worker, token, now + lease_seconds, row["pdf_path"], row["page"], row["half"])
+            )
+            claimed.append({
+                "pdf_path": row["pdf_path"],
+                "page": row["page"],
+                "half": row["half"],
+                "attempt": row["attempts"] + 1,
+                "lease_token": token,
+                "options": json.loads(row["options"] or "{}"),
+            })
+        conn.commit()
+    finally:
+        conn.close()
+    return claimed
+
+
+def renew_leases(tokens: Iterable[str], lease_seconds: float, now: float) -> List[str]:
+    """
+    Heartbeat: extend the given leases. Returns the tokens that were lost
+    (expired and claimed by another worker, or already done).
+    """
+    conn = get_connection()
+    try:
+        cur = conn.cursor()
+        lost = []
+        for token in tokens:
+            cur.execute(
+                "UPDATE work_units SET lease_until=? WHERE lease_token=? AND status='leased'",
+                (now + lease_seconds, token)
+            )
+            if cur.rowcount == 0:
+                lost.append(token)
+        conn.commit()
+    finally:
+        conn.close()
+    return lost
+
+
+@DB_WRITE_SECONDS.labels(op="complete_unit").time()
+def complete_unit(unit: Dict[str, Any], outcome: str, blocks: List[Dict[str, Any]]) -> bool:
+    """
+    Commit a unit's blocks if the caller still holds its lease.
+    Returns False (and writes nothing) when the lease was lost.
+    """
+    conn = get_connection()
+    try:
+        cur = conn.cursor()
+        cur.execute(
+            "UPDATE work_units SET status='done', outcome=?, lease_until=NULL "
+            "WHERE pdf_path=? AND page=? AND half=? AND lease_token=? AND status='leased'",
+            (outcome, unit["pdf_path"], unit["page"], unit["half"], unit["lease_token"])
+        )
+        committed = cur.rowcount == 1
+        if committed:
+            write_half_blocks(cur, unit["pdf_path"], unit["page"], unit["half"], blocks)
+        conn.commit()
+    finally:
+        conn.close()
+    return committed
+
+
+def fail_unit(unit: Dict[str, Any], error: str):
+    """
+    Give a unit back after an error: pending again, or failed after MAX_ATTEMPTS.
+    """
+    conn = get_connection()
+    try:
+        cur = conn.cursor()
+        cur.execute(
+            "UPDATE work_units SET status=CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+            "error=?, lease_until=NULL "
+            "WHERE pdf_path=? AND page=? AND half=? AND lease_token=? AND status='leased'",
+            (MAX_ATTEMPTS, error[-500:], unit["pdf_path"], unit["page"], unit["half"], unit["lease_token"])
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def claim_finished_books() -> List[str]:
+    """
+    Books with no unit left to process (all done, or failed after
+    MAX_ATTEMPTS) and whose events are not loaded yet. Each book is returned
+    to exactly one caller, which then loads its events.
+    """
+    conn = get_connection()
+    try:
+        cur = conn.cursor()
+        ensure_tables(cur)
+        cur.execute(
+            "SELECT pdf_path FROM work_books b WHERE status='open' AND NOT EXISTS "
+            "(SELECT 1 FROM work_units u WHERE u.pdf_path = b.pdf_path AND u.status NOT IN ('done', 'failed'))"
+        )
+        claimed = []
+        for (pdf_path,) in cur.fetchall():
+            cur.execute("UPDATE work_books SET status='loaded' WHERE pdf_path=? AND status='open'", (pdf_path,))
+            if cur.rowcount == 1:
+                claimed.append(pdf_path)
+        conn.commit()
+    finally:
+        conn.close()
+    return claimed
+
+
+def queue_status() -> Dict[str, int]:
+    """
+    Unit counts per status ("expired" = leased past its expiry).
+    """
+    conn = get_connection()
+    try:
+        cur = conn.cursor()
+        ensure_tables(cur)
+        cur.execute(
+            "SELECT CASE WHEN status='leased' AND lease_until < ? THEN 'expired' ELSE status END AS s, COUNT(*) "
+            "FROM work_units GROUP BY s",
+            (time.time(),)
+        )
+        counts = {row[0]: row[1] for row in cur.fetchall()}
+    finally:
+        conn.close()
+    return counts
+
+
+def list_units(pdf_path: Optional[str] = None, status: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    Queued units in page order, optionally of one book and/or one status.
+    """
+    query = "SELECT pdf_path, page, half, status, attempts, error FROM work_units WHERE 1=1"
+    params: List[Any] = []
+    if pdf_path is not None:
+        query += " AND pdf_path=?"
+        params.append(pdf_path)
+    if status is not None:
+        query += " AND status=?"
+        params.append(status)
+    conn = get_connection()
+    try:
+        cur = conn.cursor()
+        ensure_tables(cur)
+        cur.execute(query + " ORDER BY pdf_path, page, half", params)
+        units = [dict(row) for row in cur.fetchall()]
+    finally:
+        conn.close()
+    return units
@@ -0,0 +1,106 @@
+"""
+Near-duplicate half pages across and within books.
+
+Scan batches repeat themselves: re-scans, duplicated inserts, the same
+pamphlet bound into several volumes. Every rendered half gets a 256-bit
+perceptual hash (app.image_utils.phash) stored in SQLite. Before a half is
+sent to the model, the index is searched for a half within max_distance
+differing bits whose blocks are stored; if one is found, its blocks are
+reused, bboxes rescaled to this half, instead of running OCR.
+
+The lookup is a multi-index Hamming search: the hash is split into BANDS
+16-bit bands, each indexed for exact match. Two hashes within BANDS - 1 bits
+share at least one band, so recall is exact up to 15 bits; at the default
+threshold (20) a few in a thousand true matches can be missed.
+"""
+import asyncio
+from typing import Any, Dict, List, Optional, Tuple
+
+from PIL import Image
+
+from app.db import find_page_hashes, get_half_blocks, insert_page_hash
+from app.image_utils import hamming, phash
+
+# Differing bits (of 256) still counted as the same half: re-scans measure
+# about 10-25, distinct pages of the same layout 80 and more
+DUP_MAX_DISTANCE = 20
+BANDS = 16
+BAND_BITS = 16
+
+
+def hash_bands(value: int) -> List[int]:
+    mask = (1 << BAND_BITS) - 1
+    return [(value >> (BAND_BITS * i)) & mask for i in range(BANDS)]
+
+
+def half_key(pdf_path: str, page: int, half: int) -> str:
+    return f"{pdf_path}:{page}:{half}"
+
+
+def rescale(blocks: List[Dict[str, Any]], source_size: Tuple[int, int], size: Tuple[int, int]) -> List[Dict[str, Any]]:
+    """
+    Copies of a duplicate's blocks for this half: bboxes scaled to its size, page tag dropped.
+    """
+    sx, sy = size[0] / source_size[0], size[1] / source_size[1]
+    out = []
+    for b in blocks:
+        if not isinstance(b, dict):
+            out.append(b)
+            continue
+        b = {k: v for k, v in b.items() if k != "page"}
+        bbox = b.get("bbox")
+        if isinstance(bbox, list) and len(bbox) == 4:
+            b["bbox"] = [int(bbox[0] * sx), int(bbox[1] * sy), int(bbox[2] * sx), int(bbox[3] * sy)]
+        out.append(b)
+    return out
+
+
+class PageIndex:
+    """
+    Duplicate lookup and hash recording for the halves of one book.
+    """
+
+    def __init__(self, pdf_path: str, max_distance: int = DUP_MAX_DISTANCE):
+        self.pdf_path = pdf_path
+        self.max_distance = max_distance
+        self.reused: List[Tuple[int, int, str]] = []
+
+    def find(self, fingerprint: int, page: int, half: int) -> Optional[Dict[str, Any]]:
+        """
+        The nearest stored half within max_distance (not this one), with its blocks.
+        """
+        candidates = []
+        for row in find_page_hashes(hash_bands(fingerprint)):
+            if (row["pdf_path"], row["page"], row["half"]) == (self.pdf_path, page, half):
+                continue
+            distance = hamming(fingerprint, int(row["phash"], 16))
+            if distance <= self.max_distance:
+                candidates.append((distance, row))
+        for distance, row in sorted(candidates, key=lambda c: c[0]):
+            blocks = get_half_blocks(row["pdf_path"], row["page"], row["half"])
+            if blocks is not None:
+                return {**row, "distance": distance, "blocks": blocks}
+        return None
+
+    def record(self, fingerprint: int, page: int, half: int, size: Tuple[int, int], source: Optional[str] = None):
+        insert_page_hash(self.pdf_path, page, half, f"{fingerprint:064x}", hash_bands(fingerprint), size, source)
+
+    async def reuse(
+        self, image: Image.Image, page: int, half: int, size: Optional[Tuple[int, int]] = None
+    ) -> Tuple[int, Optional[List[Dict[str, Any]]]]:
+        """
+        Hash the half and look it up. Returns (hash, blocks reused from a
+        duplicate or None); the hash is recorded right away only on reuse,
+        otherwise after OCR (see record). size: the pixel space the half's
+        blocks are stored in, if not the image's own.
+        """
+        size = size or image.size
+        fingerprint = await asyncio.to_thread(phash, image)
+        match = await asyncio.to_thread(self.find, fingerprint, page, half)
+        if match is None:
+            return fingerprint, None
+        source = half_key(match["pdf_path"], match["page"], match["half"])
+        print(f"[DUP] page {page} half {half}: reusing {source} (distance {match['distance']})")
+        await asyncio.to_thread(self.record, fingerprint, page, half, size, source)
+        self.reused.append((page, half, source))
+        return fingerprint, rescale(match["blocks"], (match["width"], match["height"]), size)
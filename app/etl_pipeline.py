@@ -2,39 +2,269 @@ import httpx
 import asyncio
 import io
 import json
+from collections import Counter
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterable, Optional, Tuple
 
 from PIL import Image
-from app.pdf_utils import pdf_to_pages, slice_page
-from app.db import insert_raw_result, insert_event, clear_previous_results
+from app.pdf_utils import pdf_page_count, pdf_to_halves
+from app.db import insert_half_blocks, upsert_events, clear_previous_results
 from app.aggregator import aggregate_blocks
+from app.image_utils import (
+    adaptive_budget, classify_region, skipped_blocks, resize_for_model, vision_tokens, MAX_PIXELS,
+)
+from app.timing import stage
+from app.metrics import ETL_HALVES, ETL_MEMO_BLOCKS, ETL_PAGES, ETL_VISION_TOKENS, OCR_PARSE_FAILURES
+from app.duplicates import PageIndex, rescale
+from app.running_heads import RunningHeads, merge
+from app.tracing import trace_context, trace_headers, span
 
 OCR_SERVER = "http://localhost:8000/infer"
+GPU_SECONDS_PER_HALF = 60.0  # rough RTX 3060 cost of one half page, used for the skip report
+# Two-stage OCR: a layout-only pass (dots.ocr's prompt_layout_only_en), then
+# the text of every kept region recognized in batches on the server
+LAYOUT_ONLY_PROMPT = (
+    "Please output the layout information from this PDF image, including each layout's bbox and its category. "
+    "The bbox should be in the format [x1, y1, x2, y2]. The layout categories for the PDF document include "
+    "['Caption', 'Footnote', 'Formula', 'List-item', 'Page-footer', 'Page-header', 'Picture', 'Section-header', "
+    "'Table', 'Text', 'Title']. Do not output the corresponding text. The layout result should be in JSON format."
+)
+TWO_STAGE_DROP = {"Picture", "Page-header", "Page-footer"}  # never read by the aggregator
 CHECKPOINT_DIR = Path("data/checkpoints")
 CHECKPOINT_DIR.mkdir(parents=True, exist_ok=True)
 
+# Vision tokens uploaded ("sent") and what the fixed MAX_PIXELS budget would have cost ("fixed")
+VISION_TOKENS: Counter = Counter()
+
 # --------------------
 # Extract stage
 # --------------------
 
-async def extract_pdf(pdf_path: str, dpi: int = 300, from_page: int = 1, to_page: int | None = None) -> List[Dict[str, Any]]:
+async def ocr_half(
+    client: httpx.AsyncClient,
+    half: Image.Image,
+    name: str,
+    presize: bool = True,
+    prompt: str | None = None,
+    line_px: int | None = None,
+) -> List[Dict[str, Any]]:
+    """
+    Upload one half page to the OCR server and return its layout blocks.
+    prompt: instead of the server's default full layout prompt.
+    line_px (presize only): upload just the inked region, at the smallest
+    budget that keeps text lines about this many pixels high (adaptive_budget).
+    """
+    with stage("encode"):
+        region, box, max_pixels = half, (0, 0), MAX_PIXELS
+        if presize and line_px:
+            box, max_pixels = adaptive_budget(half, line_px=line_px)
+            region = half.crop(box)
+        upload = resize_for_model(region, max_pixels=max_pixels) if presize else region
+        buf = io.BytesIO()
+        upload.save(buf, format="PNG")
+        buf.seek(0)
+
+    tokens, fixed = vision_tokens(*upload.size), vision_tokens(*half.size)
+    VISION_TOKENS.update(sent=tokens, fixed=fixed)
+    ETL_VISION_TOKENS.labels(budget="sent").inc(tokens)
+    ETL_VISION_TOKENS.labels(budget="fixed").inc(fixed)
+    if line_px:
+        print(f"[ADAPT] {name}: {region.width}x{region.height} -> {upload.width}x{upload.height}, {tokens} vision tokens (fixed {fixed})")
+
+    files = {"file": (f"{name}.png", buf, "image/png")}
+    data = {}
+    if presize:
+        data = {"presized": "true", "orig_width": str(region.width), "orig_height": str(region.height)}
+    if prompt is not None:
+        data["prompt"] = prompt
+    with stage("request"):
+        resp = await client.post(OCR_SERVER, files=files, data=data, headers=trace_headers())
+        resp.raise_for_status()
+        half_blocks = resp.json()
+
+    if isinstance(half_blocks, str):
+        half_blocks = {"raw_output": half_blocks}
+    if isinstance(half_blocks, dict) and "raw_output" in half_blocks:
+        try:
+            half_blocks = json.loads(half_blocks["raw_output"])
+        except json.JSONDecodeError:
+            OCR_PARSE_FAILURES.labels(where="etl").inc()
+            print(f"[WARN] Could not decode raw_output for {name}")
+            half_blocks = []
+    if box[0] or box[1]:  # bboxes of the cropped region back to the half
+        for b in half_blocks:
+            bbox = b.get("bbox") if isinstance(b, dict) else None
+            if isinstance(bbox, list) and len(bbox) == 4:
+                b["bbox"] = [bbox[0] + box[0], bbox[1] + box[1], bbox[2] + box[0], bbox[3] + box[1]]
+    return half_blocks
+
+
+def regions_url() -> str:
+    return OCR_SERVER.rsplit("/", 1)[0] + "/infer_regions"
+
+
+async def ocr_half_two_stage(
+    client: httpx.AsyncClient,
+    half: Image.Image,
+    name: str,
+    presize: bool = True,
+    line_px: int | None = None,
+) -> List[Dict[str, Any]]:
+    """
+    Layout-only pass, then one region request for the text of every kept
+    block. Pictures and running headers/footers keep their bbox and category
+    but get no text, so no tokens are generated for them.
+    """
+    blocks = await ocr_half(client, half, name, presize=presize, prompt=LAYOUT_ONLY_PROMPT, line_px=line_px)
+    kept = [
+        b for b in blocks
+        if isinstance(b, dict) and b.get("category") not in TWO_STAGE_DROP
+        and isinstance(b.get("bbox"), list) and len(b["bbox"]) == 4
+    ]
+    if not kept:
+        return blocks
+
+    # crops are cut from the rendered half, in whose pixels the layout bboxes are
+    with stage("encode"):
+        buf = io.BytesIO()
+        half.save(buf, format="PNG")
+        buf.seek(0)
+    files = {"file": (f"{name}.png", buf, "image/png")}
+    data = {"bboxes": json.dumps([b["bbox"] for b in kept])}
+    with stage("request"):
+        resp = await client.post(regions_url(), files=files, data=data, headers=trace_headers())
+        resp.raise_for_status()
+        texts = resp.json()
+
+    for b, text in zip(kept, texts):
+        b["text"] = text
+    return blocks
+
+
+def to_dpi(blocks: List[Dict[str, Any]], size: Tuple[int, int], dpi_size: Tuple[int, int]) -> List[Dict[str, Any]]:
+    """
+    A rendered half's blocks with bboxes scaled from its size to its size at the render dpi.
+    """
+    return blocks if size == dpi_size else rescale(blocks, size, dpi_size)
+
+
+async def extract_half(
+    client: httpx.AsyncClient,
+    half: Image.Image,
+    page_idx: int,
+    side_idx: int,
+    skip_blank: bool = True,
+    presize: bool = True,
+    two_stage: bool = False,
+    heads: RunningHeads | None = None,
+    index: PageIndex | None = None,
+    line_px: int | None = None,
+    blank_thresholds: Dict[str, float] | None = None,
+) -> Tuple[str, List[Dict[str, Any]]]:
+    """
+    Produce the blocks of one half page.
+    Returns (outcome, blocks), outcome being "ocr", "empty", "picture" or "duplicate".
+    heads: the book's learned running headers/footers, masked out of the
+    upload and re-synthesized (presized uploads only).
+    index: near-duplicate lookup; a match's stored blocks are reused instead of OCR.
+    line_px: adaptive resolution, see ocr_half.
+    blank_thresholds: classify_region keyword arguments overriding its defaults.
+    bboxes are returned in the half's pixels at the render dpi
+    (half.info["dpi_size"] for presized renders), whatever size was uploaded.
+    """
+    dpi_size = half.info.get("dpi_size", half.size)
+    if skip_blank:
+        with stage("classify"):
+            kind, stats = classify_region(half, **(blank_thresholds or {}))
+        if kind != "text":
+            print(
+                f"[SKIP] page {page_idx} half {side_idx}: {kind} "
+                f"(ink {stats.ink_ratio:.2%}, {stats.components} components)"
+            )
+            return kind, to_dpi(skipped_blocks(kind, half), half.size, dpi_size)
+
+    fingerprint = None
+    if index is not None:
+        with stage("dedup"):
+            fingerprint, reused = await index.reuse(half, page_idx, side_idx, dpi_size)
+        if reused is not None:
+            return "duplicate", reused
+
+    heads = heads if presize else None
+    upload, memo = half, []
+    if heads is not None:
+        with stage("memo"):
+            upload, memo = heads.mask(side_idx, half)
+
+    ocr = ocr_half_two_stage if two_stage else ocr_half
+    blocks = await ocr(client, upload, f"page{page_idx}_half{side_idx}", presize=presize, line_px=line_px)
+    if index is not None:
+        await asyncio.to_thread(index.record, fingerprint, page_idx, side_idx, dpi_size)
+
+    if heads is None:
+        return "ocr", to_dpi(blocks, half.size, dpi_size)
+    with stage("memo"):
+        heads.observe(side_idx, half, blocks)
+    for m in memo:
+        ETL_MEMO_BLOCKS.labels(category=m["category"]).inc()
+    return "ocr", to_dpi(merge(blocks, memo), half.size, dpi_size)
+
+
+async def extract_pdf(
+    pdf_path: str,
+    dpi: int = 300,
+    from_page: int = 1,
+    to_page: int | None = None,
+    skip_blank: bool = True,
+    presize: bool = True,
+    color_mode: str = "rgb",
+    two_stage: bool = False,
+    memo_heads: bool = False,
+    dedup_distance: int | None = None,
+    adaptive_line_px: int | None = None,
+    blank_thresholds: Dict[str, float] | None = None,
+) -> List[Dict[str, Any]]:
     """
     Run OCR on a PDF range.
     Returns a single list of blocks across all pages (merged).
+    With skip_blank, empty and picture-only halves are classified locally
+    and never sent to the OCR server; blank_thresholds overrides the
+    classify_region thresholds (max_ink_ratio, min_components,
+    picture_midtone_ratio, picture_max_components).
+    With presize, halves are rendered at the model's input geometry and
+    their bboxes are scaled back to pixels at dpi before they are stored.
+    color_mode "gray" or "bilevel" renders, slices and uploads single-channel
+    images; the server expands them to RGB only for the model.
+    With two_stage, each half is a layout-only pass followed by batched
+    recognition of the kept regions (see ocr_half_two_stage).
+    With memo_heads (and presize), running headers/footers learned from the
+    first pages are masked out of later uploads (see app.running_heads).
+    With dedup_distance, halves within that many bits of an already stored
+    half's perceptual hash reuse its blocks (see app.duplicates).
+    With adaptive_line_px (and presize), each half is uploaded cropped to its
+    ink at the smallest budget keeping text lines that many pixels high.
     """
     pdf_path = Path(pdf_path)
     all_blocks: List[Dict[str, Any]] = []
+    skipped = {"empty": 0, "picture": 0}
+    heads = RunningHeads() if memo_heads and presize else None
+    index = PageIndex(str(pdf_path), dedup_distance) if dedup_distance is not None else None
+    tokens_before = VISION_TOKENS.copy()
     
     # Track already processed pages
-    processed_pages = {
-        int(f.stem.split("_page")[-1])
-        for f in CHECKPOINT_DIR.glob(f"{pdf_path.stem}_page*.json")
-    }
+    processed_pages = {checkpoint_page(f) for f in checkpoint_files(pdf_path)}
 
     async with httpx.AsyncClient(timeout=120.0) as client:
         page_idx = from_page - 1
-        for page in pdf_to_pages(str(pdf_path), dpi=dpi, from_page=from_page, to_page=to_page):
+        for halves in pdf_to_halves(
+            str(pdf_path),
+            dpi=dpi,
+            order="right_first",
+            from_page=from_page,
+            to_page=to_page,
+            max_pixels=MAX_PIXELS if presize else None,
+            color_mode=color_mode,
+        ):
             page_idx += 1
             
             checkpoint_file = CHECKPOINT_DIR / f"{pdf_path.stem}_page{page_idx}.json"
@@ -42,47 +272,59 @@ async def extract_pdf(pdf_path: str, dpi: int = 300, from_page: int = 1, to_page
                 print(f"[EXTRACT] Skipping page {page_idx}, already checkpointed")
                 page_blocks = json.loads(checkpoint_file.read_text(encoding="utf-8"))
                 all_blocks.extend(page_blocks)
+                ETL_PAGES.labels(source="checkpoint").inc()
                 continue
             
             print(f"[EXTRACT] Processing page {page_idx} ...")
 
-            halves = list(slice_page(page, order="right_first"))
             page_blocks: List[Dict[str, Any]] = []
 
             for side_idx, half in enumerate(halves, start=1):
-                buf = io.BytesIO()
-                half.save(buf, format="PNG")
-                buf.seek(0)
-
-                files = {"file": (f"page{page_idx}_half{side_idx}.png", buf, "image/png")}
-                resp = await client.post(OCR_SERVER, files=files)
-                resp.raise_for_status()
-                half_blocks = resp.json()
-                
-                if isinstance(half_blocks, dict) and "raw_output" in half_blocks:
-                    try:
-                        half_blocks = json.loads(half_blocks["raw_output"])
-                    except json.JSONDecodeError:
-                        print(f"[WARN] Could not decode raw_output on page {page_idx}")
-                        half_blocks = []
+                # one trace per (book, page, half), carried to the OCR server
+                with trace_context(book=pdf_path.stem, page=page_idx, half=side_idx), span("half"):
+                    outcome, half_blocks = await extract_half(
+                        client, half, page_idx, side_idx,
+                        skip_blank=skip_blank, presize=presize, two_stage=two_stage,
+                        heads=heads, index=index, line_px=adaptive_line_px,
+                        blank_thresholds=blank_thresholds,
+                    )
+                if outcome in skipped:
+                    skipped[outcome] += 1
 
                 # Tag blocks with page number for traceability
                 for b in half_blocks:
                     b["page"] = page_idx
-                    if b.get("category") == "List-item":
-                        b["category"] = "Text"
+                # Raw output per half, so one page can be read back without the whole book
+                with stage("load_raw"):
+                    insert_half_blocks(str(pdf_path), page_idx, side_idx, half_blocks)
                 page_blocks.extend(half_blocks)
-                print(f"[EXTRACT]  -> half {side_idx} done, {len(half_blocks)} blocks")
+                ETL_HALVES.labels(outcome=outcome).inc()
+                print(f"[EXTRACT]  -> half {side_idx} done ({outcome}), {len(half_blocks)} blocks")
             # Save per-page JSON checkpoint after both halves
             checkpoint_file.write_text(json.dumps(page_blocks, ensure_ascii=False, indent=2), encoding="utf-8")
             print(f"[CHECKPOINT] Saved {checkpoint_file}")
 
             # Append page’s blocks into global book stream
             all_blocks.extend(page_blocks)
+            ETL_PAGES.labels(source="ocr").inc()
             print(f"[EXTRACT] ✅ Page {page_idx} done, total {len(page_blocks)} blocks")
 
-    # Save one merged JSON row for the whole range
-    insert_raw_result(str(pdf_path), -1, json.dumps(all_blocks, ensure_ascii=False))
+    total_skipped = sum(skipped.values())
+    if total_skipped:
+        print(
+            f"[SKIP] {total_skipped} halves skipped ({skipped['empty']} empty, "
+            f"{skipped['picture']} picture-only), ~{total_skipped * GPU_SECONDS_PER_HALF / 60:.0f} min GPU saved"
+        )
+    if index is not None and index.reused:
+        print(
+            f"[DUP] {len(index.reused)} halves reused from near-duplicates, "
+            f"~{len(index.reused) * GPU_SECONDS_PER_HALF / 60:.0f} min GPU saved"
+        )
+    if heads is not None and heads.masked:
+        print(f"[MEMO] {heads.masked} running header/footer blocks masked and re-synthesized")
+    sent, fixed = (VISION_TOKENS[k] - tokens_before[k] for k in ("sent", "fixed"))
+    if fixed:
+        print(f"[TOKENS] {sent} vision tokens uploaded, {fixed} at the fixed budget ({sent / fixed:.0%})")
 
     return all_blocks
 
@@ -91,30 +333,44 @@ async def extract_pdf(pdf_path: str, dpi: int = 300, from_page: int = 1, to_page
 # Transform + Load stage
 # --------------------
 
-def transform_and_load(pdf_path: str, all_blocks: List[Dict[str, Any]]):
+def transform_and_load(pdf_path: str, all_blocks: List[Dict[str, Any]], pages: Optional[Iterable[int]] = None):
     """
-    Transform OCR blocks into structured events and insert into DB.
+    Transform OCR blocks into structured events and load them into the DB
+    as a diff against the book's existing events.
+    pages: the pages that were processed, blank ones included; events on
+    them that are no longer produced are tombstoned. None means the whole book.
     """
-    events = aggregate_blocks(all_blocks)
+    with stage("transform"):
+        events = aggregate_blocks(all_blocks)
 
-    for e in events:
-        insert_event(
-            e["date"],
-            e["text"],
-            source_pdf=str(pdf_path),
-            slice_idx=-1,  # -1 = merged book-level
-        )
+    with stage("load"):
+        counts = upsert_events(str(pdf_path), events, pages=pages)
 
-    print(f"[TRANSFORM+LOAD] Inserted {len(events)} events into DB")
+    print(
+        f"[TRANSFORM+LOAD] {len(events)} events: {counts['inserted']} inserted, {counts['updated']} updated, "
+        f"{counts['restored']} restored, {counts['tombstoned']} tombstoned, {counts['unchanged']} unchanged, "
+        f"{counts['edited']} kept manual edits"
+    )
 
 
 # --------------------
 # Full pipeline
 # --------------------
 
+def checkpoint_page(path: Path) -> int:
+    return int(path.stem.split("_page")[-1])
+
+
+def checkpoint_files(pdf_path: str) -> List[Path]:
+    """
+    A book's per-page checkpoints in page order (page10 after page9).
+    """
+    return sorted(CHECKPOINT_DIR.glob(f"{Path(pdf_path).stem}_page*.json"), key=checkpoint_page)
+
+
 def load_checkpoints(pdf_path: str, resume_safe: bool = True) -> List[Dict[str, Any]]:
     pdf_path = Path(pdf_path)
-    files = sorted(CHECKPOINT_DIR.glob(f"{pdf_path.stem}_page*.json"))
+    files = checkpoint_files(pdf_path)
     if not files:
         return []
 
@@ -130,29 +386,48 @@ def load_checkpoints(pdf_path: str, resume_safe: bool = True) -> List[Dict[str,
         blocks.extend(json.loads(f.read_text(encoding="utf-8")))
     return blocks
 
-async def process_pdf(pdf_path: str, dpi: int = 300, from_page: int = 1, to_page: int | None = None):
+async def process_pdf(
+    pdf_path: str,
+    dpi: int = 300,
+    from_page: int = 1,
+    to_page: int | None = None,
+    skip_blank: bool = True,
+    presize: bool = True,
+    color_mode: str = "rgb",
+    two_stage: bool = False,
+    memo_heads: bool = False,
+    dedup_distance: int | None = None,
+    adaptive_line_px: int | None = None,
+    blank_thresholds: Dict[str, float] | None = None,
+):
     """
     Full ETL: Extract → Transform → Load
     Supports checkpoint resume.
     """
-    # Load existing checkpoints first (drops last one for safety)
-    all_blocks = load_checkpoints(pdf_path, resume_safe=True)
-
-    # Figure out where to resume
-    checkpoint_files = sorted(CHECKPOINT_DIR.glob(f"{Path(pdf_path).stem}_page*.json"))
-    if checkpoint_files:
-        last_done_page = int(checkpoint_files[-1].stem.split("_page")[-1])
-        resume_from_page = last_done_page + 1
-    else:
-        resume_from_page = from_page
-
-    if not all_blocks:  # nothing checkpointed yet → fresh OCR
-        clear_previous_results(str(pdf_path))
-        all_blocks = await extract_pdf(pdf_path, dpi=dpi, from_page=from_page, to_page=to_page)
-    else:
-        print(f"[RESUME] Loaded {len(all_blocks)} blocks from checkpoints")
-        print(f"[RESUME] Resuming OCR from page {resume_from_page}")
-        new_blocks = await extract_pdf(pdf_path, dpi=dpi, from_page=resume_from_page, to_page=to_page)
-        all_blocks.extend(new_blocks)
-
-    transform_and_load(pdf_path, all_blocks)
+    extract_options = dict(dpi=dpi, skip_blank=skip_blank, presize=presize, color_mode=color_mode,
+                           two_stage=two_stage, memo_heads=memo_heads, dedup_distance=dedup_distance,
+                           adaptive_line_px=adaptive_line_px, blank_thresholds=blank_thresholds)
+
+    with trace_context(book=Path(pdf_path).stem):
+        # Load existing checkpoints first (drops last one for safety)
+        all_blocks = load_checkpoints(pdf_path, resume_safe=True)
+
+        # Figure out where to resume
+        files = checkpoint_files(pdf_path)
+        if files:
+            last_done_page = checkpoint_page(files[-1])
+            resume_from_page = last_done_page + 1
+        else:
+            resume_from_page = from_page
+
+        if not all_blocks:  # nothing checkpointed yet → fresh OCR
+            clear_previous_results(str(pdf_path))
+            all_blocks = await extract_pdf(pdf_path, from_page=from_page, to_page=to_page, **extract_options)
+        else:
+            print(f"[RESUME] Loaded {len(all_blocks)} blocks from checkpoints")
+            print(f"[RESUME] Resuming OCR from page {resume_from_page}")
+            new_blocks = await extract_pdf(pdf_path, from_page=resume_from_page, to_page=to_page, **extract_options)
+            all_blocks.extend(new_blocks)
+
+        last = pdf_page_count(pdf_path) if to_page is None else min(to_page, pdf_page_count(pdf_path))
+        transform_and_load(pdf_path, all_blocks, pages=range(from_page, last + 1))
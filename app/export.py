@@ -0,0 +1,132 @@
+import csv
+import io
+import json
+import zlib
+from typing import Iterable, Iterator, List, Optional
+
+try:  # Parquet export is optional
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+from app.db import EVENT_FIELDS, iter_events
+
+EXPORT_FORMATS = {
+    "csv": ("text/csv; charset=utf-8", "csv"),
+    "jsonl": ("application/x-ndjson; charset=utf-8", "jsonl"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+
+# Rows read from SQLite (and written as one CSV/JSONL chunk or Arrow record batch) at a time
+EXPORT_CHUNK_ROWS = 5000
+
+
+# --------------------
+# Formats
+# --------------------
+
+def csv_chunks(chunks: Iterable[List], fields: List[str]) -> Iterator[bytes]:
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    # BOM so spreadsheet apps detect UTF-8 Arabic text
+    buf.write("\ufeff")
+    writer.writerow(fields)
+    for rows in chunks:
+        writer.writerows(tuple(row) for row in rows)
+        yield buf.getvalue().encode("utf-8")
+        buf.seek(0)
+        buf.truncate()
+    if buf.tell():
+        yield buf.getvalue().encode("utf-8")
+
+
+def jsonl_chunks(chunks: Iterable[List], fields: List[str]) -> Iterator[bytes]:
+    for rows in chunks:
+        yield "".join(json.dumps(dict(row), ensure_ascii=False) + "\n" for row in rows).encode("utf-8")
+
+
+class _Sink(io.RawIOBase):
+    """Write-only file that hands written bytes back to the generator"""
+
+    def __init__(self):
+        self.parts: List[bytes] = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self) -> bytes:
+        data, self.parts = b"".join(self.parts), []
+        return data
+
+
+def parquet_chunks(chunks: Iterable[List], fields: List[str]) -> Iterator[bytes]:
+    """
+    One Arrow record batch (and Parquet row group) per chunk, flushed as
+    soon as it is written; the footer follows the last batch.
+    """
+    types = {"id": pa.int64(), "slice_idx": pa.int64(), "page": pa.int64()}
+    schema = pa.schema([(f, types.get(f, pa.string())) for f in fields])
+    sink = _Sink()
+    writer = pq.ParquetWriter(sink, schema, compression="zstd")
+    try:
+        for rows in chunks:
+            columns = list(zip(*rows))
+            batch = pa.record_batch([pa.array(col, type=schema.field(i).type) for i, col in enumerate(columns)], schema=schema)
+            writer.write_batch(batch)
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+def gzip_chunks(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits 31: gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+# --------------------
+# Export
+# --------------------
+
+def export_events(
+    fmt: str,
+    from_date: Optional[str] = None,
+    to_date: Optional[str] = None,
+    fields: Iterable[str] = EVENT_FIELDS,
+    gzip: bool = False,
+) -> Iterator[bytes]:
+    """
+    Stream events in the given format. gzip applies to csv and jsonl;
+    Parquet pages are already zstd-compressed.
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"format must be one of {list(EXPORT_FORMATS)}, got {fmt!r}")
+    if fmt == "parquet" and pa is None:
+        raise RuntimeError("Parquet export needs pyarrow: pip install pyarrow")
+
+    fields = list(fields)
+    chunks = iter_events(from_date, to_date, fields=fields, chunk_size=EXPORT_CHUNK_ROWS)
+    stream = {"csv": csv_chunks, "jsonl": jsonl_chunks, "parquet": parquet_chunks}[fmt](chunks, fields)
+    if gzip and fmt != "parquet":
+        stream = gzip_chunks(stream)
+    return stream
+
+
+def export_filename(fmt: str, from_date: Optional[str], to_date: Optional[str], gzip: bool) -> str:
+    span = "_".join(d.replace("/", "-") for d in (from_date, to_date) if d) or "all"
+    name = f"events_{span}.{EXPORT_FORMATS[fmt][1]}"
+    return name + ".gz" if gzip and fmt != "parquet" else name
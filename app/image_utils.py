@@ -0,0 +1,257 @@
+import math
+from typing import List, Dict, Any, Tuple
+
+import numpy as np
+from PIL import Image
+
+# The classifier is shared with the parser (model/dots_ocr/utils/ink_utils.py)
+from model.dots_ocr.utils.ink_utils import (  # noqa: F401
+    ANALYSIS_SIDE,
+    BLANK_MAX_INK_RATIO,
+    BLANK_MIN_COMPONENTS,
+    GLYPH_MAX_AREA,
+    INK_CONTRAST,
+    MIDTONE_DEPTH,
+    PICTURE_MAX_COMPONENTS,
+    PICTURE_MIN_MIDTONE_RATIO,
+    InkStats,
+    classify_region,
+    count_components,
+    ink_stats,
+    to_analysis_gray,
+)
+
+# --------------------
+# Model input geometry (mirrors dots_ocr.utils.image_utils.smart_resize)
+# --------------------
+
+IMAGE_FACTOR = 28
+MIN_PIXELS = 3136
+MAX_PIXELS = 11289600
+
+
+def smart_resize(
+    height: int,
+    width: int,
+    factor: int = IMAGE_FACTOR,
+    min_pixels: int = MIN_PIXELS,
+    max_pixels: int = MAX_PIXELS,
+) -> Tuple[int, int]:
+    """
+    Return the (height, width) the model's processor resizes an image to:
+    both sides divisible by factor, pixel count within [min_pixels, max_pixels].
+    """
+    if max(height, width) / min(height, width) > 200:
+        raise ValueError(
+            f"absolute aspect ratio must be smaller than 200, got {max(height, width) / min(height, width)}"
+        )
+    h_bar = max(factor, round(height / factor) * factor)
+    w_bar = max(factor, round(width / factor) * factor)
+    if h_bar * w_bar > max_pixels:
+        beta = math.sqrt((height * width) / max_pixels)
+        h_bar = max(factor, math.floor(height / beta / factor) * factor)
+        w_bar = max(factor, math.floor(width / beta / factor) * factor)
+    elif h_bar * w_bar < min_pixels:
+        beta = math.sqrt(min_pixels / (height * width))
+        h_bar = math.ceil(height * beta / factor) * factor
+        w_bar = math.ceil(width * beta / factor) * factor
+        if h_bar * w_bar > max_pixels:
+            beta = math.sqrt((h_bar * w_bar) / max_pixels)
+            h_bar = max(factor, math.floor(h_bar / beta / factor) * factor)
+            w_bar = max(factor, math.floor(w_bar / beta / factor) * factor)
+    return h_bar, w_bar
+
+
+# --------------------
+# Color modes: black-and-white scans do not need three channels
+# --------------------
+
+COLOR_MODES = ("rgb", "gray", "bilevel")
+BILEVEL_LEVEL = 160  # gray levels below this become black in bilevel mode
+
+
+def to_color_mode(image: Image.Image, color_mode: str = "rgb") -> Image.Image:
+    """
+    Convert an image to "rgb" (8-bit RGB), "gray" (8-bit L) or "bilevel" (1-bit).
+    The model server expands gray and bilevel uploads back to RGB.
+    """
+    if color_mode not in COLOR_MODES:
+        raise ValueError(f"color_mode must be one of {COLOR_MODES}, got {color_mode!r}")
+    if color_mode == "rgb":
+        return image if image.mode == "RGB" else image.convert("RGB")
+    gray = image if image.mode == "L" else image.convert("L")
+    if color_mode == "gray":
+        return gray
+    return gray.point(lambda v: 255 if v >= BILEVEL_LEVEL else 0, mode="1")
+
+
+def resize_for_model(
+    image: Image.Image,
+    min_pixels: int = MIN_PIXELS,
+    max_pixels: int = MAX_PIXELS,
+) -> Image.Image:
+    """
+    Resample an image once to its final smart_resize geometry so the server
+    can skip its own resize. A no-op when the size already matches.
+    """
+    height, width = smart_resize(image.height, image.width, min_pixels=min_pixels, max_pixels=max_pixels)
+    if (width, height) == image.size:
+        return image
+    if image.mode == "1":  # PIL only resamples 1-bit images with NEAREST
+        resized = image.convert("L").resize((width, height), Image.Resampling.BILINEAR, reducing_gap=3.0)
+        return to_color_mode(resized, "bilevel")
+    return image.resize((width, height), Image.Resampling.BILINEAR, reducing_gap=3.0)
+
+
+# --------------------
+# Blank / picture-only detection
+# --------------------
+
+# classify_region and ink_stats come from the parser's ink_utils (imported above)
+
+def ink_ratio(image: Image.Image, side: int = 256) -> float:
+    """
+    Share of ink pixels on a small grayscale copy: ink_stats without the component count.
+    """
+    gray = to_analysis_gray(image, side=side)
+    paper = int(np.percentile(gray, 90))
+    return float(np.count_nonzero(gray < max(paper - INK_CONTRAST, 1))) / max(int(gray.size), 1)
+
+
+def skipped_blocks(kind: str, image: Image.Image) -> List[Dict[str, Any]]:
+    """
+    Blocks standing in for a region that was not sent to the model.
+    """
+    if kind == "picture":
+        w, h = image.size
+        return [{"bbox": [0, 0, w, h], "category": "Picture"}]
+    return []
+
+
+
+# --------------------
+# Adaptive resolution
+# --------------------
+
+# Text line height (in model input pixels) the budget keeps: about one merged
+# 28px patch row per line, with room for Arabic ascenders and diacritics
+ADAPTIVE_LINE_PX = 32
+LINE_ANALYSIS_SIDE = 1024   # finer copy than ANALYSIS_SIDE: body lines are a few pixels high
+LINE_INK_RATIO = 0.01       # rows with this much ink belong to a text line
+MIN_LINES = 3               # fewer measured lines: keep the full budget
+CROP_MARGIN = 0.02          # kept around the ink box, as a share of the long side
+
+
+def line_height(image: Image.Image) -> Tuple[float, int]:
+    """
+    Median text line height in the image's pixels, from runs of inked rows
+    of a downsampled copy, and the number of lines measured. Touching lines
+    merge into one run, which only overestimates the height.
+    """
+    gray = to_analysis_gray(image, side=LINE_ANALYSIS_SIDE)
+    ink = gray < int(np.percentile(gray, 90)) - INK_CONTRAST
+    rows = np.concatenate(([0], (ink.mean(axis=1) > LINE_INK_RATIO).astype(np.int8), [0]))
+    edges = np.diff(rows)
+    runs = np.nonzero(edges == -1)[0] - np.nonzero(edges == 1)[0]
+    runs = runs[runs >= 2]
+    if not runs.size:
+        return 0.0, 0
+    return float(np.median(runs)) * image.height / gray.shape[0], int(runs.size)
+
+
+def adaptive_budget(
+    image: Image.Image,
+    line_px: int = ADAPTIVE_LINE_PX,
+    max_pixels: int = MAX_PIXELS,
+) -> Tuple[Tuple[int, int, int, int], int]:
+    """
+    The region worth sending (the ink box plus a margin) and the smallest
+    pixel budget that keeps its text lines about line_px high. Sparse halves
+    shrink to their few lines, large print is scaled down; the budget never
+    exceeds max_pixels and is max_pixels when no lines can be measured.
+    """
+    w, h = image.size
+    x1, y1, x2, y2 = content_box(image, trim=0.0)
+    pad = int(CROP_MARGIN * max(w, h))
+    box = (max(0, x1 - pad), max(0, y1 - pad), min(w, x2 + pad), min(h, y2 + pad))
+    region = image.crop(box)
+
+    height, lines = line_height(region)
+    area = region.width * region.height
+    if lines < MIN_LINES or height <= 0:
+        return box, min(area, max_pixels)
+    scale = min(1.0, line_px / height)
+    return box, int(min(max(area * scale * scale, MIN_PIXELS), max_pixels))
+
+
+def vision_tokens(width: int, height: int, min_pixels: int = MIN_PIXELS, max_pixels: int = MAX_PIXELS) -> int:
+    """
+    Image tokens the model spends on an image of this size (one per 28x28 merged patch).
+    """
+    h, w = smart_resize(height, width, min_pixels=min_pixels, max_pixels=max_pixels)
+    return (h // IMAGE_FACTOR) * (w // IMAGE_FACTOR)
+
+
+# --------------------
+# Perceptual hashing
+# --------------------
+
+def dhash(image: Image.Image, width: int = 8, height: int = 8) -> int:
+    """
+    Difference hash: one bit per horizontally adjacent pair of a tiny grayscale
+    copy (width x height bits), set where brightness increases. Robust to
+    rescans and resampling; wide strips such as running headers hash better
+    with a wide grid.
+    """
+    gray = image.convert("L").resize((width + 1, height), Image.Resampling.BOX)
+    pixels = np.asarray(gray, dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).ravel()
+    return int(np.packbits(bits).tobytes().hex(), 16)
+
+
+PHASH_SIZE = 64   # grayscale copy the DCT runs on
+PHASH_BITS = 16   # lowest PHASH_BITS x PHASH_BITS frequencies: a 256-bit hash
+
+
+def _dct_matrix(n: int) -> np.ndarray:
+    k = np.arange(n)
+    return np.cos(np.pi * (2 * k[None, :] + 1) * k[:, None] / (2 * n))
+
+
+def content_box(image: Image.Image, trim: float = 0.01) -> Tuple[int, int, int, int]:
+    """
+    Bounding box of the ink, in the image's pixels, found on the small
+    analysis copy. The outermost `trim` share of the ink on each side is
+    left out, so specks, page numbers and scanner edges do not move it.
+    The whole image if blank.
+    """
+    gray = to_analysis_gray(image)
+    ink = gray < int(np.percentile(gray, 90)) - INK_CONTRAST
+    total = int(ink.sum())
+    if not total:
+        return 0, 0, image.width, image.height
+
+    def span(mass: np.ndarray) -> Tuple[int, int]:
+        cumulative = np.cumsum(mass) / total
+        return int(np.searchsorted(cumulative, trim, side="right")), int(np.searchsorted(cumulative, 1 - trim - 1e-9)) + 1
+
+    x1, x2 = span(ink.sum(axis=0))
+    y1, y2 = span(ink.sum(axis=1))
+    sx, sy = image.width / gray.shape[1], image.height / gray.shape[0]
+    return int(x1 * sx), int(y1 * sy), int(x2 * sx), int(y2 * sy)
+
+
+def phash(image: Image.Image, size: int = PHASH_SIZE, bits: int = PHASH_BITS) -> int:
+    """
+    DCT perceptual hash of the inked area: one bit per low frequency, set
+    where it is above the median. Cropping to the ink first makes re-scans
+    with other margins, resolutions or paper tones hash alike.
+    """
+    gray = image.convert("L").crop(content_box(image)).resize((size, size), Image.Resampling.BOX)
+    dct = _dct_matrix(size)
+    coefficients = (dct @ np.asarray(gray, dtype=np.float64) @ dct.T)[:bits, :bits].ravel()
+    return int(np.packbits(coefficients > np.median(coefficients[1:])).tobytes().hex(), 16)
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
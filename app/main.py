@@ -1,6 +1,7 @@
 from fastapi import FastAPI
 # from model.dots_ocr_4b import ocr_app
 from app.ui import ui as ui_app  # make sure in ui.py you named it `ui = FastAPI()`
+from app.metrics import metrics_response
 
 # This is the FastAPI instance uvicorn will look for
 app = FastAPI()
@@ -8,10 +9,17 @@ app = FastAPI()
 # # # Mount the OCR API at /api
 # app.mount("/api", ocr_app)
 
-# Mount the UI at /
-app.mount("/", ui_app)
-
 # Optional: simple healthcheck
 @app.get("/health")
 async def health():
     return {"status": "ok"}
+
+
+# Prometheus scrape endpoint (also covers the OCR model when it is mounted above)
+@app.get("/metrics")
+async def metrics():
+    return metrics_response()
+
+
+# Mount the UI at / last, a root mount shadows every route registered after it
+app.mount("/", ui_app)
@@ -0,0 +1,151 @@
+import threading
+from typing import Optional
+
+try:  # metrics are optional: without prometheus_client every metric is a no-op
+    from prometheus_client import (
+        CONTENT_TYPE_LATEST,
+        REGISTRY,
+        Counter,
+        Gauge,
+        Histogram,
+        generate_latest,
+        push_to_gateway,
+    )
+except ImportError:
+    Counter = Gauge = Histogram = None
+
+from fastapi import Response
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+TOKEN_BUCKETS = (64, 256, 512, 1024, 2048, 4096, 8192, 16384)
+THROUGHPUT_BUCKETS = (1, 2, 5, 10, 20, 30, 50, 75, 100, 150, 200, 300)
+
+
+class _NoopMetric:
+    """Stands in for a prometheus metric when prometheus_client is missing"""
+
+    def labels(self, *args, **kwargs):
+        return self
+
+    def inc(self, amount=1):
+        pass
+
+    def dec(self, amount=1):
+        pass
+
+    def set(self, value):
+        pass
+
+    def observe(self, value):
+        pass
+
+    def time(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def __call__(self, fn):
+        return fn
+
+
+def _histogram(name: str, doc: str, labels=(), buckets=LATENCY_BUCKETS):
+    if Histogram is None:
+        return _NoopMetric()
+    return Histogram(name, doc, labels, buckets=buckets)
+
+
+def _counter(name: str, doc: str, labels=()):
+    if Counter is None:
+        return _NoopMetric()
+    return Counter(name, doc, labels)
+
+
+def _gauge(name: str, doc: str, labels=()):
+    if Gauge is None:
+        return _NoopMetric()
+    return Gauge(name, doc, labels)
+
+
+# --------------------
+# OCR server (model.dots_ocr_4b)
+# --------------------
+
+OCR_REQUESTS = _counter("ocr_requests_total", "Inference requests handled", ["status"])
+OCR_QUEUE_WAIT = _histogram("ocr_queue_wait_seconds", "Time a request waited for the model")
+OCR_PREPROCESS = _histogram("ocr_preprocess_seconds", "Chat template, vision preprocessing and host to device copy")
+OCR_PREPROCESS_HIDDEN = _histogram("ocr_preprocess_hidden_seconds", "Preprocessing time that overlapped another request's generate")
+OCR_GENERATE = _histogram("ocr_generate_seconds", "model.generate wall time")
+OCR_TOKENS_PER_SECOND = _histogram(
+    "ocr_generated_tokens_per_second", "Generated tokens / generate seconds per request", buckets=THROUGHPUT_BUCKETS
+)
+OCR_DRAFT_TOKENS = _counter("ocr_draft_tokens_total", "Speculative draft tokens, accepted or rejected by the model", ["result"])
+OCR_INPUT_TOKENS = _histogram("ocr_input_tokens", "Prompt tokens per request (text + vision)", buckets=TOKEN_BUCKETS)
+OCR_OUTPUT_TOKENS = _histogram("ocr_output_tokens", "Generated tokens per request", buckets=TOKEN_BUCKETS)
+OCR_PARSE_FAILURES = _counter("ocr_output_parse_failures_total", "Model outputs that were not valid layout JSON", ["where"])
+OCR_QUEUE_DEPTH = _gauge("ocr_queue_depth", "Generate calls waiting for the model")
+OCR_COST_RATIO = _histogram(
+    "ocr_cost_prediction_ratio", "Generate seconds over the scheduler's prediction", buckets=(0.25, 0.5, 0.8, 1.25, 2, 4)
+)
+
+# --------------------
+# Replica router (model.replicas)
+# --------------------
+
+ROUTER_REQUESTS = _counter("router_requests_total", "Requests forwarded per replica", ["replica", "status"])
+ROUTER_INFLIGHT = _gauge("router_inflight", "Requests in flight per replica", ["replica"])
+ROUTER_WAIT = _histogram("router_wait_seconds", "Time a request waited for a replica slot")
+ROUTER_RESTARTS = _counter("router_replica_restarts_total", "Replica restarts", ["replica", "reason"])
+
+# --------------------
+# ETL
+# --------------------
+
+ETL_STAGE_SECONDS = _histogram("etl_stage_seconds", "Time per ETL stage call", ["stage"])
+ETL_PAGES = _counter("etl_pages_total", "Pages completed", ["source"])
+ETL_HALVES = _counter("etl_halves_total", "Half pages completed", ["outcome"])
+ETL_VISION_TOKENS = _counter(
+    "etl_vision_tokens_total", "Vision tokens uploaded (sent) and at the fixed MAX_PIXELS budget (fixed)", ["budget"]
+)
+ETL_MEMO_BLOCKS = _counter("etl_memoized_blocks_total", "Running header/footer blocks masked out and re-synthesized", ["category"])
+DB_WRITE_SECONDS = _histogram("db_write_seconds", "SQLite write latency", ["op"])
+
+
+def metrics_response() -> Response:
+    """
+    Prometheus text exposition for a /metrics endpoint.
+    """
+    if Histogram is None:
+        return Response("# prometheus_client is not installed\n", media_type="text/plain")
+    return Response(generate_latest(REGISTRY), media_type=CONTENT_TYPE_LATEST)
+
+
+def push_metrics(gateway: str, job: str = "arabic_chrono_etl"):
+    if Histogram is not None:
+        push_to_gateway(gateway, job=job, registry=REGISTRY)
+
+
+def start_pusher(gateway: str, job: str = "arabic_chrono_etl", interval: float = 15.0) -> Optional[threading.Event]:
+    """
+    Push the ETL's metrics to a Prometheus Pushgateway every interval seconds
+    from a daemon thread. Set the returned event to stop; call push_metrics
+    once more at exit so the last values are not lost.
+    """
+    if Histogram is None:
+        print("[METRICS] prometheus_client is not installed, not pushing")
+        return None
+
+    stop = threading.Event()
+
+    def run():
+        while not stop.wait(interval):
+            try:
+                push_metrics(gateway, job)
+            except OSError as e:
+                print(f"[METRICS] Push to {gateway} failed: {e}")
+
+    threading.Thread(target=run, name="metrics-pusher", daemon=True).start()
+    return stop
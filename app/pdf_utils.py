@@ -2,7 +2,23 @@ from pdf2image import convert_from_path
 from PIL import Image
 from pathlib import Path
 from typing import Generator
-from typing import Optional
+from typing import List, Optional
+
+from app.image_utils import smart_resize, to_color_mode
+from app.timing import stage
+
+try:  # PyMuPDF renders halves straight from the PDF; pdf2image is the fallback
+    import fitz
+except ImportError:
+    fitz = None
+
+
+def pdf_page_count(pdf_path: str) -> int:
+    if fitz is not None:
+        with fitz.open(pdf_path) as doc:
+            return doc.page_count
+    from pdf2image import pdfinfo_from_path
+    return int(pdfinfo_from_path(pdf_path)["Pages"])
 
 def pdf_to_pages(
     pdf_path: str, 
@@ -20,11 +36,12 @@ def pdf_to_pages(
             break
         
         try:
-            pages = convert_from_path(
-                pdf_path, dpi=dpi,
-                first_page=page_number,
-                last_page=page_number
-            )
+            with stage("render", page=page_number):
+                pages = convert_from_path(
+                    pdf_path, dpi=dpi,
+                    first_page=page_number,
+                    last_page=page_number
+                )
             if not pages:
                 break
             yield pages[0]
@@ -37,8 +54,9 @@ def slice_page(page_img: Image.Image, order: str = "right_first"):
     Slice a page into two halves and yield them in the desired order.
     """
     w, h = page_img.size
-    left = page_img.crop((0, 0, w // 2, h))
-    right = page_img.crop((w // 2, 0, w, h))
+    with stage("slice"):
+        left = page_img.crop((0, 0, w // 2, h))
+        right = page_img.crop((w // 2, 0, w, h))
 
     if order == "right_first":
         yield right
@@ -62,4 +80,67 @@ def pdf_to_slices(
     """
     for page in pdf_to_pages(pdf_path, dpi=dpi, from_page=from_page, to_page=to_page):
         for half in slice_page(page, order=order):
-            yield half
\ No newline at end of file
+            yield half
+
+
+def _render_clip(page, clip, dpi: int, max_pixels: Optional[int], color_mode: str = "rgb") -> Image.Image:
+    """
+    Rasterize one clip rectangle of a fitz page into its own pixmap.
+    With max_pixels, the scale is chosen up front so the pixmap already has
+    the model's smart_resize geometry; its size at dpi is kept in
+    image.info["dpi_size"] so bboxes can be stored in dpi pixels. Gray and
+    bilevel modes render a single-channel pixmap.
+    """
+    zoom = dpi / 72
+    dpi_size = (round(clip.width * zoom), round(clip.height * zoom))
+    if max_pixels:
+        height, width = smart_resize(dpi_size[1], dpi_size[0], max_pixels=max_pixels)
+        mat = fitz.Matrix(width / clip.width, height / clip.height)
+    else:
+        mat = fitz.Matrix(zoom, zoom)
+    if color_mode == "rgb":
+        pm = page.get_pixmap(matrix=mat, clip=clip, alpha=False)
+        image = Image.frombytes("RGB", (pm.width, pm.height), pm.samples)
+    else:
+        pm = page.get_pixmap(matrix=mat, clip=clip, colorspace=fitz.csGRAY, alpha=False)
+        image = to_color_mode(Image.frombytes("L", (pm.width, pm.height), pm.samples), color_mode)
+    image.info["dpi_size"] = dpi_size
+    return image
+
+
+def pdf_to_halves(
+    pdf_path: str,
+    dpi: int = 300,
+    order: str = "right_first",
+    from_page: int = 1,
+    to_page: Optional[int] = None,
+    max_pixels: Optional[int] = None,
+    color_mode: str = "rgb",
+) -> Generator[List[Image.Image], None, None]:
+    """
+    Render each page's two halves directly with MuPDF clip rectangles.
+    Yields one [first, second] pair per page, in the desired order.
+    Never holds a full-page raster, and no crop copies are made.
+    color_mode is "rgb", "gray" or "bilevel" (see app.image_utils.to_color_mode).
+    Falls back to pdf_to_pages + slice_page when PyMuPDF is missing.
+    """
+    if fitz is None:
+        # pdf_to_pages times the rasterization as "render"
+        for page_img in pdf_to_pages(pdf_path, dpi=dpi, from_page=from_page, to_page=to_page):
+            with stage("color"):
+                page_img = to_color_mode(page_img, color_mode)
+            yield list(slice_page(page_img, order=order))
+        return
+
+    with fitz.open(pdf_path) as doc:
+        last = doc.page_count if to_page is None else min(to_page, doc.page_count)
+        for page_number in range(from_page, last + 1):
+            page = doc[page_number - 1]
+            r = page.rect
+            mid = r.x0 + r.width / 2
+            left = fitz.Rect(r.x0, r.y0, mid, r.y1)
+            right = fitz.Rect(mid, r.y0, r.x1, r.y1)
+            clips = [right, left] if order == "right_first" else [left, right]
+            with stage("render", page=page_number):
+                halves = [_render_clip(page, clip, dpi, max_pixels, color_mode) for clip in clips]
+            yield halves
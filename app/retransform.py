@@ -0,0 +1,136 @@
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from app import db, etl_pipeline
+from app.aggregator import aggregate_blocks
+from app.db import get_raw_results, iter_book_blocks, list_books, upsert_books
+from app.etl_pipeline import checkpoint_files, checkpoint_page
+
+SOURCES = ("auto", "checkpoints", "db")
+
+
+# --------------------
+# Stored OCR output
+# --------------------
+
+def blocks_from_checkpoints(pdf_path: str) -> Iterator[Dict[str, Any]]:
+    """
+    Stream a book's blocks from its per-page checkpoints, in page order.
+    Unlike load_checkpoints nothing is dropped: the last page is as good as any.
+    """
+    for f in checkpoint_files(pdf_path):
+        page = checkpoint_page(f)
+        for block in json.loads(f.read_text(encoding="utf-8")):
+            block.setdefault("page", page)
+            yield block
+
+
+def blocks_from_db(pdf_path: str) -> Iterator[Dict[str, Any]]:
+    """
+    Stream a book's blocks from ocr_blocks, one half at a time.
+    Books extracted before per-half storage fall back to ocr_results.
+    """
+    found = False
+    for _, _, blocks in iter_book_blocks(pdf_path):
+        found = True
+        yield from blocks
+    if not found:
+        yield from _blocks_from_raw_results(pdf_path)
+
+
+def _blocks_from_raw_results(pdf_path: str) -> Iterator[Dict[str, Any]]:
+    # a resumed run stored one row per extracted range; when two rows cover
+    # the same page the later one wins, as it does for the checkpoints
+    pages: Dict[int, List[Dict[str, Any]]] = {}
+    for row in get_raw_results(pdf_path):
+        row_pages: Dict[int, List[Dict[str, Any]]] = {}
+        for block in json.loads(row):
+            row_pages.setdefault(block.get("page", 0), []).append(block)
+        pages.update(row_pages)
+    for page in sorted(pages):
+        yield from pages[page]
+
+
+def book_blocks(pdf_path: str, source: str = "auto") -> Tuple[str, Iterable[Dict[str, Any]]]:
+    """
+    Pick the block source for a book: "auto" prefers checkpoints and
+    falls back to the DB. Returns (source used, blocks).
+    """
+    if source not in SOURCES:
+        raise ValueError(f"source must be one of {SOURCES}, got {source!r}")
+    if source == "checkpoints" or (source == "auto" and checkpoint_files(pdf_path)):
+        return "checkpoints", blocks_from_checkpoints(pdf_path)
+    return "db", blocks_from_db(pdf_path)
+
+
+# --------------------
+# Parallel rebuild
+# --------------------
+
+def _init_worker(db_path: str, checkpoint_dir: str):
+    # spawned workers re-import the modules: carry over paths set by the caller
+    db.DB_PATH = Path(db_path)
+    etl_pipeline.CHECKPOINT_DIR = Path(checkpoint_dir)
+
+
+def rebuild_book(pdf_path: str, source: str = "auto") -> Dict[str, Any]:
+    """
+    Re-run aggregation over a book's stored blocks (no model, no DB writes).
+    """
+    start = time.perf_counter()
+    used, blocks = book_blocks(pdf_path, source)
+    blocks = list(blocks)
+    events = aggregate_blocks(blocks)
+    return {
+        "book": pdf_path,
+        "source": used,
+        "blocks": len(blocks),
+        "events": events,
+        "seconds": time.perf_counter() - start,
+    }
+
+
+def retransform(books: Optional[List[str]] = None, source: str = "auto", workers: Optional[int] = None) -> Dict[str, int]:
+    """
+    Rebuild events from stored OCR output for the given books (default: all
+    books known to the DB), aggregating books in parallel, then load the
+    diff for every rebuilt book in one transaction (manual edits survive).
+    Returns {book: event count}.
+    """
+    books = books or list_books()
+    if not books:
+        print("[RETRANSFORM] No books to rebuild")
+        return {}
+
+    start = time.perf_counter()
+    results = []
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_init_worker,
+        initargs=(str(db.DB_PATH), str(etl_pipeline.CHECKPOINT_DIR)),
+    ) as pool:
+        for r in pool.map(rebuild_book, books, [source] * len(books)):
+            print(
+                f"[RETRANSFORM] {r['book']}: {r['blocks']} blocks from {r['source']} "
+                f"→ {len(r['events'])} events ({r['seconds']:.2f}s)"
+            )
+            results.append(r)
+
+    empty = [r["book"] for r in results if not r["blocks"]]
+    if empty:
+        # no stored output: keep whatever events these books have
+        print(f"[RETRANSFORM] No stored OCR output for {len(empty)} book(s), leaving their events: {empty}")
+    rebuilt = {r["book"]: r["events"] for r in results if r["blocks"]}
+
+    counts = upsert_books(rebuilt)
+    for book, c in counts.items():
+        changed = c["inserted"] + c["updated"] + c["restored"] + c["tombstoned"]
+        print(f"[RETRANSFORM] {book}: {changed} rows changed {c}")
+    print(
+        f"[RETRANSFORM] Loaded events for {len(rebuilt)} book(s) "
+        f"in {time.perf_counter() - start:.2f}s"
+    )
+    return {book: len(events) for book, events in rebuilt.items()}
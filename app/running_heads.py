@@ -0,0 +1,131 @@
+"""
+Running header/footer memoization across the pages of one book.
+
+Every page repeats the same running header (often a footer too), which the
+model transcribes each time and aggregate_blocks then drops. Once a
+Page-header/Page-footer block has come back at the same place, with the
+same text and a matching perceptual hash of its crop, on LEARN_PAGES halves
+of the same side, later halves are checked against it before upload: if the
+crop still hashes the same, the region is painted white and the block is
+re-synthesized from the cached text, so the output keeps its usual shape.
+
+Headers with changing text (page numbers, chapter titles) are never learned.
+Bboxes must be in the half's own pixels (presized uploads).
+"""
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Any, Dict, List, Tuple
+
+from PIL import Image, ImageDraw
+
+from app.image_utils import dhash, hamming
+
+CATEGORIES = ("Page-header", "Page-footer")
+LEARN_PAGES = 3             # halves of one side a region must repeat on before it is masked
+POSITION_TOLERANCE = 0.02   # per bbox edge, as a share of the half's width/height
+HASH_GRID = (16, 4)         # dhash bits (width x height) for wide strips
+HASH_DISTANCE = 5           # of the 64 bits
+MASK_MARGIN = 4             # pixels painted around a masked bbox
+MAX_CANDIDATES = 16         # regions tracked per side
+
+
+@dataclass
+class RunningRegion:
+    category: str
+    bbox: List[int]
+    text: str
+    hash: int
+    seen: int = 1
+
+
+def _clamp(bbox: List[Any], size: Tuple[int, int]) -> List[int]:
+    x1, y1, x2, y2 = (int(v) for v in bbox)
+    w, h = size
+    return [max(0, min(x1, w)), max(0, min(y1, h)), max(0, min(x2, w)), max(0, min(y2, h))]
+
+
+def _crop_hash(image: Image.Image, bbox: List[int]) -> int:
+    return dhash(image.crop(tuple(bbox)), *HASH_GRID)
+
+
+def _overlaps(a: List[Any], b: List[Any]) -> bool:
+    return a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]
+
+
+class RunningHeads:
+    """
+    Learned running regions of one book, per half side (1 = right, 2 = left).
+    """
+
+    def __init__(self, learn_pages: int = LEARN_PAGES):
+        self.learn_pages = learn_pages
+        self.regions: Dict[int, List[RunningRegion]] = defaultdict(list)
+        self.masked = 0
+
+    def _close(self, a: List[int], b: List[int], size: Tuple[int, int]) -> bool:
+        tol_x, tol_y = POSITION_TOLERANCE * size[0], POSITION_TOLERANCE * size[1]
+        return all(abs(u - v) <= (tol_x if i % 2 == 0 else tol_y) for i, (u, v) in enumerate(zip(a, b)))
+
+    def observe(self, side: int, half: Image.Image, blocks: List[Dict[str, Any]]):
+        """
+        Count the header/footer blocks the model returned for an unmasked region of this half.
+        """
+        for b in blocks:
+            if not isinstance(b, dict) or b.get("category") not in CATEGORIES or not b.get("text"):
+                continue
+            bbox = b.get("bbox")
+            if not isinstance(bbox, list) or len(bbox) != 4:
+                continue
+            bbox = _clamp(bbox, half.size)
+            if bbox[2] <= bbox[0] or bbox[3] <= bbox[1]:
+                continue
+            h = _crop_hash(half, bbox)
+            if not h:  # blank crop: would match any blank area
+                continue
+            for r in self.regions[side]:
+                if (r.category == b["category"] and r.text == b["text"] and self._close(r.bbox, bbox, half.size)
+                        and hamming(r.hash, h) <= HASH_DISTANCE):
+                    r.seen += 1
+                    break
+            else:
+                self.regions[side].append(RunningRegion(b["category"], bbox, b["text"], h))
+        if len(self.regions[side]) > MAX_CANDIDATES:
+            self.regions[side] = sorted(self.regions[side], key=lambda r: -r.seen)[:MAX_CANDIDATES]
+
+    def mask(self, side: int, half: Image.Image) -> Tuple[Image.Image, List[Dict[str, Any]]]:
+        """
+        The half with every still-matching learned region painted white, and
+        the blocks standing in for them. The half itself is not modified.
+        """
+        masked, blocks = half, []
+        for r in self.regions[side]:
+            if r.seen < self.learn_pages or hamming(_crop_hash(half, r.bbox), r.hash) > HASH_DISTANCE:
+                continue
+            if masked is half:
+                masked = half.copy()
+            x1, y1, x2, y2 = r.bbox
+            ImageDraw.Draw(masked).rectangle(
+                (x1 - MASK_MARGIN, y1 - MASK_MARGIN, x2 + MASK_MARGIN, y2 + MASK_MARGIN), fill="white"
+            )
+            blocks.append({"bbox": list(r.bbox), "category": r.category, "text": r.text})
+        self.masked += len(blocks)
+        return masked, blocks
+
+
+def merge(blocks: List[Dict[str, Any]], memo: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    The model's blocks with the memoized ones put back in reading order:
+    headers first, footers last. Anything the model still returned of the
+    same category over a masked region is replaced.
+    """
+    if not memo:
+        return blocks
+    kept = [
+        b for b in blocks
+        if not (isinstance(b, dict) and isinstance(b.get("bbox"), list) and len(b["bbox"]) == 4 and any(
+            m["category"] == b.get("category") and _overlaps(m["bbox"], b["bbox"]) for m in memo
+        ))
+    ]
+    headers = [m for m in memo if m["category"] == "Page-header"]
+    footers = [m for m in memo if m["category"] == "Page-footer"]
+    return headers + kept + footers
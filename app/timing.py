@@ -0,0 +1,44 @@
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Dict
+
+from app.metrics import ETL_STAGE_SECONDS
+from app.tracing import span
+
+# Wall-clock seconds and call counts per pipeline stage
+# (render, slice, encode, request, transform, load ...)
+STAGE_SECONDS: Dict[str, float] = defaultdict(float)
+STAGE_CALLS: Dict[str, int] = defaultdict(int)
+
+
+@contextmanager
+def stage(name: str, **attrs):
+    """
+    Time a block of pipeline work under a stage name.
+    Also records a tracing span with the given attrs.
+    """
+    start = time.perf_counter()
+    try:
+        with span(name, **attrs):
+            yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS[name] += elapsed
+        STAGE_CALLS[name] += 1
+        ETL_STAGE_SECONDS.labels(stage=name).observe(elapsed)
+
+
+def reset_stage_times():
+    STAGE_SECONDS.clear()
+    STAGE_CALLS.clear()
+
+
+def stage_times() -> Dict[str, Dict[str, float]]:
+    """
+    Snapshot of {stage: {"seconds": total, "calls": n}}.
+    """
+    return {
+        name: {"seconds": STAGE_SECONDS[name], "calls": STAGE_CALLS[name]}
+        for name in STAGE_SECONDS
+    }
@@ -0,0 +1,134 @@
+import atexit
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+# Spans are appended to a local JSONL file, one object per line:
+# {"trace_id", "span_id", "parent_id", "name", "start", "duration", "attrs"}
+# Off unless TRACE_FILE is set (e.g. TRACE_FILE=data/traces.jsonl).
+TRACE_FILE = os.environ.get("TRACE_FILE", "")
+TRACE_FLUSH_SECONDS = 1.0  # buffered spans reach the file at least this often
+TRACE_HEADER = "X-Trace-Id"
+PARENT_SPAN_HEADER = "X-Parent-Span-Id"
+
+_trace_id: ContextVar[Optional[str]] = ContextVar("trace_id", default=None)
+_span_id: ContextVar[Optional[str]] = ContextVar("span_id", default=None)
+_attrs: ContextVar[Dict[str, Any]] = ContextVar("trace_attrs", default={})
+_span_attrs: ContextVar[Optional[Dict[str, Any]]] = ContextVar("span_attrs", default=None)
+_write_lock = threading.Lock()
+_handle = None  # (path, open file), reopened when TRACE_FILE changes
+_last_flush = 0.0
+
+
+def _new_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+def _export(record: Dict[str, Any]):
+    global _handle, _last_flush
+    line = json.dumps(record, ensure_ascii=False)
+    with _write_lock:
+        if _handle is None or _handle[0] != TRACE_FILE:
+            if _handle is not None:
+                _handle[1].close()
+            path = Path(TRACE_FILE)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            _handle = (TRACE_FILE, path.open("a", encoding="utf-8"))
+        _handle[1].write(line + "\n")
+        now = time.monotonic()
+        if now - _last_flush >= TRACE_FLUSH_SECONDS:
+            _handle[1].flush()
+            _last_flush = now
+
+
+@atexit.register
+def flush():
+    """
+    Write buffered spans to TRACE_FILE, e.g. before reading it back.
+    """
+    with _write_lock:
+        if _handle is not None:
+            _handle[1].flush()
+
+
+@contextmanager
+def trace_context(trace_id: Optional[str] = None, parent_id: Optional[str] = None, **attrs):
+    """
+    Start (or continue, when trace_id comes from a request header) a trace.
+    attrs such as book/page/half are attached to every span inside it.
+    """
+    tokens = (
+        _trace_id.set(trace_id or _new_id()),
+        _span_id.set(parent_id),
+        _attrs.set({**_attrs.get(), **attrs}),
+    )
+    try:
+        yield _trace_id.get()
+    finally:
+        _attrs.reset(tokens[2])
+        _span_id.reset(tokens[1])
+        _trace_id.reset(tokens[0])
+
+
+@contextmanager
+def span(name: str, **attrs):
+    """
+    Record a span for the enclosed block. Outside a trace context a new
+    trace is started so nothing is lost. A no-op while TRACE_FILE is unset.
+    """
+    if not TRACE_FILE:
+        yield None
+        return
+    trace_token = None
+    if _trace_id.get() is None:
+        trace_token = _trace_id.set(_new_id())
+    span_id = _new_id()
+    parent_id = _span_id.get()
+    span_token = _span_id.set(span_id)
+    attrs_token = _span_attrs.set(attrs)
+    start = time.time()
+    t0 = time.perf_counter()
+    try:
+        yield span_id
+    finally:
+        duration = time.perf_counter() - t0
+        _span_attrs.reset(attrs_token)
+        _span_id.reset(span_token)
+        _export({
+            "trace_id": _trace_id.get(),
+            "span_id": span_id,
+            "parent_id": parent_id,
+            "name": name,
+            "start": start,
+            "duration": duration,
+            "attrs": {**_attrs.get(), **attrs},
+        })
+        if trace_token is not None:
+            _trace_id.reset(trace_token)
+
+
+def annotate(**attrs):
+    """
+    Add attributes to the innermost open span, for values only known at its end.
+    """
+    current = _span_attrs.get()
+    if current is not None:
+        current.update(attrs)
+
+
+def trace_headers() -> Dict[str, str]:
+    """
+    Headers that carry the current trace to the OCR server.
+    """
+    headers = {}
+    if _trace_id.get():
+        headers[TRACE_HEADER] = _trace_id.get()
+    if _span_id.get():
+        headers[PARENT_SPAN_HEADER] = _span_id.get()
+    return headers
@@ -1,12 +1,79 @@
-from fastapi import FastAPI, Request, Form
-from fastapi.responses import RedirectResponse
+import base64
+import hashlib
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from fastapi import FastAPI, HTTPException, Query, Request, Form
+from fastapi.responses import HTMLResponse, JSONResponse, RedirectResponse, Response, StreamingResponse
 from fastapi.templating import Jinja2Templates
-from app.db import get_events, get_event_by_id, update_event
+from app.db import (
+    EVENT_FIELDS,
+    TIMELINE_GRANULARITIES,
+    get_events_page,
+    get_event_by_id,
+    get_events_version,
+    get_timeline,
+    run_db,
+    update_event,
+)
+from app.export import EXPORT_FORMATS, export_events, export_filename, pa
 
 ui = FastAPI()
 
 templates = Jinja2Templates(directory="app/templates")
 
+# Rendered /results pages keyed by (from_date, to_date), newest last.
+# Entries carry the events version they were rendered at: an ETL or
+# retransform in another process bumps the version and makes them stale.
+RESULTS_CACHE_SIZE = 256
+RESULTS_CACHE: "OrderedDict[Tuple[Optional[str], Optional[str]], Tuple[int, bytes]]" = OrderedDict()
+
+# Events per /results page and per /api/events call
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+
+def results_etag(version: int, *query) -> str:
+    key = hashlib.sha1("|".join(map(str, query)).encode("utf-8")).hexdigest()[:12]
+    return f'"{version}-{key}"'
+
+
+def encode_cursor(event) -> str:
+    return base64.urlsafe_b64encode(f"{event['date']}|{event['id']}".encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> Tuple[str, int]:
+    try:
+        date, _, event_id = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8").rpartition("|")
+        return date, int(event_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="invalid cursor")
+
+
+def parse_fields(fields: Optional[str]) -> Tuple[str, ...]:
+    if not fields:
+        return EVENT_FIELDS
+    selected = tuple(f.strip() for f in fields.split(",") if f.strip())
+    unknown = [f for f in selected if f not in EVENT_FIELDS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"unknown fields {unknown}, choose from {list(EVENT_FIELDS)}")
+    return selected
+
+
+async def fetch_page(from_date, to_date, after=None, limit=PAGE_SIZE, fields=EVENT_FIELDS):
+    """
+    A page of events plus the cursor of the next one (None on the last page).
+    """
+    rows = await run_db(
+        get_events_page, from_date=from_date, to_date=to_date, after=after, limit=limit + 1, fields=fields
+    )
+    next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+
+def invalidate_results_cache():
+    RESULTS_CACHE.clear()
+
 
 @ui.get("/")
 async def index(request: Request):
@@ -20,11 +87,121 @@ async def index(request: Request):
 async def results(request: Request, from_date: str = None, to_date: str = None):
     """
     Search results page: query events by date range.
+    Only the first PAGE_SIZE events are rendered; the page fetches the rest
+    from /api/events as the user scrolls.
+    Pages are cached per query and revalidated with ETag / If-None-Match.
     """
-    events = get_events(from_date=from_date, to_date=to_date)
-    return templates.TemplateResponse(
+    version = await run_db(get_events_version)
+    etag = results_etag(version, from_date, to_date)
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+
+    key = (from_date, to_date)
+    cached = RESULTS_CACHE.get(key)
+    if cached and cached[0] == version:
+        RESULTS_CACHE.move_to_end(key)
+        return HTMLResponse(cached[1], headers=headers)
+
+    events, next_cursor = await fetch_page(from_date, to_date)
+    page = templates.TemplateResponse(
         "results.html",
-        {"request": request, "events": events, "from_date": from_date, "to_date": to_date},
+        {
+            "request": request,
+            "events": events,
+            "next_cursor": next_cursor,
+            "from_date": from_date,
+            "to_date": to_date,
+        },
+        headers=headers,
+    )
+    RESULTS_CACHE[key] = (version, page.body)
+    RESULTS_CACHE.move_to_end(key)
+    while len(RESULTS_CACHE) > RESULTS_CACHE_SIZE:
+        RESULTS_CACHE.popitem(last=False)
+    return page
+
+
+@ui.get("/api/events")
+async def api_events(
+    request: Request,
+    from_date: str = None,
+    to_date: str = None,
+    after: str = None,
+    limit: int = Query(PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    fields: str = None,
+):
+    """
+    Events as JSON, ordered by (date, id), one page at a time.
+    after: the `next` cursor of the previous page.
+    fields: comma-separated subset of EVENT_FIELDS (id and date are always included).
+    """
+    selected = parse_fields(fields)
+    version = await run_db(get_events_version)
+    etag = results_etag(version, "api", from_date, to_date, after, limit, ",".join(selected))
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+
+    events, next_cursor = await fetch_page(
+        from_date, to_date, after=decode_cursor(after) if after else None, limit=limit, fields=selected
+    )
+    return JSONResponse({"events": events, "next": next_cursor}, headers=headers)
+
+
+@ui.get("/api/timeline")
+async def api_timeline(
+    request: Request,
+    granularity: str = "year",
+    from_date: str = None,
+    to_date: str = None,
+    source_pdf: str = None,
+    by_book: bool = False,
+):
+    """
+    Event counts per year, month or day (optionally per source book),
+    read from the precomputed rollups.
+    """
+    if granularity not in TIMELINE_GRANULARITIES:
+        raise HTTPException(status_code=400, detail=f"granularity must be one of {list(TIMELINE_GRANULARITIES)}")
+
+    version = await run_db(get_events_version)
+    etag = results_etag(version, "timeline", granularity, from_date, to_date, source_pdf, by_book)
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+
+    buckets = await run_db(
+        get_timeline, granularity, from_date=from_date, to_date=to_date, source_pdf=source_pdf, by_book=by_book
+    )
+    return JSONResponse({"granularity": granularity, "buckets": buckets}, headers=headers)
+
+
+@ui.get("/export")
+async def export(
+    from_date: str = None,
+    to_date: str = None,
+    format: str = "csv",
+    fields: str = None,
+    gzip: bool = False,
+):
+    """
+    Download events as CSV, JSONL or Parquet, streamed in chunks from a
+    server-side cursor (constant memory, first bytes right away).
+    gzip=true compresses CSV and JSONL; Parquet is compressed internally.
+    """
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {list(EXPORT_FORMATS)}")
+    if format == "parquet" and pa is None:
+        raise HTTPException(status_code=501, detail="Parquet export needs pyarrow on the server")
+
+    stream = export_events(format, from_date, to_date, fields=parse_fields(fields), gzip=gzip)
+    media_type = "application/gzip" if gzip and format != "parquet" else EXPORT_FORMATS[format][0]
+    filename = export_filename(format, from_date, to_date, gzip)
+    return StreamingResponse(
+        stream,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
     )
 
 
@@ -33,7 +210,7 @@ async def edit_event(request: Request, event_id: int):
     """
     Edit form for a specific event.
     """
-    event = get_event_by_id(event_id)
+    event = await run_db(get_event_by_id, event_id)
     if not event:
         return RedirectResponse("/", status_code=302)
     return templates.TemplateResponse("edit.html", {"request": request, "event": event})
@@ -44,5 +221,6 @@ async def save_event(event_id: int, new_text: str = Form(...)):
     """
     Save updated event text.
     """
-    update_event(event_id, new_text)
+    if await run_db(update_event, event_id, new_text):
+        invalidate_results_cache()
     return RedirectResponse(f"/edit/{event_id}", status_code=302)
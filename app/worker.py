@@ -0,0 +1,231 @@
+import asyncio
+import os
+import socket
+import time
+import traceback
+from itertools import groupby
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from app import etl_pipeline
+from app.aggregator import aggregate_blocks
+from app.db import (
+    claim_finished_books,
+    claim_units,
+    complete_unit,
+    enqueue_book,
+    fail_unit,
+    iter_book_blocks,
+    list_units,
+    prepare_db,
+    queue_status,
+    renew_leases,
+    upsert_events,
+)
+from app.duplicates import PageIndex
+from app.etl_pipeline import extract_half
+from app.image_utils import MAX_PIXELS
+from app.metrics import ETL_HALVES, ETL_PAGES
+from app.pdf_utils import pdf_page_count, pdf_to_halves
+from app.running_heads import RunningHeads
+from app.timing import stage
+from app.tracing import span, trace_context
+
+# A lease must outlive one OCR call; heartbeats renew it every LEASE_SECONDS / 3
+LEASE_SECONDS = 180.0
+# Units claimed per round trip: both halves of a page, rendered once
+CLAIM_BATCH = 2
+# Idle workers poll this often while other workers still hold leases
+POLL_SECONDS = 2.0
+
+# Running headers/footers learned by this worker, per book (memo_heads option)
+_running_heads: Dict[str, RunningHeads] = {}
+
+
+# --------------------
+# Producer
+# --------------------
+
+def enqueue_pdf(
+    pdf_path: str,
+    from_page: int = 1,
+    to_page: Optional[int] = None,
+    dpi: int = 300,
+    skip_blank: bool = True,
+    presize: bool = True,
+    color_mode: str = "rgb",
+    two_stage: bool = False,
+    memo_heads: bool = False,
+    dedup_distance: Optional[int] = None,
+    adaptive_line_px: Optional[int] = None,
+    blank_thresholds: Optional[Dict[str, float]] = None,
+) -> int:
+    """
+    Queue a book's (page, half) units for the workers.
+    The extract options are stored with the book so every worker uses the same ones.
+    """
+    count = pdf_page_count(pdf_path)
+    last = count if to_page is None else min(to_page, count)
+    if from_page < 1 or from_page > last:
+        raise ValueError(f"{pdf_path} has {count} pages, cannot enqueue from page {from_page}")
+    options = dict(dpi=dpi, skip_blank=skip_blank, presize=presize, color_mode=color_mode,
+                   two_stage=two_stage, memo_heads=memo_heads, dedup_distance=dedup_distance,
+                   adaptive_line_px=adaptive_line_px, blank_thresholds=blank_thresholds)
+    added = enqueue_book(str(pdf_path), range(from_page, last + 1), options)
+    print(f"[QUEUE] {pdf_path}: {added} units added for pages {from_page}-{last}")
+    return added
+
+
+# --------------------
+# Worker
+# --------------------
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+async def _heartbeat(units: List[Dict[str, Any]], lost: set, stop: asyncio.Event):
+    """
+    Renew the batch's leases until stopped; record tokens taken over by others.
+    """
+    while True:
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=LEASE_SECONDS / 3)
+            return
+        except asyncio.TimeoutError:
+            pending = [u["lease_token"] for u in units if u["lease_token"] not in lost]
+            lost.update(await asyncio.to_thread(renew_leases, pending, LEASE_SECONDS, time.time()))
+
+
+async def process_units(client: httpx.AsyncClient, worker: str, units: List[Dict[str, Any]]) -> int:
+    """
+    OCR one claimed batch, rendering each page once. Returns units committed.
+    """
+    lost: set = set()
+    stop = asyncio.Event()
+    heartbeat = asyncio.create_task(_heartbeat(units, lost, stop))
+    committed = 0
+    try:
+        for (pdf_path, page), page_units in groupby(units, key=lambda u: (u["pdf_path"], u["page"])):
+            page_units = list(page_units)
+            opts = page_units[0]["options"]
+            presize = opts.get("presize", True)
+            heads = _running_heads.setdefault(pdf_path, RunningHeads()) if opts.get("memo_heads") else None
+            dedup = opts.get("dedup_distance")
+            index = PageIndex(pdf_path, dedup) if dedup is not None else None
+            try:
+                halves = next(pdf_to_halves(
+                    pdf_path,
+                    dpi=opts.get("dpi", 300),
+                    from_page=page,
+                    to_page=page,
+                    max_pixels=MAX_PIXELS if presize else None,
+                    color_mode=opts.get("color_mode", "rgb"),
+                ), None)
+                if halves is None:
+                    raise ValueError(f"page {page} is past the end of {pdf_path}")
+            except Exception as e:  # missing or corrupt PDF: fail the page's units, keep the worker
+                print(f"[WORKER {worker}] {pdf_path} page {page} could not be rendered: {e}")
+                error = traceback.format_exc()
+                for unit in page_units:
+                    if unit["lease_token"] not in lost:
+                        await asyncio.to_thread(fail_unit, unit, error)
+                continue
+            for unit in page_units:
+                if unit["lease_token"] in lost:
+                    print(f"[WORKER {worker}] lease lost on {pdf_path} page {page} half {unit['half']}, skipping")
+                    continue
+                try:
+                    with trace_context(book=Path(pdf_path).stem, page=page, half=unit["half"]), span("half"):
+                        outcome, blocks = await extract_half(
+                            client, halves[unit["half"] - 1], page, unit["half"],
+                            skip_blank=opts.get("skip_blank", True), presize=presize,
+                            two_stage=opts.get("two_stage", False), heads=heads, index=index,
+                            line_px=opts.get("adaptive_line_px"), blank_thresholds=opts.get("blank_thresholds"),
+                        )
+                except Exception as e:  # one bad unit must not take the worker down
+                    print(f"[WORKER {worker}] {pdf_path} page {page} half {unit['half']} failed: {e}")
+                    await asyncio.to_thread(fail_unit, unit, traceback.format_exc())
+                    continue
+
+                for b in blocks:
+                    b["page"] = page
+                with stage("load_raw"):
+                    ok = await asyncio.to_thread(complete_unit, unit, outcome, blocks)
+                if ok:
+                    committed += 1
+                    ETL_HALVES.labels(outcome=outcome).inc()
+                else:
+                    print(f"[WORKER {worker}] lease on {pdf_path} page {page} half {unit['half']} expired, result dropped")
+            ETL_PAGES.labels(source="worker").inc()
+    finally:
+        stop.set()
+        await heartbeat
+    return committed
+
+
+def failure_reason(error: Optional[str]) -> str:
+    """
+    The exception line of a failed unit's stored traceback.
+    """
+    lines = [line for line in (error or "").splitlines() if line.strip()]
+    return lines[-1].strip() if lines else "unknown error"
+
+
+def load_book(pdf_path: str):
+    """
+    Aggregate a finished book from its stored blocks and load its events.
+    Pages with a failed half are left out and their existing events kept;
+    enqueueing the book again retries them.
+    """
+    units = list_units(pdf_path)
+    failed = [u for u in units if u["status"] == "failed"]
+    skip = {u["page"] for u in failed}
+    blocks = [
+        b for page, _, half_blocks in iter_book_blocks(pdf_path) if page not in skip for b in half_blocks
+    ]
+    with stage("transform"):
+        events = aggregate_blocks(blocks)
+    with stage("load"):
+        counts = upsert_events(pdf_path, events, pages={u["page"] for u in units} - skip)
+    print(f"[WORKER] {pdf_path}: {len(events)} events loaded {counts}")
+    for u in failed:
+        print(
+            f"[WORKER] {pdf_path}: page {u['page']} half {u['half']} failed after {u['attempts']} attempts, "
+            f"page not loaded: {failure_reason(u['error'])}"
+        )
+
+
+async def run_worker(worker: Optional[str] = None, exit_when_idle: bool = True) -> int:
+    """
+    Claim and process units until the queue is drained (or forever with
+    exit_when_idle=False). Any number of workers, on any hosts sharing the
+    DB and the PDFs, can run at once. Returns units committed by this worker.
+    """
+    worker = worker or default_worker_id()
+    prepare_db()
+    print(f"[WORKER {worker}] started against {etl_pipeline.OCR_SERVER}")
+    total = 0
+    async with httpx.AsyncClient(timeout=120.0) as client:
+        while True:
+            # whoever sees a book finished first loads it (also after the finishing worker crashed)
+            for pdf_path in await asyncio.to_thread(claim_finished_books):
+                await asyncio.to_thread(load_book, pdf_path)
+
+            units = await asyncio.to_thread(claim_units, worker, CLAIM_BATCH, LEASE_SECONDS, time.time())
+            if not units:
+                status = await asyncio.to_thread(queue_status)
+                if exit_when_idle and not status.get("pending") and not status.get("leased") and not status.get("expired"):
+                    print(f"[WORKER {worker}] queue drained {status}, {total} units committed here")
+                    if status.get("failed"):
+                        print(
+                            f"[WORKER {worker}] {status['failed']} units failed, see --status; "
+                            "enqueue their books again to retry them"
+                        )
+                    return total
+                await asyncio.sleep(POLL_SECONDS)
+                continue
+
+            total += await process_units(client, worker, units)
@@ -0,0 +1,129 @@
+"""
+CPU inference benchmark: generated tokens/s per thread configuration.
+
+Each configuration RxT runs R model processes (model.dots_ocr_4b with
+OCR_DEVICE=cpu) side by side, each pinned to its own T cores with T torch
+threads, on the same synthetic half pages. Models load first; generation
+starts in all processes at once, so the total is the node's throughput.
+
+    python -m benchmarks.cpu_threads --configs 1x8,2x4,4x2,8x1 --halves 4 --max-new-tokens 256
+    python -m benchmarks.cpu_threads --configs 1x4,4x1 --quantize none
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+from model.replicas import ROOT, cpu_devices, parse_cpus, replica_env
+
+
+def child(pdf_path: str, halves: int, max_pixels: int):
+    """
+    One replica: load the model, signal ready, wait for "go" on stdin, OCR `halves` halves.
+    """
+    from app.pdf_utils import pdf_to_halves
+    from model import dots_ocr_4b as server
+
+    images = [img for pair in pdf_to_halves(pdf_path, dpi=200, max_pixels=max_pixels) for img in pair][:halves]
+    server.run_model(images[0], server.DEFAULT_PROMPT, presized=True)  # warm-up, not timed
+    print("ready", flush=True)
+    sys.stdin.readline()
+
+    tokens = 0
+    start = time.perf_counter()
+    for image in images:
+        output = server.run_model(image, server.DEFAULT_PROMPT, presized=True)
+        tokens += len(server.processor.tokenizer(output).input_ids)
+    print(json.dumps({"tokens": tokens, "seconds": time.perf_counter() - start, "halves": len(images)}), flush=True)
+
+
+def run_config(replicas: int, threads: int, args, pdf_path: Path) -> Dict[str, Any]:
+    procs = []
+    for device in cpu_devices(replicas, threads, args.first_cpu):
+        cpus = parse_cpus(device.split(":", 1)[1])
+        env = {
+            **replica_env(device),
+            "OCR_QUANTIZE": args.quantize,
+            "OCR_MAX_NEW_TOKENS": str(args.max_new_tokens),
+            "TRACE_FILE": os.devnull,
+        }
+        procs.append(subprocess.Popen(
+            [sys.executable, "-m", "benchmarks.cpu_threads", "--child", str(pdf_path),
+             "--halves", str(args.halves), "--max-pixels", str(args.max_pixels)],
+            cwd=ROOT,
+            env=env,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            text=True,
+            preexec_fn=lambda cpus=cpus: os.sched_setaffinity(0, cpus),
+        ))
+    try:
+        for p in procs:
+            if p.stdout.readline().strip() != "ready":
+                raise RuntimeError(f"replica exited with {p.wait()} before it was ready")
+        start = time.perf_counter()
+        for p in procs:
+            p.stdin.write("go\n")
+            p.stdin.flush()
+        results = [json.loads(p.stdout.readline()) for p in procs]
+        wall = time.perf_counter() - start
+    finally:
+        for p in procs:
+            if p.poll() is None:
+                p.kill()
+            p.wait()
+
+    tokens = sum(r["tokens"] for r in results)
+    halves = sum(r["halves"] for r in results)
+    return {
+        "config": f"{replicas}x{threads}",
+        "tokens_per_s": tokens / wall,
+        "tokens_per_s_per_replica": tokens / wall / replicas,
+        "halves_per_min": halves / wall * 60,
+        "seconds": wall,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--configs", default="1x4,2x2,4x1", help="comma list of REPLICASxTHREADS")
+    parser.add_argument("--halves", type=int, default=4, help="halves OCR'd per replica")
+    parser.add_argument("--max-new-tokens", type=int, default=256)
+    parser.add_argument("--max-pixels", type=int, default=1_000_000, help="presize halves to this many pixels")
+    parser.add_argument("--quantize", default="int8", choices=("int8", "none"))
+    parser.add_argument("--first-cpu", type=int, default=0)
+    parser.add_argument("--output", type=Path, help="write the results as JSON")
+    parser.add_argument("--child", metavar="PDF", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child, args.halves, args.max_pixels)
+        return
+
+    from benchmarks.synthetic import make_book
+
+    results: List[Dict[str, Any]] = []
+    with tempfile.TemporaryDirectory() as tmp:
+        pdf_path = Path(tmp) / "synthetic_book.pdf"
+        make_book(pdf_path, pages=max(1, (args.halves + 1) // 2))
+        for config in args.configs.split(","):
+            replicas, threads = (int(n) for n in config.lower().split("x"))
+            if args.first_cpu + replicas * threads > os.cpu_count():
+                print(f"[CPU] skipping {config}: needs {replicas * threads} cores, {os.cpu_count()} available")
+                continue
+            result = run_config(replicas, threads, args, pdf_path)
+            results.append(result)
+            print(f"[CPU] {result['config']:>6}: {result['tokens_per_s']:8.1f} tokens/s "
+                  f"({result['tokens_per_s_per_replica']:.1f} per replica), {result['halves_per_min']:.1f} halves/min")
+
+    if args.output:
+        args.output.write_text(json.dumps({"quantize": args.quantize, "results": results}, indent=2), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
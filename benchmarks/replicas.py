@@ -0,0 +1,155 @@
+"""
+Replica router test on CPU: stub replicas behind model.replicas.
+
+  - throughput: the same concurrent load against 1 and N replicas
+  - crash:      SIGKILL a replica mid-run; requests must be retried and the replica respawned
+  - restart:    rolling POST /replicas/restart under load; no request may fail
+
+    python -m benchmarks.replicas --replicas 3 --requests 60 --latency fixed:0.2
+"""
+import argparse
+import asyncio
+import io
+import os
+import signal
+import subprocess
+import sys
+import time
+from typing import Dict, List
+
+import httpx
+from PIL import Image
+
+from benchmarks.run import ROOT
+
+STUB_APP = "benchmarks.stub_server:env_app"
+
+
+def start_router(replicas: int, devices: str, latency: str, port: int) -> subprocess.Popen:
+    device_list = ",".join([devices] * replicas) if "," not in devices else devices
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "model.replicas", "--devices", device_list,
+         "--app", STUB_APP, "--factory", "--port", str(port), "--host", "127.0.0.1"],
+        cwd=ROOT,
+        env={**os.environ, "PYTHONPATH": str(ROOT), "STUB_LATENCY": latency, "TRACE_FILE": os.devnull},
+    )
+    for _ in range(300):
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/health", timeout=0.5).json()["ready"] == replicas:
+                return proc
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.1)
+    proc.kill()
+    raise RuntimeError("router did not start")
+
+
+def stop_router(proc: subprocess.Popen):
+    proc.send_signal(signal.SIGINT)
+    try:
+        proc.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+
+
+def png_bytes() -> bytes:
+    buf = io.BytesIO()
+    Image.new("RGB", (56, 56), "white").save(buf, format="PNG")
+    return buf.getvalue()
+
+
+async def load(url: str, total: int, concurrency: int, during=None) -> Dict[str, float]:
+    """
+    Send `total` /infer requests, `concurrency` at a time; `during` runs alongside.
+    """
+    image = png_bytes()
+    queue = asyncio.Queue()
+    for i in range(total):
+        queue.put_nowait(i)
+    failures: List[str] = []
+
+    async def client_loop(client: httpx.AsyncClient):
+        while not queue.empty():
+            i = queue.get_nowait()
+            try:
+                resp = await client.post(
+                    f"{url}/infer",
+                    files={"file": (f"page{i // 2 + 1}_half{i % 2 + 1}.png", image, "image/png")},
+                    data={"orig_width": "56", "orig_height": "56"},
+                )
+                if resp.status_code != 200:
+                    failures.append(f"{i}: HTTP {resp.status_code}")
+            except httpx.HTTPError as e:
+                failures.append(f"{i}: {e!r}")
+
+    start = time.perf_counter()
+    async with httpx.AsyncClient(timeout=60.0) as client:
+        tasks = [client_loop(client) for _ in range(concurrency)]
+        if during is not None:
+            tasks.append(during(client))
+        await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - start
+    for f in failures[:5]:
+        print(f"    failed {f}")
+    return {"requests_per_s": total / elapsed, "failed": len(failures)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--replicas", type=int, default=3)
+    parser.add_argument("--requests", type=int, default=60)
+    parser.add_argument("--latency", default="fixed:0.2", help="stub generate latency per request")
+    parser.add_argument("--devices", default="cpu", help="device per replica, or a comma list with one per replica")
+    parser.add_argument("--port", type=int, default=8767)
+    args = parser.parse_args()
+    url = f"http://127.0.0.1:{args.port}"
+    concurrency = 2 * args.replicas
+    ok = True
+
+    throughput = {}
+    for n in (1, args.replicas):
+        router = start_router(n, args.devices, args.latency, args.port)
+        try:
+            result = asyncio.run(load(url, args.requests, concurrency))
+        finally:
+            stop_router(router)
+        throughput[n] = result["requests_per_s"]
+        ok &= result["failed"] == 0
+        print(f"[REPLICAS] {n} replica(s): {result['requests_per_s']:.1f} req/s, {result['failed']} failed")
+    print(f"[REPLICAS] speedup x{throughput[args.replicas] / throughput[1]:.2f} with {args.replicas} replicas")
+
+    router = start_router(args.replicas, args.devices, args.latency, args.port)
+    try:
+        async def crash(client: httpx.AsyncClient):
+            await asyncio.sleep(1.0)
+            victim = (await client.get(f"{url}/replicas")).json()[0]
+            os.kill(victim["pid"], signal.SIGKILL)
+            print(f"[REPLICAS] killed replica 0 (pid {victim['pid']})")
+
+        result = asyncio.run(load(url, args.requests, concurrency, during=crash))
+        time.sleep(3.0)  # let the monitor respawn it
+        status = httpx.get(f"{url}/replicas").json()
+        respawned = status[0]["restarts"] == 1 and status[0]["ready"]
+        ok &= result["failed"] == 0 and respawned
+        print(f"[REPLICAS] crash: {result['failed']} failed, replica 0 respawned: {respawned}")
+
+        async def rolling(client: httpx.AsyncClient):
+            await asyncio.sleep(0.5)
+            await client.post(f"{url}/replicas/restart", timeout=120.0)
+            print("[REPLICAS] rolling restart done")
+
+        result = asyncio.run(load(url, args.requests, concurrency, during=rolling))
+        status = httpx.get(f"{url}/replicas").json()
+        restarted = all(r["restarts"] >= 1 and r["ready"] for r in status)
+        ok &= result["failed"] == 0 and restarted
+        print(f"[REPLICAS] rolling restart: {result['failed']} failed, all replicas back: {restarted}")
+        print(f"[REPLICAS] served per replica {[r['served'] for r in status]}")
+    finally:
+        stop_router(router)
+
+    print("[REPLICAS] OK" if ok else "[REPLICAS] FAILED")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
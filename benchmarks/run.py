@@ -0,0 +1,197 @@
+"""
+Offline throughput benchmarks: no GPU, no model.
+
+Generates a synthetic Arabic book, starts the stub OCR server and runs
+  - etl:    app.etl_pipeline.process_pdf against the stub /infer
+  - etl_two_stage: the same with a layout-only pass and /infer_regions
+  - etl_adaptive: the same with adaptive per-half resolution
+            (these two are not in the defaults; their events must match etl's)
+  - parser: DotsOCRParser.parse_file against the stub OpenAI endpoint
+each in a fresh process, reporting pages/min, per-stage time, peak RSS
+and DB rows/sec, and comparing against stored baselines.
+
+    python -m benchmarks.run --pages 20 --latency fixed:0.05
+    python -m benchmarks.run --save-baseline
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import multiprocessing
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict
+
+import httpx
+
+from benchmarks.synthetic import make_book
+
+ROOT = Path(__file__).resolve().parent.parent
+BASELINES = Path(__file__).with_name("baselines.json")
+SCENARIOS = ("etl", "parser")
+# metric -> True if higher is better
+TRACKED = {"pages_per_min": True, "peak_rss_mb": False, "db_rows_per_s": True}
+
+
+def _peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _bench_etl(pdf_path: Path, workdir: Path, port: int, pages: int, **options) -> Dict[str, Any]:
+    import sqlite3
+    from app import db, etl_pipeline, tracing
+    from app.timing import reset_stage_times, stage_times
+
+    tracing.TRACE_FILE = str(workdir.parent / "traces.jsonl")
+    db.DB_PATH = workdir / "bench.db"
+    etl_pipeline.OCR_SERVER = f"http://127.0.0.1:{port}/infer"
+    etl_pipeline.CHECKPOINT_DIR = workdir / "checkpoints"
+    etl_pipeline.CHECKPOINT_DIR.mkdir(parents=True, exist_ok=True)
+
+    reset_stage_times()
+    start = time.perf_counter()
+    asyncio.run(etl_pipeline.process_pdf(str(pdf_path), from_page=1, to_page=pages, **options))
+    elapsed = time.perf_counter() - start
+    tracing.flush()
+
+    stages = stage_times()
+    with sqlite3.connect(db.DB_PATH) as conn:
+        rows = conn.execute("SELECT COUNT(*) FROM events").fetchone()[0]
+        events = conn.execute("SELECT page, ordinal, date, text FROM events ORDER BY page, ordinal").fetchall()
+    load_s = stages.get("load", {}).get("seconds", 0.0)
+    return {
+        "pages_per_min": pages / elapsed * 60,
+        "seconds": elapsed,
+        "stages": {name: round(v["seconds"], 4) for name, v in stages.items()},
+        "db_rows": rows,
+        "db_rows_per_s": rows / load_s if load_s else 0.0,
+        "vision_tokens": etl_pipeline.VISION_TOKENS["sent"],
+        "vision_tokens_fixed": etl_pipeline.VISION_TOKENS["fixed"],
+        "events_digest": hashlib.sha1(json.dumps(events, ensure_ascii=False).encode()).hexdigest()[:12],
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+
+
+def _bench_parser(pdf_path: Path, workdir: Path, port: int, pages: int) -> Dict[str, Any]:
+    try:
+        from dots_ocr.parser import DotsOCRParser
+    except ImportError:
+        sys.path.insert(0, str(ROOT / "model"))
+        from dots_ocr.parser import DotsOCRParser
+
+    parser = DotsOCRParser(ip="127.0.0.1", port=port, dpi=200, num_thread=4, output_dir=str(workdir))
+    start = time.perf_counter()
+    results = parser.parse_file(str(pdf_path))
+    elapsed = time.perf_counter() - start
+    return {
+        "pages_per_min": len(results) / elapsed * 60,
+        "seconds": elapsed,
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+
+
+def _run_scenario(name: str, pdf_path: Path, workdir: Path, port: int, pages: int) -> Dict[str, Any]:
+    if name == "etl_two_stage":
+        return _bench_etl(pdf_path, workdir, port, pages, two_stage=True)
+    if name == "etl_adaptive":
+        from app.image_utils import ADAPTIVE_LINE_PX
+        return _bench_etl(pdf_path, workdir, port, pages, adaptive_line_px=ADAPTIVE_LINE_PX)
+    bench = {"etl": _bench_etl, "parser": _bench_parser}[name]
+    return bench(pdf_path, workdir, port, pages)
+
+
+def start_stub(layout_path: Path, latency: str, port: int, trace_file: Path, concurrent: bool = False) -> subprocess.Popen:
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.stub_server", "--replay", str(layout_path),
+         "--latency", latency, "--port", str(port)] + (["--concurrent"] if concurrent else []),
+        cwd=ROOT,
+        env={**os.environ, "TRACE_FILE": str(trace_file)},
+    )
+    for _ in range(100):
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/health", timeout=0.5).raise_for_status()
+            return proc
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    proc.kill()
+    raise RuntimeError("stub server did not start")
+
+
+def compare(results: Dict[str, Dict[str, Any]], baselines: Dict[str, Dict[str, Any]], tolerance: float) -> bool:
+    """Print deltas against baselines, return False on any regression beyond tolerance"""
+    ok = True
+    for name, metrics in results.items():
+        base = baselines.get(name, {})
+        for metric, higher_is_better in TRACKED.items():
+            if metric not in metrics or not base.get(metric):
+                continue
+            delta = (metrics[metric] - base[metric]) / base[metric]
+            regressed = -delta > tolerance if higher_is_better else delta > tolerance
+            ok &= not regressed
+            flag = "REGRESSION" if regressed else "ok"
+            print(f"  {name:<7} {metric:<14} {metrics[metric]:>10.2f} vs {base[metric]:>10.2f} ({delta:+.1%}) {flag}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=20)
+    parser.add_argument("--latency", default="fixed:0.05", help="stub latency, see benchmarks.stub_server.parse_latency")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--tolerance", type=float, default=0.15, help="allowed relative regression")
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--trace-report", action="store_true", help="print the tracing summary of the etl run")
+    args = parser.parse_args()
+
+    results: Dict[str, Dict[str, Any]] = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = Path(tmp)
+        pdf_path = workdir / "synthetic_book.pdf"
+        layout_path = make_book(pdf_path, pages=args.pages)
+        stub = start_stub(layout_path, args.latency, args.port, workdir / "traces.jsonl")
+        try:
+            ctx = multiprocessing.get_context("spawn")
+            for name in args.scenarios.split(","):
+                with ctx.Pool(1) as pool:  # fresh process so peak RSS is per scenario
+                    results[name] = pool.apply(_run_scenario, (name, pdf_path, workdir / name, args.port, args.pages))
+        finally:
+            stub.terminate()
+            stub.wait()
+        if args.trace_report and (workdir / "traces.jsonl").exists():
+            subprocess.run([sys.executable, "-m", "scripts.trace_report", str(workdir / "traces.jsonl")], cwd=ROOT)
+
+    for name, metrics in results.items():
+        print(f"[BENCH] {name}: {metrics['pages_per_min']:.1f} pages/min, {metrics['seconds']:.2f}s, peak RSS {metrics['peak_rss_mb']:.0f} MB")
+        for stage_name, seconds in metrics.get("stages", {}).items():
+            print(f"    {stage_name:<10} {seconds:>8.3f}s")
+        if "db_rows_per_s" in metrics:
+            print(f"    {metrics['db_rows']} DB rows, {metrics['db_rows_per_s']:.0f} rows/s")
+        if metrics.get("vision_tokens_fixed"):
+            print(f"    {metrics['vision_tokens']} vision tokens, {metrics['vision_tokens_fixed']} at the fixed budget "
+                  f"({metrics['vision_tokens'] / metrics['vision_tokens_fixed']:.0%})")
+
+    for variant in ("etl_two_stage", "etl_adaptive"):
+        if "etl" in results and variant in results:
+            same = results["etl"]["events_digest"] == results[variant]["events_digest"]
+            print(f"[BENCH] {variant} events {'match' if same else 'DIFFER from'} the etl run")
+            if not same:
+                sys.exit(1)
+
+    if args.save_baseline:
+        BASELINES.write_text(json.dumps(results, indent=2) + "\n", encoding="utf-8")
+        print(f"[BENCH] Saved baselines to {BASELINES}")
+        return
+    if BASELINES.exists():
+        print("[BENCH] Against baselines:")
+        if not compare(results, json.loads(BASELINES.read_text(encoding="utf-8")), args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
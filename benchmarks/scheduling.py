@@ -0,0 +1,231 @@
+"""
+Generate-queue scheduling on a simulated workload (virtual time, no model).
+
+Requests arrive as a Poisson stream at a given utilization of one model.
+Most are page halves whose vision tokens, ink density and text per ink vary
+the way a mixed book does (near-blank, plain text, dense tables and small
+print); the rest are small region batches of two-stage OCR. The true output
+length and generate time are drawn from those, with noise; the scheduler
+only sees vision tokens and ink, and learns the rest from the requests it
+has finished, like model.scheduler.CostModel in the server.
+
+Each policy serves the same workload: FIFO, SJF with aging (OCR_SJF_WEIGHT),
+SJF without aging, and SJF on the true cost as the lower bound. Reports
+latency percentiles, the p95 latency of the largest tenth of requests
+(what starvation looks like) and how well predicted costs rank the true
+ones. A second part batches the crops of region requests REGION_BATCH at a
+time in bbox order and sorted by predicted length, and reports the share of
+batch row-steps spent waiting for the batch's longest row.
+
+    python -m benchmarks.scheduling --requests 2000 --load 0.9
+"""
+import argparse
+import math
+import random
+import statistics
+from dataclasses import dataclass
+from typing import Dict, List, Tuple
+
+from model.scheduler import PREFILL_WEIGHT, SJF_WEIGHT, CostModel, Job, SJFQueue
+
+LAYOUT_PROMPT = "layout"
+REGION_PROMPT = "region"
+SECONDS_PER_TOKEN = 0.04
+MAX_NEW_TOKENS = 4096
+REGION_BATCH = 8
+PROMPT_TOKENS = 60  # text tokens of the chat template and prompt, per row
+
+
+@dataclass
+class Request:
+    arrival: float
+    prompt: str
+    rows: List[Tuple[int, float]]
+    tokens: List[int]
+    seconds: float = 0.0
+
+
+def true_tokens(rng: random.Random, vision: int, ink: float) -> int:
+    # denser pages are set in smaller type: more text per inked pixel
+    ratio = (2.0 + 15.0 * ink) * rng.lognormvariate(0.0, 0.25)
+    return int(min(ratio * ink * vision + 8, MAX_NEW_TOKENS))
+
+
+def half_row(rng: random.Random) -> Tuple[int, float]:
+    vision = rng.randint(1500, 5600)
+    kind = rng.random()
+    if kind < 0.1:
+        ink = rng.uniform(0.003, 0.02)                   # near-blank, a line or two
+    elif kind < 0.75:
+        ink = min(rng.lognormvariate(math.log(0.07), 0.35), 0.3)
+    else:
+        ink = rng.uniform(0.12, 0.25)                    # tables, small print
+    return vision, ink
+
+
+def region_row(rng: random.Random) -> Tuple[int, float]:
+    return rng.randint(40, 900), rng.uniform(0.04, 0.2)
+
+
+def service_seconds(rng: random.Random, tokens: List[int], input_tokens: int) -> float:
+    return (max(tokens) + PREFILL_WEIGHT * input_tokens) * SECONDS_PER_TOKEN * rng.lognormvariate(0.0, 0.1)
+
+
+def input_tokens(rows: List[Tuple[int, float]]) -> int:
+    return sum(vision for vision, _ in rows) + PROMPT_TOKENS * len(rows)
+
+
+def workload(n: int, load: float, region_share: float, seed: int) -> List[Request]:
+    rng = random.Random(seed)
+    requests = []
+    for _ in range(n):
+        if rng.random() < region_share:
+            prompt, rows = REGION_PROMPT, [region_row(rng) for _ in range(rng.randint(1, REGION_BATCH))]
+        else:
+            prompt, rows = LAYOUT_PROMPT, [half_row(rng)]
+        tokens = [true_tokens(rng, *row) for row in rows]
+        requests.append(Request(0.0, prompt, rows, tokens, service_seconds(rng, tokens, input_tokens(rows))))
+
+    # arrivals at the requested share of the model's capacity
+    rate = load / statistics.fmean(r.seconds for r in requests)
+    clock = 0.0
+    for r in requests:
+        clock += rng.expovariate(rate)
+        r.arrival = clock
+    return requests
+
+
+def simulate(requests: List[Request], weight: float, oracle: bool = False) -> Dict[str, object]:
+    """
+    Serve the requests one at a time in virtual time. Jobs are predicted when
+    they arrive and the cost model learns from each one when it finishes.
+    """
+    model = CostModel(MAX_NEW_TOKENS)
+    queue = SJFQueue(weight)
+    latency: Dict[int, float] = {}
+    predicted: Dict[int, float] = {}
+    ids = {}
+    pending = 0
+    clock = 0.0
+
+    def admit(until: float):
+        nonlocal pending
+        while pending < len(requests) and requests[pending].arrival <= until:
+            r = requests[pending]
+            job = model.job(r.prompt, r.rows, input_tokens(r.rows))
+            predicted[pending] = job.predicted_seconds
+            if oracle:
+                job.predicted_seconds = r.seconds
+            ids[id(job)] = pending
+            queue.push(job, r.arrival)
+            pending += 1
+
+    while len(latency) < len(requests):
+        if not len(queue):
+            clock = max(clock, requests[pending].arrival)
+            admit(clock)
+        job: Job = queue.pop()
+        i = ids.pop(id(job))
+        r = requests[i]
+        clock += r.seconds
+        admit(clock)  # arrived while this one was generating: predicted before it is learned from
+        model.observe(job, r.seconds, r.tokens)
+        latency[i] = clock - r.arrival
+    return {"latency": [latency[i] for i in range(len(requests))], "predicted": [predicted[i] for i in range(len(requests))]}
+
+
+def percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def spearman(a: List[float], b: List[float]) -> float:
+    def ranks(values):
+        order = sorted(range(len(values)), key=values.__getitem__)
+        out = [0.0] * len(values)
+        for rank, i in enumerate(order):
+            out[i] = float(rank)
+        return out
+
+    ra, rb = ranks(a), ranks(b)
+    ma, mb = statistics.fmean(ra), statistics.fmean(rb)
+    cov = sum((x - ma) * (y - mb) for x, y in zip(ra, rb))
+    return cov / math.sqrt(sum((x - ma) ** 2 for x in ra) * sum((y - mb) ** 2 for y in rb))
+
+
+def batch_waste(requests: List[Request], sort: bool) -> Tuple[float, float]:
+    """
+    Generate seconds and the share of row-steps spent padding, for region
+    crops batched REGION_BATCH at a time in bbox order or sorted by predicted length.
+    """
+    model = CostModel(MAX_NEW_TOKENS)
+    seconds = padded = steps = 0.0
+    for r in requests:
+        rows = list(zip(r.rows, r.tokens))
+        if sort:
+            rows.sort(key=lambda row: model.predict(r.prompt, *row[0]))
+        for i in range(0, len(rows), REGION_BATCH):
+            chunk = rows[i:i + REGION_BATCH]
+            tokens = [t for _, t in chunk]
+            chunk_rows = [row for row, _ in chunk]
+            seconds += (max(tokens) + PREFILL_WEIGHT * input_tokens(chunk_rows)) * SECONDS_PER_TOKEN
+            steps += max(tokens) * len(tokens)
+            padded += max(tokens) * len(tokens) - sum(tokens)
+            model.observe(model.job(r.prompt, chunk_rows, input_tokens(chunk_rows)), 0.0, tokens)
+    return seconds, padded / max(steps, 1.0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--load", type=float, default=0.9, help="arrival rate as a share of the model's capacity")
+    parser.add_argument("--region-share", type=float, default=0.2, help="share of requests that are region batches")
+    parser.add_argument("--weight", type=float, default=SJF_WEIGHT, help="aging weight of the SJF policy")
+    parser.add_argument("--crops", type=int, default=300, help="region requests (of up to 40 crops) for the batching part")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    requests = workload(args.requests, args.load, args.region_share, args.seed)
+    sizes = sorted(range(len(requests)), key=lambda i: requests[i].seconds)
+    largest = set(sizes[-max(1, len(requests) // 10):])
+    print(
+        f"[SCHED] {len(requests)} requests at {args.load:.0%} load, generate "
+        f"p50 {percentile([r.seconds for r in requests], 0.5):.1f}s, max {max(r.seconds for r in requests):.1f}s"
+    )
+
+    policies = [
+        ("fifo", 0.0, False),
+        (f"sjf (weight {args.weight:g})", args.weight, False),
+        ("sjf, no aging", math.inf, False),
+        ("sjf, true cost", math.inf, True),
+    ]
+    results = {}
+    for name, weight, oracle in policies:
+        result = simulate(requests, weight, oracle)
+        lat = result["latency"]
+        results[name] = statistics.fmean(lat)
+        print(
+            f"[SCHED] {name:<18} mean {statistics.fmean(lat):7.1f}s  p50 {percentile(lat, 0.5):7.1f}s  "
+            f"p95 {percentile(lat, 0.95):7.1f}s  p99 {percentile(lat, 0.99):7.1f}s  max {max(lat):7.1f}s  "
+            f"largest 10% p95 {percentile([lat[i] for i in largest], 0.95):7.1f}s"
+        )
+        if name == "fifo":
+            warm = len(requests) // 10
+            rho = spearman(result["predicted"][warm:], [r.seconds for r in requests][warm:])
+            print(f"[SCHED] predicted vs true generate time: rank correlation {rho:.2f} (after the first {warm})")
+    sjf = results[f"sjf (weight {args.weight:g})"]
+    print(f"[SCHED] mean latency: sjf {sjf / results['fifo']:.0%} of fifo")
+
+    rng = random.Random(args.seed + 1)
+    regions = []
+    for _ in range(args.crops):
+        rows = [region_row(rng) for _ in range(rng.randint(4, 40))]
+        regions.append(Request(0.0, REGION_PROMPT, rows, [true_tokens(rng, *row) for row in rows]))
+    for sort in (False, True):
+        seconds, waste = batch_waste(regions, sort)
+        label = "sorted by prediction" if sort else "bbox order"
+        print(f"[SCHED] region batches, {label:<20} {seconds:8.0f}s generate, {waste:.0%} of row-steps padding")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Speculative decoding check: the same synthetic halves with plain greedy
+generate and with prompt-lookup drafting, in one model process.
+
+Reports generated tokens/s for both and the draft acceptance rate, and
+fails if any output differs.
+
+    python -m benchmarks.speculative --halves 6
+    OCR_DEVICE=cpu python -m benchmarks.speculative --halves 2 --max-new-tokens 256
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--halves", type=int, default=6)
+    parser.add_argument("--max-new-tokens", type=int, default=None, help="default: the server's OCR_MAX_NEW_TOKENS")
+    parser.add_argument("--max-pixels", type=int, default=None, help="presize halves to this many pixels")
+    args = parser.parse_args()
+    if args.max_new_tokens:
+        os.environ["OCR_MAX_NEW_TOKENS"] = str(args.max_new_tokens)
+    os.environ.setdefault("TRACE_FILE", "")
+    os.environ["OCR_SPECULATIVE"] = "off"
+
+    from app.image_utils import MAX_PIXELS
+    from app.pdf_utils import pdf_to_halves
+    from benchmarks.synthetic import make_book
+    from model import dots_ocr_4b as server
+    from model.speculative import PromptLookupDecoder
+
+    with tempfile.TemporaryDirectory() as tmp:
+        pdf_path = Path(tmp) / "synthetic_book.pdf"
+        make_book(pdf_path, pages=max(1, (args.halves + 1) // 2))
+        halves = pdf_to_halves(str(pdf_path), dpi=200, max_pixels=args.max_pixels or MAX_PIXELS)
+        images = [img for pair in halves for img in pair][:args.halves]
+
+    server.run_model(images[0], server.DEFAULT_PROMPT, presized=True)  # warm-up
+
+    outputs = {}
+    for mode in ("greedy", "lookup"):
+        server.decoder = PromptLookupDecoder(server.processor.tokenizer) if mode == "lookup" else None
+        tokens, start = 0, time.perf_counter()
+        outputs[mode] = []
+        for image in images:
+            text = server.run_model(image, server.DEFAULT_PROMPT, presized=True)
+            tokens += len(server.processor.tokenizer(text).input_ids)
+            outputs[mode].append(text)
+        seconds = time.perf_counter() - start
+        line = f"[SPEC] {mode:<6} {tokens / seconds:8.1f} tokens/s over {len(images)} halves"
+        if server.decoder is not None:
+            total = server.decoder.total
+            line += f", {total.accepted}/{total.drafted} draft tokens accepted ({total.acceptance:.0%})"
+        print(line)
+
+    mismatches = [i for i, (a, b) in enumerate(zip(outputs["greedy"], outputs["lookup"])) if a != b]
+    print(f"[SPEC] outputs differ on halves {mismatches}" if mismatches else "[SPEC] outputs identical")
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
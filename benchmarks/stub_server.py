@@ -0,0 +1,165 @@
+"""
+Stub OCR server for offline benchmarks.
+
+Serves the same /infer and /infer_regions contract as model.dots_ocr_4b
+and an OpenAI-compatible /v1/chat/completions (what DotsOCRParser talks
+to), replaying recorded layout JSON after a sampled latency. Layout-only
+prompts get the blocks without text; regions get the text of the nearest
+replayed block.
+
+    python -m benchmarks.stub_server --replay book_layout.json --latency lognormal:0.5,0.3 --port 8765
+
+env_app() builds the same app from STUB_REPLAY / STUB_LATENCY / STUB_CONCURRENT,
+for launchers that only take an import path (uvicorn --factory, model.replicas).
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import math
+import os
+import random
+import re
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+from fastapi import FastAPI, Form, Header, Request, UploadFile
+
+from app.tracing import span, trace_context
+
+DEFAULT_BLOCKS = [
+    {"bbox": [10, 10, 200, 30], "category": "Text", "text": "١٩٤٩/٨/١٧"},
+    {"bbox": [10, 40, 200, 120], "category": "Text", "text": "اجتمع المجلس في بيروت وناقش الأوضاع السياسية."},
+]
+
+
+def parse_latency(spec: str) -> Callable[[], float]:
+    """
+    Build a latency sampler (seconds) from a spec:
+    fixed:S | uniform:LO,HI | normal:MU,SIGMA | lognormal:MEDIAN,SIGMA
+    """
+    kind, _, args = spec.partition(":")
+    params = [float(a) for a in args.split(",") if a]
+    if kind == "fixed":
+        return lambda: params[0]
+    if kind == "uniform":
+        return lambda: random.uniform(params[0], params[1])
+    if kind == "normal":
+        return lambda: max(0.0, random.gauss(params[0], params[1]))
+    if kind == "lognormal":
+        return lambda: random.lognormvariate(math.log(params[0]), params[1])
+    raise ValueError(f"unknown latency distribution {spec!r}")
+
+
+def create_app(replay: List[List[Dict[str, Any]]], latency: str = "fixed:0", serial: bool = True) -> FastAPI:
+    """
+    replay: one block list per half, in book order (right half first).
+    serial: handle one request at a time, like a single-GPU model server.
+    """
+    app = FastAPI()
+    sample = parse_latency(latency)
+    lock = asyncio.Lock() if serial else None
+    cycle = itertools.count()
+    app.state.requests = 0
+
+    def pick(name: str) -> List[Dict[str, Any]]:
+        m = re.search(r"page(\d+)_half(\d+)", name or "")
+        idx = (int(m.group(1)) - 1) * 2 + int(m.group(2)) - 1 if m else next(cycle)
+        return json.loads(json.dumps(replay[idx % len(replay)]))
+
+    async def wait():
+        app.state.requests += 1
+        if lock is None:
+            await asyncio.sleep(sample())
+            return
+        async with lock:
+            await asyncio.sleep(sample())
+
+    @app.post("/infer")
+    async def infer(
+        file: UploadFile,
+        prompt: str = Form(""),
+        presized: bool = Form(False),
+        orig_width: int | None = Form(None),
+        orig_height: int | None = Form(None),
+        x_trace_id: str | None = Header(None),
+        x_parent_span_id: str | None = Header(None),
+    ):
+        with trace_context(x_trace_id, x_parent_span_id), span("infer"):
+            await file.read()
+            with span("generate"):
+                await wait()
+            blocks = pick(file.filename)
+            if "Do not output the corresponding text" in prompt:
+                for b in blocks:
+                    b.pop("text", None)
+        if orig_width and orig_height:
+            return blocks
+        return json.dumps(blocks, ensure_ascii=False)
+
+    @app.post("/infer_regions")
+    async def infer_regions(
+        file: UploadFile,
+        bboxes: str = Form(...),
+        prompt: str = Form(""),
+        x_trace_id: str | None = Header(None),
+        x_parent_span_id: str | None = Header(None),
+    ):
+        # one latency sample per request: the regions are generated as one batch
+        with trace_context(x_trace_id, x_parent_span_id), span("infer_regions"):
+            await file.read()
+            with span("generate"):
+                await wait()
+            blocks = [b for b in pick(file.filename) if b.get("bbox")]
+
+        def nearest(bbox):
+            block = min(blocks, key=lambda b: sum(abs(u - v) for u, v in zip(b["bbox"], bbox)), default={})
+            return block.get("text", "")
+
+        return [nearest(bbox) for bbox in json.loads(bboxes)]
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        await wait()
+        content = json.dumps(pick(""), ensure_ascii=False)
+        return {
+            "id": f"stub-{app.state.requests}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "model"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+        }
+
+    @app.get("/health")
+    async def health():
+        return {"status": "ok", "requests": app.state.requests}
+
+    return app
+
+
+def env_app() -> FastAPI:
+    replay_path = os.environ.get("STUB_REPLAY")
+    replay = json.loads(Path(replay_path).read_text(encoding="utf-8")) if replay_path else [DEFAULT_BLOCKS]
+    return create_app(
+        replay,
+        os.environ.get("STUB_LATENCY", "fixed:0.05"),
+        serial=os.environ.get("STUB_CONCURRENT", "0") != "1",
+    )
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--replay", type=Path, help="layout JSON: a list of block lists, one per half")
+    parser.add_argument("--latency", default="fixed:0.05")
+    parser.add_argument("--concurrent", action="store_true", help="do not serialize requests")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    replay = json.loads(args.replay.read_text(encoding="utf-8")) if args.replay else [DEFAULT_BLOCKS]
+    uvicorn.run(create_app(replay, args.latency, serial=not args.concurrent), host=args.host, port=args.port, log_level="warning")
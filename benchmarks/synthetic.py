@@ -0,0 +1,97 @@
+"""
+Synthetic Arabic chronology books for offline benchmarks.
+
+Each page has two columns (the halves the ETL slices) with a running
+header, dated entries and a page number footer. Alongside the PDF a
+layout JSON is written with the blocks a perfect OCR model would return
+for every half, which the stub server replays.
+"""
+import json
+import random
+from pathlib import Path
+from typing import Any, Dict, List
+
+import fitz
+
+ARABIC_DIGITS = "٠١٢٣٤٥٦٧٨٩"
+WORDS = (
+    "اجتمع المجلس في بيروت وناقش الأوضاع السياسية في المنطقة وأصدر بيانا "
+    "حول الحدود والمفاوضات مع الوفد القادم من دمشق ثم أعلنت الحكومة عن "
+    "تشكيل لجنة جديدة لمتابعة شؤون اللاجئين والقرى الحدودية في الجنوب"
+).split()
+
+PAGE_W, PAGE_H = 595, 842  # A4 in points
+MARGIN = 36
+HEADER_H = 40
+
+
+def to_arabic_digits(s: str) -> str:
+    return "".join(ARABIC_DIGITS[int(ch)] if ch.isdigit() else ch for ch in s)
+
+
+def _entries(rng: random.Random, day: List[int], count: int) -> List[Dict[str, str]]:
+    entries = []
+    for _ in range(count):
+        day[0] += rng.randint(1, 4)
+        year, rest = divmod(day[0], 360)
+        month, dom = divmod(rest, 30)
+        date = to_arabic_digits(f"{1948 + year}/{month + 1}/{dom + 1}")
+        text = " ".join(rng.choice(WORDS) for _ in range(rng.randint(15, 45)))
+        entries.append({"date": date, "text": text})
+    return entries
+
+
+def _column_blocks(rect: fitz.Rect, entries: List[Dict[str, str]], header: str, footer: str) -> List[Dict[str, Any]]:
+    """Ground-truth blocks for one half, bboxes in half-local points"""
+    w = rect.width
+    blocks = [{"bbox": [0, 0, int(w), HEADER_H - 8], "category": "Page-header", "text": header}]
+    y = HEADER_H
+    for e in entries:
+        blocks.append({"bbox": [int(w * 0.5), y, int(w) - 10, y + 18], "category": "Text", "text": e["date"]})
+        lines = max(1, len(e["text"]) // 45)
+        blocks.append({"bbox": [10, y + 20, int(w) - 10, y + 20 + 16 * lines], "category": "Text", "text": e["text"]})
+        y += 28 + 16 * lines
+    blocks.append({"bbox": [int(w * 0.4), int(rect.height) - 24, int(w * 0.6), int(rect.height) - 8], "category": "Page-footer", "text": footer})
+    return blocks
+
+
+def make_book(pdf_path: Path, pages: int = 20, entries_per_half: int = 4, seed: int = 0) -> Path:
+    """
+    Write a synthetic book to pdf_path and its ground-truth layout to
+    <stem>_layout.json (one block list per half, right half first).
+    Returns the layout path.
+    """
+    rng = random.Random(seed)
+    day = [0]
+    doc = fitz.open()
+    layout: List[List[Dict[str, Any]]] = []
+    header = "يوميات الأحداث"
+
+    for page_no in range(1, pages + 1):
+        page = doc.new_page(width=PAGE_W, height=PAGE_H)
+        mid = PAGE_W / 2
+        right = fitz.Rect(mid, 0, PAGE_W, PAGE_H)
+        left = fitz.Rect(0, 0, mid, PAGE_H)
+        footer = to_arabic_digits(str(page_no))
+
+        for rect in (right, left):  # reading order of the ETL: right half first
+            entries = _entries(rng, day, entries_per_half)
+            html = f'<p dir="rtl" style="font-size:11px;text-align:center">{header}</p>'
+            for e in entries:
+                html += f'<p dir="rtl" style="font-size:12px"><b>{e["date"]}</b></p>'
+                html += f'<p dir="rtl" style="font-size:11px">{e["text"]}</p>'
+            body = fitz.Rect(rect.x0 + MARGIN / 2, rect.y0 + MARGIN, rect.x1 - MARGIN / 2, rect.y1 - MARGIN)
+            page.insert_htmlbox(body, html)
+            page.insert_htmlbox(
+                fitz.Rect(rect.x0, rect.y1 - MARGIN, rect.x1, rect.y1),
+                f'<p style="font-size:10px;text-align:center">{footer}</p>',
+            )
+            layout.append(_column_blocks(rect, entries, header, footer))
+
+    pdf_path.parent.mkdir(parents=True, exist_ok=True)
+    doc.save(pdf_path)
+    doc.close()
+
+    layout_path = pdf_path.with_name(f"{pdf_path.stem}_layout.json")
+    layout_path.write_text(json.dumps(layout, ensure_ascii=False), encoding="utf-8")
+    return layout_path
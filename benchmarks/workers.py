@@ -0,0 +1,102 @@
+"""
+Distributed worker test: several local `scripts.run_etl --worker` processes
+share one SQLite queue and a stub OCR server.
+
+Checks that every (page, half) unit is committed exactly once and that the
+loaded events match a single-process aggregation of the same layout, even
+when a worker is killed mid-run (--kill-after) and its leases expire.
+
+    python -m benchmarks.workers --pages 20 --workers 4
+    python -m benchmarks.workers --pages 20 --workers 3 --kill-after 2 --lease 5
+"""
+import argparse
+import json
+import os
+import signal
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+from app.aggregator import aggregate_blocks
+from benchmarks.run import ROOT, start_stub
+from benchmarks.synthetic import make_book
+
+
+def run_cli(workdir: Path, *args, env=None) -> subprocess.Popen:
+    return subprocess.Popen(
+        [sys.executable, "-m", "scripts.run_etl", *args],
+        cwd=workdir,  # data/sqlite.db and data/checkpoints land in the workdir
+        env={**os.environ, "PYTHONPATH": str(ROOT), **(env or {})},
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=20)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--latency", default="fixed:0.2")
+    parser.add_argument("--lease", type=float, default=10.0)
+    parser.add_argument("--kill-after", type=float, default=None, help="SIGKILL the first worker after this many seconds")
+    parser.add_argument("--port", type=int, default=8766)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = Path(tmp)
+        pdf_path = workdir / "synthetic_book.pdf"
+        layout_path = make_book(pdf_path, pages=args.pages)
+        # concurrent: one stub stands in for one GPU server per worker host
+        stub = start_stub(layout_path, args.latency, args.port, workdir / "traces.jsonl", concurrent=True)
+        server = f"http://127.0.0.1:{args.port}/infer"
+        common = ["--ocr-server", server, "--lease", str(args.lease)]
+        env = {"TRACE_FILE": str(workdir / "traces.jsonl")}
+        try:
+            enq = run_cli(workdir, "--enqueue", str(pdf_path), "--from-page", "1", "--to-page", str(args.pages), env=env)
+            print(enq.communicate()[0].strip().splitlines()[-1])
+
+            start = time.perf_counter()
+            procs = [run_cli(workdir, "--worker", "--worker-id", f"w{i}", *common, env=env) for i in range(args.workers)]
+            if args.kill_after is not None:
+                time.sleep(args.kill_after)
+                procs[0].send_signal(signal.SIGKILL)
+                print(f"[WORKERS] killed w0 after {args.kill_after}s")
+            outputs = [p.communicate()[0] for p in procs]
+            elapsed = time.perf_counter() - start
+            requests = httpx.get(f"http://127.0.0.1:{args.port}/health").json()["requests"]
+        finally:
+            stub.terminate()
+            stub.wait()
+
+        for i, out in enumerate(outputs):
+            last = [l for l in out.splitlines() if "queue drained" in l]
+            print(f"  w{i}: {last[-1].split('] ', 1)[1] if last else 'no summary (killed?)'}")
+
+        conn = sqlite3.connect(workdir / "data" / "sqlite.db")
+        units = dict(conn.execute("SELECT status, COUNT(*) FROM work_units GROUP BY status").fetchall())
+        stored = conn.execute("SELECT COUNT(*) FROM ocr_blocks").fetchone()[0]
+        events = conn.execute("SELECT COUNT(*) FROM events WHERE deleted=0").fetchone()[0]
+        conn.close()
+
+        layout = json.loads(layout_path.read_text(encoding="utf-8"))
+        expected = aggregate_blocks(
+            [dict(b, page=i // 2 + 1) for i, half in enumerate(layout) for b in half]
+        )
+        total = 2 * args.pages
+        print(f"[WORKERS] {args.workers} workers, {args.pages} pages in {elapsed:.1f}s ({args.pages / elapsed * 60:.0f} pages/min)")
+        print(f"[WORKERS] units {units}, {stored} half results stored, {requests} OCR requests "
+              f"({requests - total} repeated after lost leases, skipped halves excluded)")
+        print(f"[WORKERS] events {events}, expected {len(expected)}")
+        ok = units.get("done") == total and stored == total and events == len(expected)
+        print("[WORKERS] OK" if ok else "[WORKERS] MISMATCH")
+        sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+Compiled serving mode: fixed input geometries, a static KV cache and torch.compile.
+
+Eager generate sees a new sequence length for nearly every page. Here each
+image is resized (smart_resize, aspect kept) into the smallest of a few
+bucket canvases and padded with white, so every request in a bucket has the
+same number of image tokens. Generation uses a static KV cache sized per
+bucket and a torch.compile'd decoder, so the compiled graphs are reused and
+only recompiled per bucket. Warm-up at startup compiles each bucket once.
+Anything else (region batches, other prompts) runs the eager decoder under
+`eager_decoder`, since each new shape would otherwise recompile.
+"""
+import os
+import time
+from contextlib import contextmanager
+from copy import deepcopy
+from typing import Callable, List, Tuple
+
+from PIL import Image
+
+from app.image_utils import IMAGE_FACTOR, smart_resize
+
+# Model input canvases as WIDTHxHEIGHT, multiples of IMAGE_FACTOR, smallest first.
+# Portrait, for book halves; the largest keeps about half of MAX_PIXELS.
+BUCKETS = os.environ.get("OCR_BUCKETS", "1008x1456,1428x2044,2016x2884")
+
+
+def parse_buckets(spec: str = BUCKETS) -> List[Tuple[int, int]]:
+    buckets = []
+    for part in spec.split(","):
+        width, height = (int(v) for v in part.lower().split("x"))
+        if width % IMAGE_FACTOR or height % IMAGE_FACTOR:
+            raise ValueError(f"bucket {part} is not a multiple of {IMAGE_FACTOR}")
+        buckets.append((width, height))
+    return sorted(buckets, key=lambda b: b[0] * b[1])
+
+
+def bucket_geometry(width: int, height: int, buckets: List[Tuple[int, int]]) -> Tuple[Tuple[int, int], Tuple[int, int]]:
+    """
+    The smallest bucket the image fits at its own model geometry, and the
+    (width, height) it is resized to inside it. Images too large for every
+    bucket are scaled down into the largest one.
+    """
+    natural_h, natural_w = smart_resize(height, width)
+    for bucket in buckets:
+        if natural_w <= bucket[0] and natural_h <= bucket[1]:
+            return bucket, (natural_w, natural_h)
+
+    bucket = buckets[-1]
+    scale = min(bucket[0] / width, bucket[1] / height)
+    h, w = smart_resize(round(height * scale), round(width * scale), max_pixels=bucket[0] * bucket[1])
+    return bucket, (min(w, bucket[0]), min(h, bucket[1]))
+
+
+def snap_to_bucket(image: Image.Image, buckets: List[Tuple[int, int]]) -> Tuple[Image.Image, Tuple[int, int]]:
+    """
+    The image resized and padded (white, right and bottom) to its bucket canvas,
+    and the content size, which bboxes are relative to.
+    """
+    bucket, size = bucket_geometry(image.width, image.height, buckets)
+    content = image.convert("RGB")
+    if content.size != size:
+        content = content.resize(size, Image.BICUBIC)
+    if size == bucket:
+        return content, size
+    canvas = Image.new("RGB", bucket, "white")
+    canvas.paste(content, (0, 0))
+    return canvas, size
+
+
+def compile_decoder(model, mode: str = "default"):
+    """
+    torch.compile the language model's forward with static shapes. The
+    vision encoder runs once per request and stays eager.
+    """
+    import torch
+    import torch._dynamo
+    import torch._inductor.config
+
+    # keep eager's rounding for low-precision casts so greedy outputs match
+    if hasattr(torch._inductor.config, "emulate_precision_casts"):
+        torch._inductor.config.emulate_precision_casts = True
+    # prefill + decode graph per bucket
+    torch._dynamo.config.cache_size_limit = max(torch._dynamo.config.cache_size_limit, 16)
+    decoder = model.get_decoder()
+    decoder.eager_forward = decoder.forward
+    decoder.forward = torch.compile(decoder.forward, mode=mode, dynamic=False)
+    return model
+
+
+@contextmanager
+def eager_decoder(model):
+    """
+    Run the uncompiled decoder forward inside the block. Callers must hold
+    the model (one generate at a time), since the swap is visible to all threads.
+    """
+    decoder = model.get_decoder()
+    compiled = decoder.forward
+    decoder.forward = getattr(decoder, "eager_forward", compiled)
+    try:
+        yield
+    finally:
+        decoder.forward = compiled
+
+
+def static_generation_config(model):
+    """
+    The model's generation config with a static KV cache, and without
+    transformers' own auto-compile (the decoder is already compiled).
+    """
+    config = deepcopy(model.generation_config)
+    config.cache_implementation = "static"
+    config.disable_compile = True
+    return config
+
+
+def warm_up(buckets: List[Tuple[int, int]], run: Callable[[Image.Image], object]):
+    """
+    Run one blank canvas per bucket through `run` so each bucket compiles before serving.
+    """
+    for width, height in buckets:
+        start = time.perf_counter()
+        run(Image.new("RGB", (width, height), "white"))
+        print(f"[OCR] compiled bucket {width}x{height} in {time.perf_counter() - start:.1f}s")
@@ -1 +1,6 @@
-from .parser import DotsOCRParser
\ No newline at end of file
+def __getattr__(name):
+    # the parser pulls in the inference client; ink_utils and friends import without it
+    if name == "DotsOCRParser":
+        from .parser import DotsOCRParser
+        return DotsOCRParser
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -7,7 +7,7 @@ import argparse
 
 from dots_ocr.model.inference import inference_with_vllm
 from dots_ocr.utils.consts import image_extensions, MIN_PIXELS, MAX_PIXELS
-from dots_ocr.utils.image_utils import get_image_by_fitz_doc, fetch_image, smart_resize
+from dots_ocr.utils.image_utils import get_image_by_fitz_doc, fetch_image, smart_resize, classify_blank_image
 from dots_ocr.utils.doc_utils import fitz_doc_to_image, load_images_from_pdf
 from dots_ocr.utils.prompts import dict_promptmode_to_prompt
 from dots_ocr.utils.layout_utils import post_process_output, draw_layout_on_image, pre_process_bboxes
@@ -32,6 +32,14 @@ class DotsOCRParser:
             min_pixels=None,
             max_pixels=None,
             use_hf=False,
+            skip_blank=False,
+            blank_thresholds=None,
+            seconds_per_image=60.0,
+            grayscale=False,
+            speculative=False,
+            quantize=None,
+            threads=None,
+            interop_threads=None,
         ):
         self.dpi = dpi
 
@@ -47,6 +55,21 @@ class DotsOCRParser:
         self.output_dir = output_dir
         self.min_pixels = min_pixels
         self.max_pixels = max_pixels
+        # pre-inference blank / picture-only skipping
+        self.skip_blank = skip_blank
+        self.blank_thresholds = blank_thresholds or {}
+        self.seconds_per_image = seconds_per_image  # only used to report the time saved by skipping
+        # render and upload single-channel images, the model processor expands them to RGB
+        self.grayscale = grayscale
+
+        # hf only: prompt-lookup drafting, greedy output unchanged (see model/speculative.py)
+        self.speculative = speculative
+        self.decoder = None
+
+        # hf on cpu: same knobs and defaults as the model server (OCR_QUANTIZE, OCR_THREADS, OCR_INTEROP_THREADS)
+        self.quantize = quantize or os.environ.get("OCR_QUANTIZE", "int8")
+        self.threads = int(os.environ.get("OCR_THREADS", "0")) if threads is None else threads
+        self.interop_threads = int(os.environ.get("OCR_INTEROP_THREADS", "0")) if interop_threads is None else interop_threads
 
         self.use_hf = use_hf
         if self.use_hf:
@@ -63,15 +86,38 @@ class DotsOCRParser:
         from qwen_vl_utils import process_vision_info
 
         model_path = "./weights/DotsOCR"
-        self.model = AutoModelForCausalLM.from_pretrained(
-            model_path,
-            attn_implementation="flash_attention_2",
-            torch_dtype=torch.bfloat16,
-            device_map="auto",
-            trust_remote_code=True
-        )
+        if self.threads:
+            torch.set_num_threads(self.threads)
+        if self.interop_threads:
+            torch.set_num_interop_threads(self.interop_threads)
+        if torch.cuda.is_available():
+            self.model = AutoModelForCausalLM.from_pretrained(
+                model_path,
+                attn_implementation="flash_attention_2",
+                torch_dtype=torch.bfloat16,
+                device_map="auto",
+                trust_remote_code=True
+            )
+        else:
+            # CPU: SDPA attention, float32 weights, with quantize="int8" dynamic quantization of the Linear layers
+            self.model = AutoModelForCausalLM.from_pretrained(
+                model_path,
+                attn_implementation="sdpa",
+                torch_dtype=torch.float32,
+                device_map="cpu",
+                trust_remote_code=True
+            ).eval()
+            if self.quantize == "int8":
+                self.model = torch.ao.quantization.quantize_dynamic(self.model, {torch.nn.Linear}, dtype=torch.qint8)
+            print(f"hf model on cpu (quantize={self.quantize}, threads={torch.get_num_threads()}, interop={torch.get_num_interop_threads()})")
         self.processor = AutoProcessor.from_pretrained(model_path,  trust_remote_code=True,use_fast=True)
         self.process_vision_info = process_vision_info
+        if self.speculative:
+            try:
+                from model.speculative import PromptLookupDecoder
+            except ImportError:  # run from inside model/
+                from speculative import PromptLookupDecoder
+            self.decoder = PromptLookupDecoder(self.processor.tokenizer)
 
     def _inference_with_hf(self, image, prompt):
         messages = [
@@ -102,10 +148,14 @@ class DotsOCRParser:
             return_tensors="pt",
         )
 
-        inputs = inputs.to("cuda")
+        inputs = inputs.to(self.model.device)
 
         # Inference: Generation of the output
-        generated_ids = self.model.generate(**inputs, max_new_tokens=24000)
+        if self.decoder is None:
+            generated_ids = self.model.generate(**inputs, max_new_tokens=24000)
+        else:
+            generated_ids, stats = self.decoder.generate(self.model, inputs, max_new_tokens=24000, do_sample=False)
+            print(f"speculative: {stats.accepted}/{stats.drafted} draft tokens accepted, {stats.tokens_per_s:.1f} tokens/s")
         generated_ids_trimmed = [
             out_ids[len(in_ids) :] for in_ids, out_ids in zip(inputs.input_ids, generated_ids)
         ]
@@ -136,6 +186,24 @@ class DotsOCRParser:
             prompt = prompt + str(bbox)
         return prompt
 
+    def _blank_cells(self, origin_image, prompt_mode):
+        """Returns (kind, cells) for images not worth sending to the model, else (None, None)"""
+        if not self.skip_blank or prompt_mode == 'prompt_grounding_ocr':
+            return None, None
+        kind, stats = classify_blank_image(origin_image, **self.blank_thresholds)
+        if kind == 'text':
+            return None, None
+        print(f"skip {kind} image: ink {stats['ink_ratio']:.2%}, {stats['components']} components")
+        if kind == 'picture':
+            return kind, [{'bbox': [0, 0, origin_image.width, origin_image.height], 'category': 'Picture'}]
+        return kind, []
+
+    def _report_skipped(self, results):
+        skipped = [r['skipped'] for r in results if r.get('skipped')]
+        if skipped:
+            print(f"Skipped {len(skipped)}/{len(results)} images ({skipped.count('empty')} empty, {skipped.count('picture')} picture-only), "
+                  f"~{len(skipped) * self.seconds_per_image / 60:.1f} min of inference saved")
+
     # def post_process_results(self, response, prompt_mode, save_dir, save_name, origin_image, image, min_pixels, max_pixels)
     def _parse_single_image(
         self, 
@@ -156,31 +224,40 @@ class DotsOCRParser:
         if max_pixels is not None: assert max_pixels <= MAX_PIXELS, f"max_pixels should <= {MAX_PIXELS}"
 
         if source == 'image' and fitz_preprocess:
-            image = get_image_by_fitz_doc(origin_image, target_dpi=self.dpi)
-            image = fetch_image(image, min_pixels=min_pixels, max_pixels=max_pixels)
+            image = get_image_by_fitz_doc(origin_image, target_dpi=self.dpi, grayscale=self.grayscale)
+            image = fetch_image(image, min_pixels=min_pixels, max_pixels=max_pixels, keep_gray=self.grayscale)
         else:
-            image = fetch_image(origin_image, min_pixels=min_pixels, max_pixels=max_pixels)
+            image = fetch_image(origin_image, min_pixels=min_pixels, max_pixels=max_pixels, keep_gray=self.grayscale)
         input_height, input_width = smart_resize(image.height, image.width)
-        prompt = self.get_prompt(prompt_mode, bbox, origin_image, image, min_pixels=min_pixels, max_pixels=max_pixels)
-        if self.use_hf:
-            response = self._inference_with_hf(image, prompt)
+        skipped, skipped_cells = self._blank_cells(origin_image, prompt_mode)
+        if skipped:
+            response = json.dumps(skipped_cells) if prompt_mode != 'prompt_ocr' else ''
         else:
-            response = self._inference_with_vllm(image, prompt)
+            prompt = self.get_prompt(prompt_mode, bbox, origin_image, image, min_pixels=min_pixels, max_pixels=max_pixels)
+            if self.use_hf:
+                response = self._inference_with_hf(image, prompt)
+            else:
+                response = self._inference_with_vllm(image, prompt)
         result = {'page_no': page_idx,
             "input_height": input_height,
             "input_width": input_width
         }
+        if skipped:
+            result['skipped'] = skipped
         if source == 'pdf':
             save_name = f"{save_name}_page_{page_idx}"
         if prompt_mode in ['prompt_layout_all_en', 'prompt_layout_only_en', 'prompt_grounding_ocr']:
-            cells, filtered = post_process_output(
-                response, 
-                prompt_mode, 
-                origin_image, 
-                image,
-                min_pixels=min_pixels, 
-                max_pixels=max_pixels,
-                )
+            if skipped:  # cells are already in origin_image coordinates
+                cells, filtered = skipped_cells, False
+            else:
+                cells, filtered = post_process_output(
+                    response, 
+                    prompt_mode, 
+                    origin_image, 
+                    image,
+                    min_pixels=min_pixels, 
+                    max_pixels=max_pixels,
+                    )
             if filtered and prompt_mode != 'prompt_layout_only_en':  # model output json failed, use filtered process
                 json_file_path = os.path.join(save_dir, f"{save_name}.json")
                 with open(json_file_path, 'w', encoding="utf-8") as w:
@@ -250,14 +327,15 @@ class DotsOCRParser:
         return result
     
     def parse_image(self, input_path, filename, prompt_mode, save_dir, bbox=None, fitz_preprocess=False):
-        origin_image = fetch_image(input_path)
+        origin_image = fetch_image(input_path, keep_gray=self.grayscale)
         result = self._parse_single_image(origin_image, prompt_mode, save_dir, filename, source="image", bbox=bbox, fitz_preprocess=fitz_preprocess)
         result['file_path'] = input_path
+        self._report_skipped([result])
         return [result]
         
     def parse_pdf(self, input_path, filename, prompt_mode, save_dir):
         print(f"loading pdf: {input_path}")
-        images_origin = load_images_from_pdf(input_path, dpi=self.dpi)
+        images_origin = load_images_from_pdf(input_path, dpi=self.dpi, grayscale=self.grayscale)
         total_pages = len(images_origin)
         tasks = [
             {
@@ -287,6 +365,7 @@ class DotsOCRParser:
                     pbar.update(1)
 
         results.sort(key=lambda x: x["page_no"])
+        self._report_skipped(results)
         for i in range(len(results)):
             results[i]['file_path'] = input_path
         return results
@@ -395,6 +474,30 @@ def main():
         "--use_hf", type=bool, default=False,
         help=""
     )
+    parser.add_argument(
+        "--speculative", action='store_true',
+        help="with --use_hf, draft tokens by n-gram lookup in the JSON skeleton and previous outputs (greedy output unchanged)"
+    )
+    parser.add_argument(
+        "--quantize", choices=["none", "int8"], default=None,
+        help="with --use_hf on cpu, int8 dynamic quantization of the Linear layers (default: OCR_QUANTIZE, else int8)"
+    )
+    parser.add_argument(
+        "--threads", type=int, default=None,
+        help="with --use_hf, torch intra-op threads, 0 keeps torch's default (default: OCR_THREADS)"
+    )
+    parser.add_argument(
+        "--interop_threads", type=int, default=None,
+        help="with --use_hf, torch inter-op threads, 0 keeps torch's default (default: OCR_INTEROP_THREADS)"
+    )
+    parser.add_argument(
+        "--skip_blank", action='store_true',
+        help="classify empty and picture-only images with a cheap ink-density pass and skip inference for them"
+    )
+    parser.add_argument(
+        "--grayscale", action='store_true',
+        help="keep images single-channel through rendering and upload, for black-and-white scans"
+    )
     args = parser.parse_args()
 
     dots_ocr_parser = DotsOCRParser(
@@ -410,6 +513,12 @@ def main():
         min_pixels=args.min_pixels,
         max_pixels=args.max_pixels,
         use_hf=args.use_hf,
+        skip_blank=args.skip_blank,
+        speculative=args.speculative,
+        grayscale=args.grayscale,
+        quantize=args.quantize,
+        threads=args.threads,
+        interop_threads=args.interop_threads,
     )
 
     fitz_preprocess = not args.no_fitz_preprocess
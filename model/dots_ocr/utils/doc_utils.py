@@ -17,29 +17,33 @@ class PageInfo(BaseModel):
     h: float = Field(description='the height of page')
 
 
-def fitz_doc_to_image(doc, target_dpi=200, origin_dpi=None) -> dict:
+def fitz_doc_to_image(doc, target_dpi=200, origin_dpi=None, grayscale=False) -> dict:
     """Convert fitz.Document to image, Then convert the image to numpy array.
 
     Args:
         doc (_type_): pymudoc page
         dpi (int, optional): reset the dpi of dpi. Defaults to 200.
+        grayscale (bool, optional): render a single-channel 'L' image. Defaults to False.
 
     Returns:
         dict:  {'img': numpy array, 'width': width, 'height': height }
     """
     from PIL import Image
-    mat = fitz.Matrix(target_dpi / 72, target_dpi / 72)
+    # decide the fallback scale from the page size up front instead of rendering twice
+    zoom = target_dpi / 72
+    if doc.rect.width * zoom > 4500 or doc.rect.height * zoom > 4500:
+        zoom = 72 / 72  # use fitz default dpi
+    mat = fitz.Matrix(zoom, zoom)
+    if grayscale:
+        pm = doc.get_pixmap(matrix=mat, colorspace=fitz.csGRAY, alpha=False)
+        return Image.frombytes('L', (pm.width, pm.height), pm.samples)
     pm = doc.get_pixmap(matrix=mat, alpha=False)
 
-    if pm.width > 4500 or pm.height > 4500:
-        mat = fitz.Matrix(72 / 72, 72 / 72)  # use fitz default dpi
-        pm = doc.get_pixmap(matrix=mat, alpha=False)
-
     image = Image.frombytes('RGB', (pm.width, pm.height), pm.samples)
     return image
 
 
-def load_images_from_pdf(pdf_file, dpi=200, start_page_id=0, end_page_id=None) -> list:
+def load_images_from_pdf(pdf_file, dpi=200, start_page_id=0, end_page_id=None, grayscale=False) -> list:
     images = []
     with fitz.open(pdf_file) as doc:
         pdf_page_num = doc.page_count
@@ -55,6 +59,6 @@ def load_images_from_pdf(pdf_file, dpi=200, start_page_id=0, end_page_id=None) -
         for index in range(0, doc.page_count):
             if start_page_id <= index <= end_page_id:
                 page = doc[index]
-                img = fitz_doc_to_image(page, target_dpi=dpi)
+                img = fitz_doc_to_image(page, target_dpi=dpi, grayscale=grayscale)
                 images.append(img)
     return images
\ No newline at end of file
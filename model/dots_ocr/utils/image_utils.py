@@ -5,10 +5,14 @@ from typing import Tuple
 import os
 from dots_ocr.utils.consts import IMAGE_FACTOR, MIN_PIXELS, MAX_PIXELS
 from dots_ocr.utils.doc_utils import fitz_doc_to_image
+from dots_ocr.utils.ink_utils import (
+    BLANK_MAX_INK_RATIO, BLANK_MIN_COMPONENTS, PICTURE_MAX_COMPONENTS, PICTURE_MIN_MIDTONE_RATIO, classify_region,
+)
 from io import BytesIO
 import fitz
 import requests
 import copy
+from dataclasses import asdict
 
 
 def round_by_factor(number: int, factor: int) -> int:
@@ -71,7 +75,10 @@ def PILimage_to_base64(image, format='PNG'):
     return f"data:image/{format.lower()};base64,{base64_str}"
 
 
-def to_rgb(pil_image: Image.Image) -> Image.Image:
+def to_rgb(pil_image: Image.Image, keep_gray: bool = False) -> Image.Image:
+    # keep_gray: leave 'L' and '1' scans single-channel, the model processor expands them to RGB
+    if keep_gray and pil_image.mode in ('L', '1'):
+        return pil_image
     if pil_image.mode == 'RGBA':
         white_background = Image.new("RGB", pil_image.size, (255, 255, 255))
         white_background.paste(pil_image, mask=pil_image.split()[3])  # Use alpha channel as mask
@@ -87,6 +94,7 @@ def fetch_image(
         max_pixels=None,
         resized_height=None,
         resized_width=None,
+        keep_gray=False,
     ) -> Image.Image:
     assert image is not None, f"image not found, maybe input format error: {image}"
     image_obj = None
@@ -111,7 +119,7 @@ def fetch_image(
         image_obj = Image.open(image)
     if image_obj is None:
         raise ValueError(f"Unrecognized image input, support local path, http url, base64 and PIL.Image, got {image}")
-    image = to_rgb(image_obj)
+    image = to_rgb(image_obj, keep_gray=keep_gray)
     ## resize
     if resized_height and resized_width:
         resized_height, resized_width = smart_resize(
@@ -167,7 +175,7 @@ def get_input_dimensions(
     return input_width, input_height
 
 
-def get_image_by_fitz_doc(image, target_dpi=200):
+def get_image_by_fitz_doc(image, target_dpi=200, grayscale=False):
     # get image through fitz, to get target dpi image, mainly for higher image
     if not isinstance(image, Image.Image):
         assert isinstance(image, str)
@@ -191,6 +199,32 @@ def get_image_by_fitz_doc(image, target_dpi=200):
     pdf_bytes = fitz.open(stream=data_bytes).convert_to_pdf()
     doc = fitz.open('pdf', pdf_bytes)
     page = doc[0]
-    image_fitz = fitz_doc_to_image(page, target_dpi=target_dpi, origin_dpi=origin_dpi)
+    image_fitz = fitz_doc_to_image(page, target_dpi=target_dpi, origin_dpi=origin_dpi, grayscale=grayscale)
 
     return image_fitz
+
+
+def classify_blank_image(
+    image: Image.Image,
+    max_ink_ratio: float = BLANK_MAX_INK_RATIO,
+    min_components: int = BLANK_MIN_COMPONENTS,
+    picture_midtone_ratio: float = PICTURE_MIN_MIDTONE_RATIO,
+    picture_max_components: int = PICTURE_MAX_COMPONENTS,
+):
+    """
+    Classifies an image as 'empty', 'picture' or 'text' before inference
+    (see dots_ocr.utils.ink_utils.classify_region).
+
+    Returns:
+        (kind, stats) where stats is a dict with 'ink_ratio' and 'midtone_ratio'
+        (shares of the downsampled copy), 'components' (glyph-sized blobs) and
+        'large_components' (blobs too big to be glyphs).
+    """
+    kind, stats = classify_region(
+        image,
+        max_ink_ratio=max_ink_ratio,
+        min_components=min_components,
+        picture_midtone_ratio=picture_midtone_ratio,
+        picture_max_components=picture_max_components,
+    )
+    return kind, asdict(stats)
@@ -0,0 +1,130 @@
+"""
+Blank / picture-only detection before inference.
+
+Cheap statistics of a downsampled grayscale copy: ink density, photo-like
+midtones and glyph-sized connected components. Needs only numpy and Pillow,
+so the ETL (app.image_utils) imports it from here as well.
+"""
+from dataclasses import dataclass
+from typing import Tuple
+
+import numpy as np
+from PIL import Image
+
+ANALYSIS_SIDE = 512          # long side of the downsampled grayscale copy
+INK_CONTRAST = 48            # pixels this much darker than the paper count as ink
+MIDTONE_DEPTH = (48, 176)    # this far below the paper tone counts as photo/halftone tones
+
+BLANK_MAX_INK_RATIO = 0.002  # below this much ink the region is empty
+BLANK_MIN_COMPONENTS = 4     # fewer glyph-sized blobs than this is empty
+PICTURE_MIN_MIDTONE_RATIO = 0.25
+PICTURE_MAX_COMPONENTS = 40  # text regions produce many small components
+GLYPH_MAX_AREA = 0.01        # components larger than this share of the copy are not glyphs
+
+
+@dataclass
+class InkStats:
+    """Cheap statistics of a downsampled grayscale copy of an image"""
+    ink_ratio: float
+    midtone_ratio: float
+    components: int        # glyph-sized connected components
+    large_components: int  # components too big to be a glyph
+
+
+def to_analysis_gray(image: Image.Image, side: int = ANALYSIS_SIDE) -> np.ndarray:
+    """
+    Return a small grayscale copy of the image as a uint8 array.
+    """
+    gray = image.convert("L")
+    gray.thumbnail((side, side), Image.Resampling.BOX)
+    return np.asarray(gray, dtype=np.uint8)
+
+
+def component_areas(mask: np.ndarray) -> np.ndarray:
+    """
+    Pixel areas of the 4-connected components of a boolean mask.
+    Horizontal runs of the mask are joined where they touch vertically,
+    with a union-find over runs in numpy rather than a per-pixel flood fill.
+    """
+    starts = mask.copy()
+    starts[:, 1:] &= ~mask[:, :-1]
+    run_id = np.cumsum(starts.ravel()).reshape(mask.shape) - 1
+    n = int(starts.sum())
+    if not n:
+        return np.zeros(0, dtype=np.int64)
+    lengths = np.bincount(run_id[mask], minlength=n)
+    touching = mask[:-1] & mask[1:]
+    a, b = run_id[:-1][touching], run_id[1:][touching]
+
+    # hook each linked pair's roots onto the smaller one, then compress paths
+    labels = np.arange(n)
+    while True:
+        ra, rb = labels[a], labels[b]
+        if np.array_equal(ra, rb):
+            break
+        low = np.minimum(ra, rb)
+        np.minimum.at(labels, ra, low)
+        np.minimum.at(labels, rb, low)
+        while True:
+            jumped = labels[labels]
+            if np.array_equal(jumped, labels):
+                break
+            labels = jumped
+    return np.bincount(labels, weights=lengths, minlength=n)[labels == np.arange(n)].astype(np.int64)
+
+
+def count_components(mask: np.ndarray, max_area: int) -> Tuple[int, int]:
+    """
+    Count 4-connected components of a boolean mask.
+    Returns (components with area <= max_area, larger components).
+    """
+    areas = component_areas(mask)
+    # single specks are scanner dust, not glyphs
+    areas = areas[areas >= 2]
+    return int(np.count_nonzero(areas <= max_area)), int(np.count_nonzero(areas > max_area))
+
+
+def ink_stats(image: Image.Image, side: int = ANALYSIS_SIDE) -> InkStats:
+    """
+    Compute ink density, mid-tone density and component counts of an image.
+    """
+    gray = to_analysis_gray(image, side=side)
+    hist = np.bincount(gray.ravel(), minlength=256)
+    total = max(int(gray.size), 1)
+
+    # downsampling thins strokes to gray, so ink (and photo tones) are judged
+    # against the paper tone: toned or gray-scanned paper is not a midtone
+    paper = int(np.percentile(gray, 90))
+    ink_level = max(paper - INK_CONTRAST, 1)
+    lo, hi = max(paper - MIDTONE_DEPTH[1], 0), max(paper - MIDTONE_DEPTH[0], 0)
+    ink_mask = gray < ink_level
+    small, large = count_components(ink_mask, max_area=int(total * GLYPH_MAX_AREA))
+    return InkStats(
+        ink_ratio=float(hist[:ink_level].sum()) / total,
+        midtone_ratio=float(hist[lo:hi].sum()) / total,
+        components=small,
+        large_components=large,
+    )
+
+
+def classify_region(
+    image: Image.Image,
+    max_ink_ratio: float = BLANK_MAX_INK_RATIO,
+    min_components: int = BLANK_MIN_COMPONENTS,
+    picture_midtone_ratio: float = PICTURE_MIN_MIDTONE_RATIO,
+    picture_max_components: int = PICTURE_MAX_COMPONENTS,
+) -> Tuple[str, InkStats]:
+    """
+    Classify an image as "empty", "picture" or "text" before inference.
+    Returns (kind, InkStats).
+    """
+    stats = ink_stats(image)
+    if stats.ink_ratio < max_ink_ratio or (
+        stats.components < min_components and stats.large_components == 0
+    ):
+        return "empty", stats
+    if stats.components < picture_max_components and (
+        stats.midtone_ratio >= picture_midtone_ratio or stats.large_components > 0
+    ):
+        return "picture", stats
+    return "text", stats
@@ -9,6 +9,12 @@ from dots_ocr.utils.image_utils import smart_resize
 from dots_ocr.utils.consts import MIN_PIXELS, MAX_PIXELS
 from dots_ocr.utils.output_cleaner import OutputCleaner
 
+try:  # optional prometheus metric, exposed by whatever app scrapes the default registry
+    from prometheus_client import Counter
+    CLEANER_FALLBACKS = Counter('dots_ocr_cleaner_fallbacks_total', 'Model outputs that failed JSON parsing and went through OutputCleaner', ['prompt_mode'])
+except ImportError:
+    CLEANER_FALLBACKS = None
+
 
 # Define a color map (using RGBA format)
 dict_layout_type_to_color = {
@@ -221,6 +227,8 @@ def post_process_output(response, prompt_mode, origin_image, input_image, min_pi
         json_load_failed = True
 
     if json_load_failed:
+        if CLEANER_FALLBACKS is not None:
+            CLEANER_FALLBACKS.labels(prompt_mode=prompt_mode).inc()
         cleaner = OutputCleaner()
         response_clean = cleaner.clean_model_output(cells)
         if isinstance(response_clean, list):
@@ -1,12 +1,39 @@
-from fastapi import FastAPI, UploadFile, Form
+from fastapi import FastAPI, UploadFile, Form, Header
 from fastapi.responses import JSONResponse
 from PIL import Image
 import torch
-from transformers import AutoModelForCausalLM, AutoProcessor
+from transformers import AutoModelForCausalLM, AutoProcessor, BatchFeature
 from qwen_vl_utils import process_vision_info
-import io, json
+import io, json, os
+import asyncio
+import contextvars
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
 from pathlib import Path
 from huggingface_hub import snapshot_download
+from app.metrics import (
+    metrics_response,
+    OCR_REQUESTS,
+    OCR_QUEUE_WAIT,
+    OCR_PREPROCESS,
+    OCR_PREPROCESS_HIDDEN,
+    OCR_GENERATE,
+    OCR_DRAFT_TOKENS,
+    OCR_TOKENS_PER_SECOND,
+    OCR_INPUT_TOKENS,
+    OCR_OUTPUT_TOKENS,
+    OCR_PARSE_FAILURES,
+    OCR_QUEUE_DEPTH,
+    OCR_COST_RATIO,
+)
+from app.image_utils import ink_ratio, vision_tokens
+from app.tracing import annotate, trace_context, span
+from model.compiled import compile_decoder, eager_decoder, parse_buckets, snap_to_bucket, static_generation_config, warm_up
+from model.scheduler import CostModel, Job, Scheduler
+from model.speculative import PromptLookupDecoder
 
 # Fixed default prompt (same as in your script)
 DEFAULT_PROMPT = """\
@@ -24,68 +51,452 @@ Please output the layout information from the image, including each layout eleme
 5. Final Output: The entire output must be a single JSON object.\
 """
 
-MODEL_ID = "helizac/dots.ocr-4bit"
+# Second stage of two-stage OCR: the text of one region crop (dots.ocr's prompt_ocr)
+REGION_PROMPT = "Extract the text content from this image."
+
+IMAGE_FACTOR = 28  # patch_size * merge_size; presized uploads must be multiples of this
+# Region crops per generate call; rows of a batch finish with the longest one
+REGION_BATCH = int(os.environ.get("OCR_REGION_BATCH", "8"))
+
+# --------------------
+# Backend: GPU (4-bit, flash attention) or CPU (SDPA, optional int8 dynamic quantization)
+# --------------------
+
+# auto | cuda | cpu
+DEVICE = os.environ.get("OCR_DEVICE", "auto")
+if DEVICE == "auto":
+    DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
+# The 4-bit checkpoint needs bitsandbytes on CUDA; CPU loads the full weights
+MODEL_ID = os.environ.get("OCR_MODEL_ID", "helizac/dots.ocr-4bit" if DEVICE == "cuda" else "rednote-hilab/dots.ocr")
+# none | int8: quantize nn.Linear weights to int8 at load time, activations per batch (CPU only)
+QUANTIZE = os.environ.get("OCR_QUANTIZE", "int8" if DEVICE == "cpu" else "none")
+# torch intra-op / inter-op threads; 0 keeps torch's default (one per core, or OMP_NUM_THREADS)
+THREADS = int(os.environ.get("OCR_THREADS", "0"))
+INTEROP_THREADS = int(os.environ.get("OCR_INTEROP_THREADS", "0"))
+MAX_NEW_TOKENS = int(os.environ.get("OCR_MAX_NEW_TOKENS", "4096"))
+# off | lookup (n-gram drafts from the JSON skeleton and previous outputs) | draft (OCR_DRAFT_MODEL)
+SPECULATIVE = os.environ.get("OCR_SPECULATIVE", "off")
+DRAFT_MODEL_ID = os.environ.get("OCR_DRAFT_MODEL")
+# 1: bucketed input geometry, static KV cache, compiled decoder (see model/compiled.py)
+COMPILE = os.environ.get("OCR_COMPILE", "0") == "1"
+
+if THREADS:
+    torch.set_num_threads(THREADS)
+if INTEROP_THREADS:
+    torch.set_num_interop_threads(INTEROP_THREADS)
+
+
+def load_model(model_path: str):
+    if DEVICE == "cuda":
+        return AutoModelForCausalLM.from_pretrained(
+            model_path,
+            device_map="auto",
+            trust_remote_code=True,
+            torch_dtype=torch.bfloat16,
+            attn_implementation="flash_attention_2"
+        )
+
+    # dynamic quantization works on float32 Linear layers
+    cpu_model = AutoModelForCausalLM.from_pretrained(
+        model_path,
+        device_map="cpu",
+        trust_remote_code=True,
+        torch_dtype=torch.float32,
+        attn_implementation="sdpa"
+    ).eval()
+    if QUANTIZE == "int8":
+        cpu_model = torch.ao.quantization.quantize_dynamic(cpu_model, {torch.nn.Linear}, dtype=torch.qint8)
+    return cpu_model
+
 
 # Load model once at startup
 local_model_path = snapshot_download(repo_id=MODEL_ID)
 
-model = AutoModelForCausalLM.from_pretrained(
-    local_model_path,
-    device_map="auto",
-    trust_remote_code=True,
-    torch_dtype=torch.bfloat16,
-    attn_implementation="flash_attention_2"
-)
+model = load_model(local_model_path)
 processor = AutoProcessor.from_pretrained(local_model_path, trust_remote_code=True, use_fast=True)
+processor.tokenizer.padding_side = "left"  # batched region prompts are generated together
+print(f"[OCR] {MODEL_ID} on {DEVICE} (quantize={QUANTIZE}, threads={torch.get_num_threads()}, interop={torch.get_num_interop_threads()})")
+
+decoder = None
+if SPECULATIVE == "lookup":
+    decoder = PromptLookupDecoder(processor.tokenizer)
+elif SPECULATIVE == "draft":
+    if not DRAFT_MODEL_ID:
+        raise RuntimeError("OCR_SPECULATIVE=draft needs OCR_DRAFT_MODEL (a small model with the same tokenizer)")
+    decoder = PromptLookupDecoder(processor.tokenizer, draft_model=load_model(snapshot_download(repo_id=DRAFT_MODEL_ID)))
+if decoder is not None:
+    print(f"[OCR] speculative decoding: {SPECULATIVE}" + (f" ({DRAFT_MODEL_ID})" if DRAFT_MODEL_ID and SPECULATIVE == "draft" else ""))
+
+buckets = static_config = None
+if COMPILE:
+    if decoder is not None:
+        raise RuntimeError("OCR_COMPILE=1 cannot be combined with OCR_SPECULATIVE (assisted generation has no static cache)")
+    buckets = parse_buckets()
+    compile_decoder(model)
+    static_config = static_generation_config(model)
 
 ocr_app = FastAPI()
+# One generate at a time; waiting here is the queue, cheapest predicted call first
+scheduler = Scheduler()
+cost_model = CostModel(MAX_NEW_TOKENS)
+
+
+# --------------------
+# Preprocessing: CPU thread pool, overlapped with the running generate
+# --------------------
+
+# Requests preprocessed ahead of the model; each holds one image's tensors
+PREPROCESS_WORKERS = int(os.environ.get("OCR_PREPROCESS_WORKERS", "2" if DEVICE == "cuda" else "1"))
+preprocess_pool = ThreadPoolExecutor(max_workers=PREPROCESS_WORKERS, thread_name_prefix="preprocess")
+_copy_streams = threading.local()
+
+# Token ids per (prompt, image grid): with the prompt fixed, the text side only
+# changes with the number of image tokens, i.e. with the image geometry.
+PROMPT_TOKENS_SIZE = 256
+PROMPT_TOKENS: Dict[Tuple[str, Tuple[int, ...]], Tuple[torch.Tensor, torch.Tensor]] = {}
+
+
+@lru_cache(maxsize=32)
+def prompt_text(prompt: str) -> str:
+    """
+    The chat template rendered around one image placeholder and the prompt.
+    """
+    messages = [{"role": "user", "content": [{"type": "image"}, {"type": "text", "text": prompt}]}]
+    return processor.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
+
+
+class _ModelClock:
+    """
+    Cumulative seconds the model has spent generating; the difference over an
+    interval is how much of it overlapped with generate.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.total = 0.0
+        self.since: Optional[float] = None
+
+    def now(self) -> float:
+        with self.lock:
+            return self.total + (time.perf_counter() - self.since if self.since is not None else 0.0)
+
+    def start(self):
+        with self.lock:
+            self.since = time.perf_counter()
+
+    def stop(self):
+        with self.lock:
+            self.total += time.perf_counter() - self.since
+            self.since = None
+
+
+model_clock = _ModelClock()
+
+
+def to_device(inputs: BatchFeature) -> Tuple[BatchFeature, Optional[Any]]:
+    """
+    On CUDA: pin, then copy on this thread's own stream; the event marks the end of the copy.
+    """
+    if DEVICE != "cuda":
+        return inputs.to(model.device), None
+    stream = getattr(_copy_streams, "stream", None)
+    if stream is None:
+        stream = _copy_streams.stream = torch.cuda.Stream(device=model.device)
+    inputs = BatchFeature({k: v.pin_memory() for k, v in inputs.items()})
+    with torch.cuda.stream(stream):
+        inputs = inputs.to(model.device, non_blocking=True)
+        copied = torch.cuda.Event()
+        copied.record(stream)
+    return inputs, copied
+
+
+def preprocess(image: Image.Image, prompt: str, presized: bool) -> Tuple[BatchFeature, Optional[Any]]:
+    """
+    Vision preprocessing and the host to device copy for one request. On CUDA
+    the tensors are pinned and copied on this thread's own stream; the
+    returned event marks the end of the copy.
+    """
+    start = time.perf_counter()
+    busy = model_clock.now()
+    with span("processor"):
+        if presized:
+            image_inputs = [image.convert("RGB")]
+        else:
+            messages = [{"role": "user", "content": [{"type": "image", "image": image}, {"type": "text", "text": prompt}]}]
+            image_inputs, _ = process_vision_info(messages)
+        resize = {"do_resize": False} if presized else {}
+
+        vision = processor.image_processor(images=image_inputs, return_tensors="pt", **resize)
+        key = (prompt, tuple(vision["image_grid_thw"].flatten().tolist()))
+        tokens = PROMPT_TOKENS.get(key)
+        if tokens is None:
+            full = processor(text=[prompt_text(prompt)], images=image_inputs, padding=True, return_tensors="pt", **resize)
+            if len(PROMPT_TOKENS) >= PROMPT_TOKENS_SIZE:
+                PROMPT_TOKENS.clear()
+            tokens = PROMPT_TOKENS[key] = (full["input_ids"], full["attention_mask"])
+        inputs = BatchFeature({"input_ids": tokens[0], "attention_mask": tokens[1], **vision})
+
+        inputs, copied = to_device(inputs)
+        hidden = model_clock.now() - busy
+        annotate(hidden=round(hidden, 6))
+    OCR_PREPROCESS.observe(time.perf_counter() - start)
+    OCR_PREPROCESS_HIDDEN.observe(hidden)
+    OCR_INPUT_TOKENS.observe(inputs["input_ids"].shape[1])
+    return inputs, copied
+
+
+def preprocess_regions(crops: List[Image.Image], prompt: str) -> Tuple[BatchFeature, Optional[Any]]:
+    """
+    One batch row per region crop, each resized by the processor and left-padded for generate.
+    """
+    start = time.perf_counter()
+    with span("processor", regions=len(crops)):
+        inputs = processor(
+            text=[prompt_text(prompt)] * len(crops),
+            images=[c.convert("RGB") for c in crops],
+            padding=True,
+            return_tensors="pt",
+        )
+        inputs, copied = to_device(inputs)
+    OCR_PREPROCESS.observe(time.perf_counter() - start)
+    return inputs, copied
+
+
+def generate(inputs: BatchFeature, copied: Optional[Any] = None, job: Optional[Job] = None, compiled: bool = False) -> str:
+    """
+    Generate and decode the layout output for preprocessed inputs.
+    """
+    return generate_texts(inputs, copied, job, compiled)[0]
+
+
+def generate_texts(
+    inputs: BatchFeature, copied: Optional[Any] = None, job: Optional[Job] = None, compiled: bool = False
+) -> List[str]:
+    """
+    Generate and decode every row of a preprocessed batch. Rows stop at
+    their own EOS; the batch takes as long as its longest row. The
+    scheduler's job, if given, learns from the measured time and lengths.
+    compiled: a bucketed default-prompt image, run on the compiled decoder
+    in compiled mode; everything else runs eager there.
+    """
+    batch = inputs["input_ids"].shape[0]
+    if copied is not None:
+        current = torch.cuda.current_stream(model.device)
+        current.wait_event(copied)
+        for tensor in inputs.values():
+            tensor.record_stream(current)  # allocated on the copy stream, used on this one
+
+    # Run generation
+    start = time.perf_counter()
+    model_clock.start()
+    try:
+        with span("generate", input_tokens=int(inputs["input_ids"].shape[1])), torch.inference_mode():
+            greedy = dict(max_new_tokens=MAX_NEW_TOKENS, do_sample=False, temperature=0.0, repetition_penalty=1.0)
+            if static_config is not None and compiled and batch == 1:
+                generated_ids = model.generate(**inputs, generation_config=static_config, **greedy)
+            elif static_config is not None:
+                with eager_decoder(model):
+                    generated_ids = model.generate(**inputs, **greedy)
+            elif decoder is None or batch > 1:
+                generated_ids = model.generate(**inputs, **greedy)
+            else:
+                generated_ids, stats = decoder.generate(model, inputs, **greedy)
+                OCR_DRAFT_TOKENS.labels(result="accepted").inc(stats.accepted)
+                OCR_DRAFT_TOKENS.labels(result="rejected").inc(stats.drafted - stats.accepted)
+                annotate(drafted=stats.drafted, accepted=stats.accepted)
+    finally:
+        model_clock.stop()
+    seconds = time.perf_counter() - start
+    OCR_GENERATE.observe(seconds)
+    new_tokens = generated_ids.shape[1] - inputs["input_ids"].shape[1]
+    OCR_TOKENS_PER_SECOND.observe(new_tokens * batch / max(seconds, 1e-9))
+
+    # Decode only new tokens
+    with span("decode"):
+        generated_ids_trimmed = [
+            out_ids[len(in_ids):]
+            for in_ids, out_ids in zip(inputs["input_ids"], generated_ids)
+        ]
+        for ids in generated_ids_trimmed:
+            OCR_OUTPUT_TOKENS.observe(len(ids))
+        if job is not None:
+            cost_model.observe(job, seconds, [len(ids) for ids in generated_ids_trimmed])
+            OCR_COST_RATIO.observe(seconds / max(job.predicted_seconds, 1e-9))
+        return processor.batch_decode(
+            generated_ids_trimmed,
+            skip_special_tokens=True,
+            clean_up_tokenization_spaces=False
+        )
+
+
+def run_model(image: Image.Image, prompt: str, presized: bool) -> str:
+    """
+    Preprocess one image, generate and decode the layout output, serially.
+    """
+    return generate(*preprocess(image, prompt, presized), compiled=bool(buckets) and prompt == DEFAULT_PROMPT)
+
+
+def rescale_blocks(output_text: str, width: int, height: int, orig_width: int, orig_height: int):
+    """
+    Map bboxes from the model input size back to the client's original image size.
+    Returns the raw output wrapped in a dict if it is not valid layout JSON.
+    """
+    try:
+        blocks = json.loads(output_text)
+    except json.JSONDecodeError:
+        blocks = None
+    if not isinstance(blocks, list):
+        OCR_PARSE_FAILURES.labels(where="server").inc()
+        return {"raw_output": output_text}
+
+    sx, sy = orig_width / width, orig_height / height
+    for b in blocks:
+        bbox = b.get("bbox") if isinstance(b, dict) else None
+        if isinstance(bbox, list) and len(bbox) == 4:
+            b["bbox"] = [int(bbox[0] * sx), int(bbox[1] * sy), int(bbox[2] * sx), int(bbox[3] * sy)]
+    return blocks
+
 
 @ocr_app.post("/infer")
-async def infer(file: UploadFile, prompt: str = Form(DEFAULT_PROMPT)):
+async def infer(
+    file: UploadFile,
+    prompt: str = Form(DEFAULT_PROMPT),
+    presized: bool = Form(False),
+    orig_width: int | None = Form(None),
+    orig_height: int | None = Form(None),
+    x_trace_id: str | None = Header(None),
+    x_parent_span_id: str | None = Header(None),
+):
     """
     Inference endpoint: takes an image, runs OCR model,
     returns JSON layout result.
+    presized: the client already resampled the image to the processor's
+    target geometry, so it is fed to the model without another resize.
+    orig_width/orig_height: bboxes are mapped back to this size and the
+    parsed blocks are returned instead of the raw text.
+    X-Trace-Id / X-Parent-Span-Id: continue the client's trace.
     """
-    # Load image
-    image = Image.open(io.BytesIO(await file.read()))
+    with trace_context(x_trace_id, x_parent_span_id), span("infer"):
+        # Load image
+        image = Image.open(io.BytesIO(await file.read()))
+        presized = presized and image.width % IMAGE_FACTOR == 0 and image.height % IMAGE_FACTOR == 0
+        content_size = image.size
+        if buckets:
+            # bboxes come back relative to the content, not the padded canvas
+            image, content_size = snap_to_bucket(image, buckets)
+            presized = True
 
-    # Build messages
-    messages = [
-        {"role": "user", "content": [
-            {"type": "image", "image": image},
-            {"type": "text", "text": prompt}
-        ]}
-    ]
+        # Preprocess on the pool while the model works on earlier requests,
+        # then generate off the event loop so /metrics stays responsive under load
+        def prepare():
+            inputs, copied = preprocess(image, prompt, presized)
+            row = (vision_tokens(*image.size), ink_ratio(image))
+            return inputs, copied, cost_model.job(prompt, [row], int(inputs["input_ids"].shape[1]))
 
-    # Preprocess
-    text = processor.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
-    image_inputs, _ = process_vision_info(messages)
+        def locked_generate(inputs, copied, job):
+            arrived = time.perf_counter()
+            with span("queue", predicted=round(job.predicted_seconds, 3)):
+                OCR_QUEUE_DEPTH.inc()
+                scheduler.acquire(job)
+                OCR_QUEUE_DEPTH.dec()
+            try:
+                OCR_QUEUE_WAIT.observe(time.perf_counter() - arrived)
+                return generate(inputs, copied, job, compiled=bool(buckets) and prompt == DEFAULT_PROMPT)
+            finally:
+                scheduler.release()
 
-    inputs = processor(
-        text=[text],
-        images=image_inputs,
-        padding=True,
-        return_tensors="pt"
-    ).to(model.device)
+        try:
+            loop = asyncio.get_running_loop()
+            prepared = await loop.run_in_executor(preprocess_pool, contextvars.copy_context().run, prepare)
+            output_text = await asyncio.to_thread(locked_generate, *prepared)
+        except Exception:
+            OCR_REQUESTS.labels(status="error").inc()
+            raise
+        OCR_REQUESTS.labels(status="ok").inc()
 
-    # Run generation
-    generated_ids = model.generate(
-        **inputs,
-        max_new_tokens=4096,
-        do_sample=False,
-        temperature=0.0,
-        repetition_penalty=1.0
-    )
+        if orig_width and orig_height:
+            with span("post_process"):
+                return rescale_blocks(output_text, *content_size, orig_width, orig_height)
+        return output_text
 
-    # Decode only new tokens
-    generated_ids_trimmed = [
-        out_ids[len(in_ids):]
-        for in_ids, out_ids in zip(inputs.input_ids, generated_ids)
-    ]
-    output_text = processor.batch_decode(
-        generated_ids_trimmed,
-        skip_special_tokens=True,
-        clean_up_tokenization_spaces=False
-    )[0]
-
-    return output_text
+
+@ocr_app.post("/infer_regions")
+async def infer_regions(
+    file: UploadFile,
+    bboxes: str = Form(...),
+    prompt: str = Form(REGION_PROMPT),
+    x_trace_id: str | None = Header(None),
+    x_parent_span_id: str | None = Header(None),
+):
+    """
+    Region recognition for two-stage OCR: crops the uploaded image to each
+    bbox (JSON list of [x1, y1, x2, y2] in its pixels) and returns the text
+    of each region, in bbox order. Crops are generated REGION_BATCH at a
+    time, sorted by predicted output length so a batch's rows finish together.
+    """
+    with trace_context(x_trace_id, x_parent_span_id), span("infer_regions"):
+        image = Image.open(io.BytesIO(await file.read())).convert("RGB")
+        crops = []
+        for x1, y1, x2, y2 in json.loads(bboxes):
+            x1, y1 = max(0, int(x1)), max(0, int(y1))
+            crops.append(image.crop((x1, y1, max(x1 + 1, min(image.width, int(x2))), max(y1 + 1, min(image.height, int(y2))))))
+
+        def measure():
+            rows = [(vision_tokens(*c.size), ink_ratio(c)) for c in crops]
+            order = sorted(range(len(crops)), key=lambda i: cost_model.predict(prompt, *rows[i]))
+            return rows, order
+
+        def locked_generate(batch, rows):
+            inputs, copied = preprocess_regions(batch, prompt)
+            job = cost_model.job(prompt, rows, int(inputs["input_ids"].numel()))
+            arrived = time.perf_counter()
+            with span("queue", predicted=round(job.predicted_seconds, 3)):
+                OCR_QUEUE_DEPTH.inc()
+                scheduler.acquire(job)
+                OCR_QUEUE_DEPTH.dec()
+            try:
+                OCR_QUEUE_WAIT.observe(time.perf_counter() - arrived)
+                return generate_texts(inputs, copied, job)
+            finally:
+                scheduler.release()
+
+        texts: List[str] = [""] * len(crops)
+        try:
+            rows, order = await asyncio.to_thread(measure)
+            for i in range(0, len(order), REGION_BATCH):
+                chunk = order[i:i + REGION_BATCH]
+                batch_texts = await asyncio.to_thread(
+                    locked_generate, [crops[j] for j in chunk], [rows[j] for j in chunk]
+                )
+                for j, text in zip(chunk, batch_texts):
+                    texts[j] = text
+        except Exception:
+            OCR_REQUESTS.labels(status="error").inc()
+            raise
+        OCR_REQUESTS.labels(status="ok").inc()
+        return texts
+
+
+@ocr_app.get("/health")
+async def health():
+    """
+    Liveness for the replica router; the model is loaded at import time.
+    """
+    return {
+        "status": "ok",
+        "model": MODEL_ID,
+        "device": DEVICE,
+        "quantize": QUANTIZE,
+        "threads": torch.get_num_threads(),
+        "speculative": SPECULATIVE,
+        "queued": scheduler.waiting(),
+    }
+
+
+@ocr_app.get("/metrics")
+async def metrics():
+    return metrics_response()
+
+
+if COMPILE:
+    warm_up(buckets, lambda canvas: run_model(canvas, DEFAULT_PROMPT, presized=True))
@@ -0,0 +1,361 @@
+"""
+Multi-replica OCR server: N model processes behind one router.
+
+Each replica is a uvicorn process serving the /infer app on its own Unix
+socket, pinned to a device (CUDA_VISIBLE_DEVICES) or a CPU set (affinity +
+thread count), so the weights are loaded exactly once per replica. The
+router keeps the public /infer and /infer_regions contract and forwards
+every request to the replica with the fewest requests in flight, holding
+requests back once every replica has MAX_INFLIGHT of them. Dead replicas are respawned;
+POST /replicas/{i}/restart drains one replica before restarting it.
+
+    python -m model.replicas --devices cuda:0,cuda:1 --port 8000
+    python -m model.replicas --devices cpu:0-3,cpu:4-7 --app benchmarks.stub_server:env_app --factory
+    python -m model.replicas --cpu-replicas 16 --threads-per-replica 1     # one single-threaded model per core
+"""
+import argparse
+import asyncio
+import itertools
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Set
+
+import httpx
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import Response
+
+from app.metrics import ROUTER_INFLIGHT, ROUTER_REQUESTS, ROUTER_RESTARTS, ROUTER_WAIT, metrics_response
+from app.tracing import PARENT_SPAN_HEADER, TRACE_HEADER
+
+ROOT = Path(__file__).resolve().parent.parent
+# Requests per replica: one generating plus one uploaded and preprocessed, ready to go
+MAX_INFLIGHT = 2
+HEALTH_INTERVAL = 2.0
+STARTUP_TIMEOUT = 600.0  # loading the weights can take minutes
+REQUEST_TIMEOUT = 900.0
+FORWARD_HEADERS = ("content-type", TRACE_HEADER.lower(), PARENT_SPAN_HEADER.lower())
+
+
+@dataclass
+class Replica:
+    index: int
+    device: str
+    socket_path: str
+    proc: Optional[subprocess.Popen] = None
+    inflight: int = 0
+    ready: bool = False
+    draining: bool = False
+    restarts: int = 0
+    served: int = 0
+    client: Optional[httpx.AsyncClient] = field(default=None, repr=False)
+
+    @property
+    def name(self) -> str:
+        return f"{self.index}:{self.device}"
+
+    @property
+    def available(self) -> bool:
+        return self.ready and not self.draining and self.inflight < MAX_INFLIGHT
+
+
+def parse_cpus(spec: str) -> Set[int]:
+    """"0-3+8" -> {0, 1, 2, 3, 8}"""
+    cpus = set()
+    for part in spec.split("+"):
+        lo, _, hi = part.partition("-")
+        cpus.update(range(int(lo), int(hi or lo) + 1))
+    return cpus
+
+
+def replica_env(device: str) -> Dict[str, str]:
+    env = {**os.environ, "PYTHONPATH": str(ROOT)}
+    if device.startswith("cuda:"):
+        env["CUDA_VISIBLE_DEVICES"] = device.split(":", 1)[1]
+    elif device.startswith("cpu"):
+        env.update(CUDA_VISIBLE_DEVICES="", OCR_DEVICE="cpu")
+        _, _, cpus = device.partition(":")
+        if cpus:
+            threads = str(len(parse_cpus(cpus)))
+            env.update(OMP_NUM_THREADS=threads, MKL_NUM_THREADS=threads, OCR_THREADS=threads, OCR_INTEROP_THREADS="1")
+    return env
+
+
+def cpu_devices(replicas: int, threads: int, first_cpu: int = 0) -> List[str]:
+    """
+    Consecutive, non-overlapping CPU sets: cpu_devices(4, 1) -> cpu:0, cpu:1, cpu:2, cpu:3
+    """
+    return [
+        f"cpu:{first_cpu + i * threads}" + (f"-{first_cpu + (i + 1) * threads - 1}" if threads > 1 else "")
+        for i in range(replicas)
+    ]
+
+
+class ReplicaPool:
+    def __init__(self, app_path: str, devices: List[str], factory: bool = False, socket_dir: Optional[str] = None):
+        self.app_path = app_path
+        self.factory = factory
+        self.socket_dir = socket_dir or tempfile.mkdtemp(prefix="ocr-replicas-")
+        self.replicas = [
+            Replica(i, device, os.path.join(self.socket_dir, f"replica{i}.sock"))
+            for i, device in enumerate(devices)
+        ]
+        self.slot_freed = asyncio.Condition()
+        self.round_robin = itertools.count()
+        self.monitor: Optional[asyncio.Task] = None
+
+    # --------------------
+    # Process management
+    # --------------------
+
+    def spawn(self, replica: Replica):
+        if os.path.exists(replica.socket_path):
+            os.unlink(replica.socket_path)
+        cmd = [sys.executable, "-m", "uvicorn", self.app_path, "--uds", replica.socket_path, "--log-level", "warning"]
+        if self.factory:
+            cmd.append("--factory")
+        preexec = None
+        if replica.device.startswith("cpu:") and hasattr(os, "sched_setaffinity"):
+            cpus = parse_cpus(replica.device.split(":", 1)[1])
+            preexec = lambda: os.sched_setaffinity(0, cpus)  # noqa: E731
+        replica.proc = subprocess.Popen(cmd, cwd=ROOT, env=replica_env(replica.device), preexec_fn=preexec)
+        replica.client = httpx.AsyncClient(
+            transport=httpx.AsyncHTTPTransport(uds=replica.socket_path),
+            base_url="http://replica",
+            timeout=REQUEST_TIMEOUT,
+        )
+        print(f"[ROUTER] replica {replica.name} started (pid {replica.proc.pid})")
+
+    async def wait_ready(self, replica: Replica, timeout: float = STARTUP_TIMEOUT):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if replica.proc.poll() is not None:
+                raise RuntimeError(f"replica {replica.name} exited with {replica.proc.returncode} during startup")
+            try:
+                (await replica.client.get("/health", timeout=2.0)).raise_for_status()
+                replica.ready = True
+                await self.notify()
+                print(f"[ROUTER] replica {replica.name} ready")
+                return
+            except httpx.HTTPError:
+                await asyncio.sleep(0.5)
+        raise RuntimeError(f"replica {replica.name} not ready after {timeout:.0f}s")
+
+    async def stop(self, replica: Replica, timeout: float = 30.0):
+        replica.ready = False
+        if replica.proc and replica.proc.poll() is None:
+            replica.proc.terminate()  # uvicorn finishes in-flight requests on SIGTERM
+            try:
+                await asyncio.to_thread(replica.proc.wait, timeout)
+            except subprocess.TimeoutExpired:
+                replica.proc.kill()
+        if replica.client:
+            await replica.client.aclose()
+
+    async def restart(self, replica: Replica, reason: str = "manual"):
+        """
+        Drain (no new requests, wait for in-flight ones), stop, respawn, wait until ready.
+        """
+        replica.draining = True
+        try:
+            async with self.slot_freed:
+                await self.slot_freed.wait_for(lambda: replica.inflight == 0)
+            await self.stop(replica)
+            replica.restarts += 1
+            ROUTER_RESTARTS.labels(replica=replica.name, reason=reason).inc()
+            self.spawn(replica)
+            await self.wait_ready(replica)
+        finally:
+            replica.draining = False
+            await self.notify()
+
+    async def start(self):
+        for replica in self.replicas:
+            self.spawn(replica)
+        await asyncio.gather(*(self.wait_ready(r) for r in self.replicas))
+        self.monitor = asyncio.create_task(self.watch())
+
+    async def shutdown(self):
+        if self.monitor:
+            self.monitor.cancel()
+        await asyncio.gather(*(self.stop(r) for r in self.replicas))
+
+    async def watch(self):
+        """
+        Respawn replicas whose process died (crash, OOM); requests go to the others meanwhile.
+        """
+        while True:
+            await asyncio.sleep(HEALTH_INTERVAL)
+            for replica in self.replicas:
+                if replica.draining or replica.proc is None or replica.proc.poll() is None:
+                    continue
+                print(f"[ROUTER] replica {replica.name} exited with {replica.proc.returncode}, restarting")
+                replica.ready = False
+                asyncio.create_task(self.restart(replica, reason="exited"))
+
+    # --------------------
+    # Routing
+    # --------------------
+
+    async def notify(self):
+        async with self.slot_freed:
+            self.slot_freed.notify_all()
+
+    def pick(self, exclude: Set[int]) -> Optional[Replica]:
+        candidates = [r for r in self.replicas if r.available and r.index not in exclude]
+        if not candidates:
+            return None
+        least = min(r.inflight for r in candidates)
+        tied = [r for r in candidates if r.inflight == least]
+        return tied[next(self.round_robin) % len(tied)]
+
+    async def acquire(self, exclude: Set[int]) -> Replica:
+        """
+        The least-loaded available replica; waits while every replica is at MAX_INFLIGHT.
+        """
+        start = time.perf_counter()
+        async with self.slot_freed:
+            await self.slot_freed.wait_for(lambda: self.pick(exclude) is not None)
+            replica = self.pick(exclude)
+            replica.inflight += 1
+        ROUTER_WAIT.observe(time.perf_counter() - start)
+        ROUTER_INFLIGHT.labels(replica=replica.name).set(replica.inflight)
+        return replica
+
+    async def release(self, replica: Replica):
+        async with self.slot_freed:
+            replica.inflight -= 1
+            self.slot_freed.notify_all()
+        ROUTER_INFLIGHT.labels(replica=replica.name).set(replica.inflight)
+
+    async def forward(self, body: bytes, headers: Dict[str, str], path: str = "/infer") -> httpx.Response:
+        """
+        Send one request (/infer or /infer_regions); retried once on another
+        replica if the connection to the first one fails (e.g. it crashed mid-request).
+        """
+        tried: Set[int] = set()
+        while True:
+            if len(tried) == len(self.replicas):
+                tried.clear()
+            replica = await self.acquire(tried)
+            try:
+                resp = await replica.client.post(path, content=body, headers=headers)
+                replica.served += 1
+                ROUTER_REQUESTS.labels(replica=replica.name, status=str(resp.status_code)).inc()
+                return resp
+            except httpx.TransportError as e:
+                ROUTER_REQUESTS.labels(replica=replica.name, status="unreachable").inc()
+                if replica.proc.poll() is not None:
+                    replica.ready = False  # stop routing here before the monitor notices
+                tried.add(replica.index)
+                if len(tried) > 1:
+                    raise HTTPException(status_code=503, detail=f"replicas unreachable: {e}")
+                print(f"[ROUTER] replica {replica.name} unreachable ({e!r}), retrying elsewhere")
+            finally:
+                await self.release(replica)
+
+    def status(self) -> List[Dict]:
+        return [
+            {
+                "replica": r.index,
+                "device": r.device,
+                "pid": r.proc.pid if r.proc else None,
+                "ready": r.ready,
+                "draining": r.draining,
+                "inflight": r.inflight,
+                "served": r.served,
+                "restarts": r.restarts,
+            }
+            for r in self.replicas
+        ]
+
+
+def create_router(app_path: str, devices: List[str], factory: bool = False) -> FastAPI:
+    pool = ReplicaPool(app_path, devices, factory=factory)
+
+    @asynccontextmanager
+    async def lifespan(_: FastAPI):
+        await pool.start()
+        yield
+        await pool.shutdown()
+
+    router = FastAPI(lifespan=lifespan)
+    router.state.pool = pool
+
+    async def proxy(request: Request) -> Response:
+        headers = {k: v for k, v in request.headers.items() if k.lower() in FORWARD_HEADERS}
+        resp = await pool.forward(await request.body(), headers, request.url.path)
+        return Response(resp.content, status_code=resp.status_code, media_type=resp.headers.get("content-type"))
+
+    @router.post("/infer")
+    async def infer(request: Request):
+        """
+        Same contract as model.dots_ocr_4b /infer; the multipart body is passed through untouched.
+        """
+        return await proxy(request)
+
+    @router.post("/infer_regions")
+    async def infer_regions(request: Request):
+        """
+        Same contract as model.dots_ocr_4b /infer_regions (two-stage OCR), passed through like /infer.
+        """
+        return await proxy(request)
+
+    @router.get("/replicas")
+    async def replicas():
+        return pool.status()
+
+    @router.post("/replicas/{index}/restart")
+    async def restart_replica(index: int):
+        if not 0 <= index < len(pool.replicas):
+            raise HTTPException(status_code=404, detail="no such replica")
+        await pool.restart(pool.replicas[index])
+        return pool.status()[index]
+
+    @router.post("/replicas/restart")
+    async def rolling_restart():
+        """
+        Restart every replica one after the other, so capacity never drops to zero.
+        """
+        for replica in pool.replicas:
+            await pool.restart(replica)
+        return pool.status()
+
+    @router.get("/health")
+    async def health():
+        ready = sum(r.ready for r in pool.replicas)
+        return {"status": "ok" if ready else "starting", "ready": ready, "replicas": len(pool.replicas)}
+
+    @router.get("/metrics")
+    async def metrics():
+        return metrics_response()
+
+    return router
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--devices", default="cuda:0", help="one replica per entry: cuda:N, cpu, or cpu:0-3 (join ranges with +)")
+    parser.add_argument("--cpu-replicas", type=int, help="instead of --devices: this many CPU replicas on consecutive cores")
+    parser.add_argument("--threads-per-replica", type=int, default=1, help="cores (and torch threads) per CPU replica")
+    parser.add_argument("--app", default="model.dots_ocr_4b:ocr_app", help="ASGI app each replica serves")
+    parser.add_argument("--factory", action="store_true", help="--app is a factory function")
+    parser.add_argument("--max-inflight", type=int, default=MAX_INFLIGHT)
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args()
+
+    MAX_INFLIGHT = args.max_inflight
+    if args.cpu_replicas:
+        devices = cpu_devices(args.cpu_replicas, args.threads_per_replica)
+    else:
+        devices = [d.strip() for d in args.devices.split(",") if d.strip()]
+    router = create_router(args.app, devices, factory=args.factory)
+    uvicorn.run(router, host=args.host, port=args.port, log_level="warning")
@@ -0,0 +1,159 @@
+"""
+Shortest-job-first scheduling of generate calls.
+
+Requests differ in cost by more than an order of magnitude: the prompt grows
+with the image's vision tokens (smart_resize geometry) and the output with
+how much text is on it. With one generate at a time, a FIFO queue lets one
+dense page hold up every sparse half behind it. The model server queues
+generate calls by predicted cost instead.
+
+CostModel predicts a request's output tokens as vision tokens x ink density
+x a tokens-per-ink ratio learned from the requests served so far, per prompt
+and density bucket (pages of similar density produce similar amounts of
+text per inked pixel), and converts tokens to seconds at the measured rate.
+
+SJFQueue orders waiting jobs by arrival + weight x predicted seconds. A job
+can only be overtaken by jobs that arrive less than weight x (its cost -
+theirs) after it, so no job waits forever: weight 0 is FIFO, larger weights
+favour short jobs more.
+"""
+import heapq
+import itertools
+import math
+import os
+import threading
+import time
+from bisect import bisect
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+SJF_WEIGHT = float(os.environ.get("OCR_SJF_WEIGHT", "16"))  # 0: FIFO
+DENSITY_BUCKETS = (0.02, 0.05, 0.1, 0.2)  # ink ratio edges of the history buckets
+PRIOR_TOKENS_PER_INK = 3.0                # output tokens per vision token x ink ratio, until measured
+PRIOR_SECONDS_PER_TOKEN = 0.04            # one generated token, until measured
+PREFILL_WEIGHT = 0.02                     # a prompt token costs about this share of a generated one
+HISTORY_DECAY = 0.2                       # weight of the newest observation in the running averages
+
+
+@dataclass
+class Job:
+    """
+    One generate call: a row per image (vision tokens, ink ratio) and its predicted cost.
+    """
+    prompt: str
+    rows: List[Tuple[int, float]]
+    input_tokens: int
+    predicted_tokens: List[float] = field(default_factory=list)
+    predicted_seconds: float = 0.0
+    arrival: float = 0.0
+
+
+def _average(old: Optional[float], new: float) -> float:
+    return new if old is None else old + HISTORY_DECAY * (new - old)
+
+
+class CostModel:
+    """
+    Output tokens and seconds per generate call, learned online.
+    """
+
+    def __init__(self, max_new_tokens: int = 4096):
+        self.max_new_tokens = max_new_tokens
+        self.lock = threading.Lock()
+        self.ratios: Dict[Tuple[str, int], float] = {}
+        self.prompt_ratios: Dict[str, float] = {}
+        self.seconds_per_token = PRIOR_SECONDS_PER_TOKEN
+
+    def ratio(self, prompt: str, ink: float) -> float:
+        key = (prompt, bisect(DENSITY_BUCKETS, ink))
+        return self.ratios.get(key, self.prompt_ratios.get(prompt, PRIOR_TOKENS_PER_INK))
+
+    def predict(self, prompt: str, vision_tokens: int, ink: float) -> float:
+        """
+        Expected output tokens for one image.
+        """
+        with self.lock:
+            ratio = self.ratio(prompt, ink)
+        return min(max(ratio * ink * vision_tokens, 1.0), float(self.max_new_tokens))
+
+    def job(self, prompt: str, rows: List[Tuple[int, float]], input_tokens: int) -> Job:
+        """
+        A job for one generate call; a batch takes as long as its longest row.
+        """
+        predicted = [self.predict(prompt, vision, ink) for vision, ink in rows]
+        units = max(predicted) + PREFILL_WEIGHT * input_tokens
+        return Job(prompt, rows, input_tokens, predicted, units * self.seconds_per_token)
+
+    def observe(self, job: Job, seconds: float, output_tokens: List[int]):
+        """
+        Fold a finished generate call into the history.
+        """
+        with self.lock:
+            for (vision, ink), tokens in zip(job.rows, output_tokens):
+                if tokens >= self.max_new_tokens:  # truncated: says nothing about the page
+                    continue
+                ratio = tokens / max(ink * vision, 1.0)
+                key = (job.prompt, bisect(DENSITY_BUCKETS, ink))
+                self.ratios[key] = _average(self.ratios.get(key), ratio)
+                self.prompt_ratios[job.prompt] = _average(self.prompt_ratios.get(job.prompt), ratio)
+            units = max(output_tokens, default=0) + PREFILL_WEIGHT * job.input_tokens
+            if units >= 1:
+                self.seconds_per_token = _average(self.seconds_per_token, seconds / units)
+
+
+class SJFQueue:
+    """
+    Waiting jobs, cheapest first with aging (see the module docstring).
+    weight=math.inf is plain shortest-job-first, without starvation protection.
+    """
+
+    def __init__(self, weight: float = SJF_WEIGHT):
+        self.weight = weight
+        self.heap: List[Tuple[float, float, int, Job]] = []
+        self.order = itertools.count()
+
+    def key(self, job: Job) -> Tuple[float, float]:
+        if math.isinf(self.weight):
+            return job.predicted_seconds, job.arrival
+        return job.arrival + self.weight * job.predicted_seconds, 0.0
+
+    def push(self, job: Job, now: float):
+        job.arrival = now
+        heapq.heappush(self.heap, (*self.key(job), next(self.order), job))
+
+    def peek(self) -> Optional[Job]:
+        return self.heap[0][-1] if self.heap else None
+
+    def pop(self) -> Job:
+        return heapq.heappop(self.heap)[-1]
+
+    def __len__(self) -> int:
+        return len(self.heap)
+
+
+class Scheduler:
+    """
+    One generate at a time, handed to the waiting job at the head of an SJFQueue.
+    """
+
+    def __init__(self, weight: float = SJF_WEIGHT):
+        self.cond = threading.Condition()
+        self.queue = SJFQueue(weight)
+        self.busy = False
+
+    def acquire(self, job: Job):
+        with self.cond:
+            self.queue.push(job, time.perf_counter())
+            while self.busy or self.queue.peek() is not job:
+                self.cond.wait()
+            self.queue.pop()
+            self.busy = True
+
+    def release(self):
+        with self.cond:
+            self.busy = False
+            self.cond.notify_all()
+
+    def waiting(self) -> int:
+        with self.cond:
+            return len(self.queue)
@@ -0,0 +1,198 @@
+"""
+Speculative decoding for the HF generate paths (model.dots_ocr_4b and
+DotsOCRParser with use_hf).
+
+Layout output is mostly JSON scaffolding ('{"bbox": [', '"category": "Text"')
+and running headers repeated from page to page. Draft tokens are looked up
+by n-gram: the last few generated tokens are matched against the sequence
+so far, a static JSON skeleton and the previous outputs, and the tokens that
+followed the match are proposed. The model verifies a whole draft in one
+forward pass and keeps its own greedy choice at the first mismatch, so the
+output is the same token sequence plain greedy decoding produces (up to
+floating point differences between batched and single-token forwards).
+
+A small draft model sharing the tokenizer can be used instead (draft_model).
+Only torch and transformers are imported here, so the vendored parser can use it.
+"""
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Deque, Optional, Tuple
+
+import torch
+from transformers.generation.candidate_generator import CandidateGenerator
+
+# Tokens proposed per draft and the longest n-gram matched to find them
+PROMPT_LOOKUP_TOKENS = 10
+MAX_NGRAM = 3
+# Previous outputs kept as lookup sources: the other half of this page and
+# the same half of the previous one, where the running headers repeat
+HISTORY = 2
+
+CATEGORIES = (
+    "Caption", "Footnote", "Formula", "List-item", "Page-footer", "Page-header",
+    "Picture", "Section-header", "Table", "Text", "Title",
+)
+# Tokenized as a whole, so the pieces split into tokens the way they do in real output
+JSON_SKELETON = "[" + ", ".join(
+    f'{{"bbox": [{100 + i}, {200 + i}, {1100 + i}, {300 + i}], "category": "{c}", "text": "{c}"}}'
+    for i, c in enumerate(CATEGORIES)
+) + ', {"bbox": [100, 200, 1100, 300], "category": "Picture"}]'
+
+
+@dataclass
+class SpeculativeStats:
+    drafted: int = 0
+    accepted: int = 0
+    generated: int = 0
+    seconds: float = 0.0
+
+    @property
+    def acceptance(self) -> float:
+        return self.accepted / self.drafted if self.drafted else 0.0
+
+    @property
+    def tokens_per_s(self) -> float:
+        return self.generated / self.seconds if self.seconds else 0.0
+
+    def add(self, other: "SpeculativeStats"):
+        self.drafted += other.drafted
+        self.accepted += other.accepted
+        self.generated += other.generated
+        self.seconds += other.seconds
+
+
+def _continuation(source: torch.Tensor, ngram: torch.Tensor, budget: int) -> Optional[torch.Tensor]:
+    """
+    Tokens following the most recent occurrence of ngram in source.
+    """
+    n = ngram.shape[0]
+    if source.shape[0] <= n:
+        return None
+    hits = (source.unfold(0, n, 1) == ngram).all(dim=1).nonzero(as_tuple=True)[0]
+    # a sequence always matches its own tail, which has nothing after it
+    for start in reversed((hits + n).tolist()):
+        if start < source.shape[0]:
+            return source[start:start + budget]
+    return None
+
+
+class SeededPromptLookup(CandidateGenerator):
+    """
+    Prompt-lookup drafting over the running sequence first, then the seed tokens.
+    """
+
+    def __init__(self, seed_ids: torch.Tensor, num_tokens: int, max_ngram: int, max_length: int,
+                 eos_token_ids: Optional[torch.Tensor], stats: SpeculativeStats):
+        self.seed_ids = seed_ids
+        self.num_tokens = num_tokens
+        self.max_ngram = max_ngram
+        self.max_length = max_length
+        self.eos_token_ids = eos_token_ids
+        self.stats = stats
+        self.proposed = 0
+
+    def get_candidates(self, input_ids: torch.LongTensor) -> Tuple[torch.LongTensor, None]:
+        self.proposed = 0
+        length = input_ids.shape[1]
+        budget = min(self.num_tokens, self.max_length - length - 1)
+        if budget <= 0:
+            return input_ids, None
+
+        sequence = input_ids[0]
+        for n in range(min(self.max_ngram, length - 1), 0, -1):
+            ngram = sequence[-n:]
+            for source in (sequence, self.seed_ids):
+                chosen = _continuation(source, ngram, budget)
+                if chosen is None or not chosen.shape[0]:
+                    continue
+                if self.eos_token_ids is not None:
+                    eos = torch.isin(chosen, self.eos_token_ids).nonzero()
+                    if eos.shape[0]:
+                        chosen = chosen[:int(eos[0, 0])]
+                if chosen.shape[0]:
+                    self.proposed = chosen.shape[0]
+                    return torch.cat((input_ids, chosen.unsqueeze(0).to(input_ids.device)), dim=1), None
+        return input_ids, None
+
+    def update_candidate_strategy(self, input_ids: torch.LongTensor, scores: torch.FloatTensor, num_matches: int):
+        self.stats.drafted += self.proposed
+        self.stats.accepted += min(int(num_matches), self.proposed)
+
+
+class _CountedCandidates(CandidateGenerator):
+    """
+    Wraps transformers' own draft-model candidate generator to count drafted and accepted tokens.
+    """
+
+    def __init__(self, inner: CandidateGenerator, stats: SpeculativeStats):
+        self.inner = inner
+        self.stats = stats
+        self.proposed = 0
+
+    def get_candidates(self, input_ids):
+        candidate_ids, candidate_logits = self.inner.get_candidates(input_ids)
+        self.proposed = candidate_ids.shape[1] - input_ids.shape[1]
+        return candidate_ids, candidate_logits
+
+    def update_candidate_strategy(self, input_ids, scores, num_matches):
+        self.stats.drafted += self.proposed
+        self.stats.accepted += min(int(num_matches), self.proposed)
+        return self.inner.update_candidate_strategy(input_ids, scores, num_matches)
+
+    def __getattr__(self, name):
+        return getattr(self.inner, name)
+
+
+class PromptLookupDecoder:
+    """
+    Greedy generate with drafted tokens. One instance per model; calls must be
+    serialized (the model servers already run one generate at a time).
+    """
+
+    def __init__(self, tokenizer, num_tokens: int = PROMPT_LOOKUP_TOKENS, max_ngram: int = MAX_NGRAM,
+                 history: int = HISTORY, draft_model: Any = None):
+        self.num_tokens = num_tokens
+        self.max_ngram = max_ngram
+        self.draft_model = draft_model
+        self.skeleton_ids = tokenizer(JSON_SKELETON, add_special_tokens=False, return_tensors="pt").input_ids[0]
+        self.recent: Deque[torch.Tensor] = deque(maxlen=history)
+        self.total = SpeculativeStats()
+
+    def seed_ids(self) -> torch.Tensor:
+        # most recent output last: _continuation prefers the latest match
+        return torch.cat([self.skeleton_ids, *self.recent])
+
+    def generate(self, model, inputs, **generate_kwargs) -> Tuple[torch.Tensor, SpeculativeStats]:
+        """
+        model.generate(**inputs, **generate_kwargs) with drafting; returns the ids and this call's stats.
+        """
+        stats = SpeculativeStats()
+        seed = self.seed_ids().to(model.device)
+
+        def candidate_generator(*args, **kwargs):
+            if self.draft_model is not None:
+                return _CountedCandidates(type(model)._get_candidate_generator(model, *args, **kwargs), stats)
+            config = kwargs.get("generation_config", args[0] if args else None)
+            return SeededPromptLookup(
+                seed, self.num_tokens, self.max_ngram, config.max_length,
+                getattr(config, "_eos_token_tensor", None), stats,
+            )
+
+        if self.draft_model is not None:
+            drafting = {"assistant_model": self.draft_model}
+        else:
+            drafting = {"prompt_lookup_num_tokens": self.num_tokens}
+        model._get_candidate_generator = candidate_generator  # generate() asks the model for its drafter
+        start = time.perf_counter()
+        try:
+            generated = model.generate(**inputs, **generate_kwargs, **drafting)
+        finally:
+            del model._get_candidate_generator
+        stats.seconds = time.perf_counter() - start
+
+        new_ids = generated[0, inputs["input_ids"].shape[1]:]
+        stats.generated = int(new_ids.shape[0])
+        self.recent.append(new_ids.detach().cpu())
+        self.total.add(stats)
+        return generated, stats
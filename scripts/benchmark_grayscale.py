@@ -0,0 +1,84 @@
+"""
+Compare the RGB, grayscale and bilevel image paths on a sample book.
+
+Reports per mode: render + encode latency, upload bytes, decoded image
+memory and, with --ocr, OCR latency and text agreement against RGB.
+
+    python -m scripts.benchmark_grayscale data/input_pdfs/attacks.pdf --pages 11-20 --ocr
+"""
+import argparse
+import asyncio
+import difflib
+import io
+import time
+
+import httpx
+
+from app.etl_pipeline import ocr_half
+from app.image_utils import COLOR_MODES, MAX_PIXELS, resize_for_model
+from app.pdf_utils import pdf_to_halves
+
+
+def block_text(blocks) -> str:
+    return "\n".join(b.get("text", "") for b in blocks if b.get("category") == "Text")
+
+
+async def bench_mode(pdf_path: str, color_mode: str, from_page: int, to_page: int, dpi: int, ocr: bool):
+    stats = {"render_s": 0.0, "encode_s": 0.0, "ocr_s": 0.0, "bytes": 0, "memory": 0, "halves": 0}
+    texts = []
+
+    async with httpx.AsyncClient(timeout=600.0) as client:
+        t0 = time.perf_counter()
+        for halves in pdf_to_halves(
+            pdf_path, dpi=dpi, from_page=from_page, to_page=to_page,
+            max_pixels=MAX_PIXELS, color_mode=color_mode,
+        ):
+            stats["render_s"] += time.perf_counter() - t0
+            for idx, half in enumerate(halves):
+                t1 = time.perf_counter()
+                buf = io.BytesIO()
+                resize_for_model(half).save(buf, format="PNG")
+                stats["encode_s"] += time.perf_counter() - t1
+                stats["bytes"] += buf.tell()
+                stats["memory"] += len(half.tobytes())
+                stats["halves"] += 1
+
+                if ocr:
+                    t2 = time.perf_counter()
+                    blocks = await ocr_half(client, half, f"{color_mode}_{stats['halves']}")
+                    stats["ocr_s"] += time.perf_counter() - t2
+                    texts.append(block_text(blocks))
+            t0 = time.perf_counter()
+    return stats, texts
+
+
+async def main(pdf_path: str, from_page: int, to_page: int, dpi: int, ocr: bool):
+    results = {}
+    for mode in COLOR_MODES:
+        results[mode] = await bench_mode(pdf_path, mode, from_page, to_page, dpi, ocr)
+
+    base_stats, base_texts = results["rgb"]
+    print(f"{'mode':<8} {'render s':>9} {'encode s':>9} {'upload MB':>10} {'memory MB':>10} {'ocr s':>8} {'agreement':>10}")
+    for mode, (stats, texts) in results.items():
+        agreement = "-"
+        if ocr and texts:
+            ratios = [difflib.SequenceMatcher(None, a, b).ratio() for a, b in zip(base_texts, texts)]
+            agreement = f"{sum(ratios) / len(ratios):.3f}"
+        print(
+            f"{mode:<8} {stats['render_s']:>9.2f} {stats['encode_s']:>9.2f} "
+            f"{stats['bytes'] / 1e6:>10.2f} {stats['memory'] / 1e6:>10.2f} "
+            f"{stats['ocr_s']:>8.1f} {agreement:>10}"
+        )
+    print(f"{base_stats['halves']} halves per mode")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("pdf_path")
+    parser.add_argument("--pages", default="1-5", help="page range, e.g. 11-20")
+    parser.add_argument("--dpi", type=int, default=300)
+    parser.add_argument("--ocr", action="store_true", help="also send every half to the OCR server")
+    args = parser.parse_args()
+
+    first, _, last = args.pages.partition("-")
+    asyncio.run(main(args.pdf_path, int(first), int(last or first), args.dpi, args.ocr))
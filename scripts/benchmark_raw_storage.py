@@ -0,0 +1,132 @@
+"""
+Compare raw OCR block storage layouts: storage footprint and per-page read latency.
+
+  legacy  one uncompressed JSON row per book in ocr_results (parse it all to read a page)
+  json    one uncompressed JSON blob per (book, page, half) in ocr_blocks
+  zlib    ocr_blocks compressed with zlib
+  zstd    ocr_blocks compressed with zstd (the default when zstandard is installed)
+
+Blocks come from a layout JSON (one block list per half, right half first,
+e.g. written by benchmarks.synthetic) or from a synthetic book of --pages pages.
+
+    python -m scripts.benchmark_raw_storage --pages 476
+    python -m scripts.benchmark_raw_storage --layout data/bench/book_layout.json --reads 500
+"""
+import argparse
+import json
+import random
+import sqlite3
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+from app import db
+
+LAYOUTS = ("legacy", "json", "zlib", "zstd")
+BOOK = "data/input_pdfs/bench.pdf"
+
+
+def load_layout(args) -> List[List[Dict[str, Any]]]:
+    if args.layout:
+        return json.loads(args.layout.read_text(encoding="utf-8"))
+    from benchmarks.synthetic import make_book
+
+    with tempfile.TemporaryDirectory() as tmp:
+        layout_path = make_book(Path(tmp) / "bench.pdf", pages=args.pages, entries_per_half=args.entries)
+        return json.loads(layout_path.read_text(encoding="utf-8"))
+
+
+def write_layout(db_path: Path, layout_name: str, halves: List[List[Dict[str, Any]]]) -> float:
+    db.DB_PATH = db_path
+    start = time.perf_counter()
+    if layout_name == "legacy":
+        blocks = [dict(b, page=i // 2 + 1) for i, half in enumerate(halves) for b in half]
+        db.insert_raw_result(BOOK, -1, json.dumps(blocks, ensure_ascii=False))
+    else:
+        conn = db.get_connection()
+        cur = conn.cursor()
+        db.ensure_tables(cur)
+        for i, half in enumerate(halves):
+            page, side = i // 2 + 1, i % 2 + 1
+            blocks = [dict(b, page=page) for b in half]
+            if layout_name == "json":
+                blob = json.dumps(blocks, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+                codec = "json"
+            else:
+                blob, codec = db.encode_blocks(blocks, codec=layout_name), layout_name
+            cur.execute(
+                "INSERT INTO ocr_blocks (pdf_path, page, half, codec, blocks) VALUES (?, ?, ?, ?, ?)",
+                (BOOK, page, side, codec, blob),
+            )
+        conn.commit()
+        conn.close()
+    elapsed = time.perf_counter() - start
+
+    conn = sqlite3.connect(db_path)
+    conn.execute("VACUUM")
+    conn.close()
+    return elapsed
+
+
+def read_page(layout_name: str, page: int) -> List[Dict[str, Any]]:
+    if layout_name == "legacy":
+        blocks = json.loads(db.get_raw_results(BOOK)[-1])
+        return [b for b in blocks if b.get("page") == page]
+    if layout_name == "json":
+        conn = db.get_connection()
+        rows = conn.execute(
+            "SELECT blocks FROM ocr_blocks WHERE pdf_path=? AND page=? ORDER BY half", (BOOK, page)
+        ).fetchall()
+        conn.close()
+        return [b for (blob,) in rows for b in json.loads(blob)]
+    return db.get_page_blocks(BOOK, page)
+
+
+def bench(layout_name: str, halves: List[List[Dict[str, Any]]], reads: int, workdir: Path) -> Dict[str, Any]:
+    db_path = workdir / f"{layout_name}.sqlite"
+    write_s = write_layout(db_path, layout_name, halves)
+    pages = len(halves) // 2
+
+    rng = random.Random(0)
+    latencies = []
+    for _ in range(reads):
+        page = rng.randint(1, pages)
+        t0 = time.perf_counter()
+        blocks = read_page(layout_name, page)
+        latencies.append(time.perf_counter() - t0)
+        assert blocks, f"page {page} came back empty"
+    latencies.sort()
+    return {
+        "layout": layout_name,
+        "size_kb": db_path.stat().st_size / 1024,
+        "write_s": write_s,
+        "read_ms": sum(latencies) / len(latencies) * 1000,
+        "p95_ms": latencies[int(0.95 * (len(latencies) - 1))] * 1000,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--layout", type=Path, help="layout JSON: a list of block lists, one per half")
+    parser.add_argument("--pages", type=int, default=200, help="synthetic book size when no --layout is given")
+    parser.add_argument("--entries", type=int, default=6, help="dated entries per synthetic half")
+    parser.add_argument("--reads", type=int, default=200, help="random page reads per layout")
+    parser.add_argument("--layouts", default=",".join(LAYOUTS))
+    args = parser.parse_args()
+
+    halves = load_layout(args)
+    raw_kb = len(json.dumps(halves, ensure_ascii=False).encode("utf-8")) / 1024
+    print(f"{len(halves) // 2} pages, {sum(map(len, halves))} blocks, {raw_kb:.0f} KB of JSON")
+
+    layouts = args.layouts.split(",")
+    if "zstd" in layouts and db.zstandard is None:
+        print("zstandard is not installed, skipping zstd")
+        layouts.remove("zstd")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        results = [bench(name, halves, args.reads, Path(tmp)) for name in layouts]
+
+    print(f"{'layout':<8} {'DB KB':>9} {'write s':>8} {'page read ms':>13} {'p95 ms':>8}")
+    for r in results:
+        print(f"{r['layout']:<8} {r['size_kb']:>9.0f} {r['write_s']:>8.2f} {r['read_ms']:>13.2f} {r['p95_ms']:>8.2f}")
@@ -0,0 +1,25 @@
+"""
+Report halves whose blocks were reused from a near-duplicate instead of OCR
+(ETL runs with --dedup), per book, with the half they were copied from.
+
+    python -m scripts.duplicates
+    python -m scripts.duplicates data/input_pdfs/attacks.pdf
+"""
+import argparse
+from itertools import groupby
+
+from app.db import get_reused_halves
+from app.etl_pipeline import GPU_SECONDS_PER_HALF
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("pdf_path", nargs="?", help="only this book, as stored in the DB")
+    args = parser.parse_args()
+
+    rows = get_reused_halves(args.pdf_path)
+    for pdf_path, book_rows in groupby(rows, key=lambda r: r["pdf_path"]):
+        book_rows = list(book_rows)
+        print(f"\n=== {pdf_path}: {len(book_rows)} halves reused ===")
+        for r in book_rows:
+            print(f"  page {r['page']:>4} half {r['half']}  <-  {r['source']}")
+    print(f"\n{len(rows)} halves reused, ~{len(rows) * GPU_SECONDS_PER_HALF / 60:.0f} min GPU saved")
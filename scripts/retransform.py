@@ -0,0 +1,26 @@
+"""
+Rebuild events from stored OCR output without running the model.
+
+Use after changing aggregation rules (DATE_PATTERN, is_date_block,
+CATEGORY_REMAP ...). Blocks come from the per-page checkpoints or from
+the DB; only changed events are written, in one transaction.
+
+    python -m scripts.retransform data/input_pdfs/attacks.pdf
+    python -m scripts.retransform --all --workers 8
+"""
+import argparse
+
+from app.retransform import SOURCES, retransform
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("pdf_paths", nargs="*", help="books to rebuild, as stored in the DB (e.g. data/input_pdfs/attacks.pdf)")
+    parser.add_argument("--all", action="store_true", help="rebuild every book in the DB")
+    parser.add_argument("--source", choices=SOURCES, default="auto", help="where to read blocks from (auto: checkpoints, else the DB)")
+    parser.add_argument("--workers", type=int, default=None, help="parallel processes (default: CPU count)")
+    args = parser.parse_args()
+
+    if not args.pdf_paths and not args.all:
+        parser.error("give PDF paths or --all")
+
+    retransform(None if args.all else args.pdf_paths, source=args.source, workers=args.workers)
@@ -1,5 +1,22 @@
+"""
+Run the ETL on one book, or as distributed workers.
+
+    python -m scripts.run_etl                                   # single process, settings below
+    python -m scripts.run_etl --enqueue data/input_pdfs/attacks.pdf --from-page 11 --to-page 476
+    python -m scripts.run_etl --worker --ocr-server http://localhost:8000/infer   # on each GPU host
+    python -m scripts.run_etl --status
+"""
+import argparse
 import asyncio
+import os
+from app import etl_pipeline, worker
+from app.duplicates import DUP_MAX_DISTANCE
+from app.image_utils import (
+    ADAPTIVE_LINE_PX, BLANK_MAX_INK_RATIO, BLANK_MIN_COMPONENTS, PICTURE_MAX_COMPONENTS, PICTURE_MIN_MIDTONE_RATIO,
+)
+from app.db import list_units, queue_status
 from app.etl_pipeline import process_pdf
+from app.metrics import start_pusher, push_metrics
 
 if __name__ == "__main__":
     pdf_path = "data/input_pdfs/attacks.pdf"
@@ -7,4 +24,71 @@ if __name__ == "__main__":
     FROM_PAGE = 11
     TO_PAGE = 476  # or set to an integer, e.g., 20
 
-    asyncio.run(process_pdf(pdf_path, dpi=300, from_page=FROM_PAGE, to_page=TO_PAGE))
\ No newline at end of file
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--enqueue", metavar="PDF", help="queue a book's (page, half) units for workers")
+    parser.add_argument("--from-page", type=int, default=FROM_PAGE)
+    parser.add_argument("--to-page", type=int, default=None)
+    parser.add_argument("--worker", action="store_true", help="claim and process queued units until the queue drains")
+    parser.add_argument("--worker-id", help="default: hostname-pid")
+    parser.add_argument("--forever", action="store_true", help="with --worker, keep polling an empty queue")
+    parser.add_argument("--lease", type=float, default=worker.LEASE_SECONDS, help="lease seconds, must outlive one OCR call")
+    parser.add_argument("--ocr-server", default=etl_pipeline.OCR_SERVER)
+    parser.add_argument("--two-stage", action="store_true", help="layout-only pass, then batched region recognition")
+    parser.add_argument("--memo-heads", action="store_true", help="mask running headers/footers once learned")
+    parser.add_argument("--dedup", type=int, nargs="?", const=DUP_MAX_DISTANCE, metavar="BITS",
+                        help=f"reuse the blocks of near-duplicate halves (max differing hash bits, default {DUP_MAX_DISTANCE})")
+    parser.add_argument("--adaptive", type=int, nargs="?", const=ADAPTIVE_LINE_PX, metavar="LINE_PX",
+                        help=f"per-half resolution keeping text lines LINE_PX high (default {ADAPTIVE_LINE_PX})")
+    parser.add_argument("--blank-max-ink", type=float, help=f"ink ratio below which a half is empty (default {BLANK_MAX_INK_RATIO})")
+    parser.add_argument("--blank-min-components", type=int,
+                        help=f"fewer glyph components than this is empty (default {BLANK_MIN_COMPONENTS})")
+    parser.add_argument("--picture-midtone", type=float,
+                        help=f"midtone ratio from which a half is picture-only (default {PICTURE_MIN_MIDTONE_RATIO})")
+    parser.add_argument("--picture-max-components", type=int,
+                        help=f"picture-only halves have fewer glyph components (default {PICTURE_MAX_COMPONENTS})")
+    parser.add_argument("--status", action="store_true", help="print queue unit counts per status")
+    args = parser.parse_args()
+    etl_pipeline.OCR_SERVER = args.ocr_server
+    blank_thresholds = {
+        key: value for key, value in (
+            ("max_ink_ratio", args.blank_max_ink),
+            ("min_components", args.blank_min_components),
+            ("picture_midtone_ratio", args.picture_midtone),
+            ("picture_max_components", args.picture_max_components),
+        ) if value is not None
+    } or None
+    worker.LEASE_SECONDS = args.lease
+
+    if args.status:
+        print(queue_status())
+        for unit in list_units(status="failed"):
+            print(
+                f"  failed: {unit['pdf_path']} page {unit['page']} half {unit['half']} "
+                f"after {unit['attempts']} attempts: {worker.failure_reason(unit['error'])}"
+            )
+        raise SystemExit
+
+    if args.enqueue:
+        worker.enqueue_pdf(
+            args.enqueue, from_page=args.from_page, to_page=args.to_page,
+            two_stage=args.two_stage, memo_heads=args.memo_heads, dedup_distance=args.dedup,
+            adaptive_line_px=args.adaptive, blank_thresholds=blank_thresholds,
+        )
+        raise SystemExit
+
+    # Optional: push ETL metrics to a Prometheus Pushgateway, e.g. PUSHGATEWAY=localhost:9091
+    gateway = os.environ.get("PUSHGATEWAY")
+    if gateway:
+        start_pusher(gateway, job="arabic_chrono_worker" if args.worker else "arabic_chrono_etl")
+
+    if args.worker:
+        asyncio.run(worker.run_worker(args.worker_id, exit_when_idle=not args.forever))
+    else:
+        asyncio.run(process_pdf(
+            pdf_path, dpi=300, from_page=FROM_PAGE, to_page=TO_PAGE,
+            two_stage=args.two_stage, memo_heads=args.memo_heads, dedup_distance=args.dedup,
+            adaptive_line_px=args.adaptive, blank_thresholds=blank_thresholds,
+        ))
+
+    if gateway:
+        push_metrics(gateway, job="arabic_chrono_worker" if args.worker else "arabic_chrono_etl")
@@ -0,0 +1,120 @@
+"""
+Summarize tracing spans (data/traces.jsonl) per book.
+
+Prints per-span totals and percentiles, then a timeline of the slowest
+(page, half) traces so a five-minute page shows where the time went.
+--chrome writes a Chrome trace (chrome://tracing, ui.perfetto.dev) flame view.
+
+    python -m scripts.trace_report --book attacks --slowest 5
+    python -m scripts.trace_report --chrome data/attacks_trace.json
+"""
+import argparse
+import json
+from collections import defaultdict
+from pathlib import Path
+from typing import Any, Dict, List
+
+BAR_WIDTH = 50
+
+
+def load_spans(path: Path) -> List[Dict[str, Any]]:
+    spans = []
+    with path.open(encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                spans.append(json.loads(line))
+    # server spans carry only the trace id: inherit book/page/half from the client side
+    trace_attrs: Dict[str, Dict[str, Any]] = defaultdict(dict)
+    for s in spans:
+        trace_attrs[s["trace_id"]].update({k: v for k, v in s["attrs"].items() if k in ("book", "page", "half")})
+    for s in spans:
+        s["attrs"] = {**trace_attrs[s["trace_id"]], **s["attrs"]}
+    return spans
+
+
+def percentile(values: List[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def summarize(book: str, spans: List[Dict[str, Any]], slowest: int):
+    by_name: Dict[str, List[float]] = defaultdict(list)
+    for s in spans:
+        by_name[s["name"]].append(s["duration"])
+    wall = max(s["start"] + s["duration"] for s in spans) - min(s["start"] for s in spans)
+
+    print(f"\n=== {book}: {len(spans)} spans over {wall:.1f}s ===")
+    print(f"{'span':<14} {'count':>6} {'total s':>9} {'mean s':>8} {'p95 s':>8} {'max s':>8}")
+    for name, durations in sorted(by_name.items(), key=lambda kv: -sum(kv[1])):
+        print(
+            f"{name:<14} {len(durations):>6} {sum(durations):>9.2f} {sum(durations) / len(durations):>8.3f} "
+            f"{percentile(durations, 0.95):>8.3f} {max(durations):>8.3f}"
+        )
+
+    preprocess = [s for s in spans if s["name"] == "processor" and "hidden" in s["attrs"]]
+    if preprocess:
+        total = sum(s["duration"] for s in preprocess)
+        hidden = sum(min(s["attrs"]["hidden"], s["duration"]) for s in preprocess)
+        print(f"server preprocessing {total:.2f}s, {hidden:.2f}s ({hidden / max(total, 1e-9):.0%}) hidden behind generate")
+
+    halves = sorted((s for s in spans if s["name"] == "half"), key=lambda s: -s["duration"])[:slowest]
+    for root in halves:
+        trace = sorted((s for s in spans if s["trace_id"] == root["trace_id"]), key=lambda s: s["start"])
+        print(f"\n-- page {root['attrs'].get('page')} half {root['attrs'].get('half')}: {root['duration']:.2f}s")
+        print_timeline(trace, root)
+
+
+def print_timeline(trace: List[Dict[str, Any]], root: Dict[str, Any]):
+    children = defaultdict(list)
+    for s in trace:
+        children[s["parent_id"]].append(s)
+    t0, total = root["start"], max(root["duration"], 1e-9)
+
+    def walk(s, depth):
+        offset = int((s["start"] - t0) / total * BAR_WIDTH)
+        width = max(1, int(s["duration"] / total * BAR_WIDTH))
+        bar = " " * max(offset, 0) + "█" * width
+        print(f"  {'  ' * depth}{s['name']:<{16 - 2 * depth}} {s['duration']:>8.3f}s |{bar:<{BAR_WIDTH}}|")
+        for c in children.get(s["span_id"], []):
+            walk(c, depth + 1)
+
+    walk(root, 0)
+
+
+def write_chrome_trace(spans: List[Dict[str, Any]], out: Path):
+    events = [
+        {
+            "name": s["name"],
+            "ph": "X",
+            "ts": s["start"] * 1e6,
+            "dur": s["duration"] * 1e6,
+            "pid": s["attrs"].get("book", "-"),
+            "tid": f"page {s['attrs'].get('page', '-')} half {s['attrs'].get('half', '-')}",
+            "args": s["attrs"],
+        }
+        for s in spans
+    ]
+    out.write_text(json.dumps({"traceEvents": events}, ensure_ascii=False), encoding="utf-8")
+    print(f"Wrote {len(events)} events to {out}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("trace_file", nargs="?", default="data/traces.jsonl", type=Path)
+    parser.add_argument("--book", help="only this book (PDF stem)")
+    parser.add_argument("--slowest", type=int, default=3, help="timelines of the N slowest halves per book")
+    parser.add_argument("--chrome", type=Path, help="also write a Chrome trace JSON")
+    args = parser.parse_args()
+
+    spans = load_spans(args.trace_file)
+    if args.book:
+        spans = [s for s in spans if s["attrs"].get("book") == args.book]
+
+    books: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+    for s in spans:
+        books[s["attrs"].get("book", "-")].append(s)
+    for book, book_spans in books.items():
+        summarize(book, book_spans, args.slowest)
+
+    if args.chrome:
+        write_chrome_trace(spans, args.chrome)